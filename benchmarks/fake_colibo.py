@@ -0,0 +1,241 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from benchmarks.server import JSONHandler, start_server
+
+BODY_TEXT = (
+    "<p>Lorem ipsum <b>dolor</b> sit amet, consectetur&nbsp;adipiscing elit. "
+    '<a href="https://example.com">Sed</a> do eiusmod tempor incididunt.</p>'
+    "<ul><li>Ut labore</li><li>Et dolore</li></ul>"
+    "<table><tr><td>Magna</td><td>Aliqua</td></tr></table>"
+)
+
+
+class DocumentTree:
+    """A synthetic Colibo document tree."""
+
+    def __init__(
+        self,
+        size=1000,
+        depth=4,
+        link_density=0.05,
+        body_size=4000,
+        folder_ratio=0.2,
+        seed=1,
+    ):
+        """
+        Generate the tree.
+
+        Args:
+            size (int): Number of documents, including the root
+            depth (int): Maximum depth of a document below the root
+            link_density (float): Share of the documents that are links to a page
+            body_size (int): Approximate size of the HTML body of a page in bytes
+            folder_ratio (float): Share of the documents that are folders
+            seed (int): Seed of the random generator, the same seed gives the same tree
+        """
+        self.random = random.Random(seed)
+        self.body_size = body_size
+        self.root_id = 1000
+        self.documents = {}
+        self.children = {}
+        self.depths = {}
+        self._lock = threading.Lock()
+
+        self._add(self.root_id, "Folder", None)
+        folders = [self.root_id]
+        for doc_id in range(self.root_id + 1, self.root_id + size):
+            # Only folders above the maximum depth can get children
+            parent_id = self.random.choice(folders)
+            child_depth = self.depths[parent_id] + 1
+
+            roll = self.random.random()
+            if roll < folder_ratio and child_depth < depth:
+                doctype = "Folder"
+                folders.append(doc_id)
+            elif roll < folder_ratio + link_density:
+                doctype = "Link"
+            else:
+                doctype = "Page"
+            self._add(doc_id, doctype, parent_id)
+
+        # Links point to pages anywhere in the tree
+        pages = self.page_ids()
+        for document in self.documents.values():
+            if document["type"]["name"] == "Link" and pages:
+                document["target_id"] = self.random.choice(pages)
+
+    def _add(self, doc_id, doctype, parent_id):
+        body = None
+        if doctype == "Page":
+            body = BODY_TEXT * max(1, self.body_size // len(BODY_TEXT))
+
+        self.documents[doc_id] = {
+            "id": doc_id,
+            "type": {"name": doctype},
+            "childCount": 0,
+            "created": "2024-01-01T00:00:00Z",
+            "updated": "2024-01-01T00:00:00Z",
+            "revisioning": None,
+            "fields": {
+                "title": f"Document {doc_id}",
+                "description": f"Description of document {doc_id}",
+                "body": body,
+                "keywords": "benchmark, synthetic",
+            },
+        }
+        self.children[doc_id] = []
+        self.depths[doc_id] = 0
+        if parent_id is not None:
+            self.children[parent_id].append(doc_id)
+            self.documents[parent_id]["childCount"] += 1
+            self.depths[doc_id] = self.depths[parent_id] + 1
+
+    def page_ids(self):
+        """Get the IDs of all pages."""
+        return [
+            doc_id
+            for doc_id, document in self.documents.items()
+            if document["type"]["name"] == "Page"
+        ]
+
+    def change(self, percent):
+        """
+        Edit a share of the pages, as if they were changed in Colibo.
+
+        The updated timestamp of the page and of its parent folder is bumped.
+
+        Returns:
+            The IDs of the changed pages
+        """
+        pages = self.page_ids()
+        count = round(len(pages) * percent / 100)
+        changed = self.random.sample(pages, count)
+
+        # Colibo timestamps have a precision of a second
+        updated = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        parents = {
+            child_id: parent_id
+            for parent_id, child_ids in self.children.items()
+            for child_id in child_ids
+        }
+        with self._lock:
+            for doc_id in changed:
+                document = self.documents[doc_id]
+                document["updated"] = updated
+                document["fields"]["body"] += f"<p>Edited at {updated}</p>"
+                self.documents[parents[doc_id]]["updated"] = updated
+        return changed
+
+
+class ColiboState:
+    """The tree served by the fake Colibo, and what the benchmark measures."""
+
+    def __init__(self, tree, latency=0.0, etags=False):
+        self.tree = tree
+        self.latency = latency
+        self.etags = etags
+        self.base_url = None
+        self.requests = 0
+        self.bytes_sent = 0
+        # Document ID -> time.monotonic() the document was first served
+        self.first_served = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget the measurements of the last run."""
+        with self._lock:
+            self.requests = 0
+            self.bytes_sent = 0
+            self.first_served = {}
+
+    def served(self, doc_ids, size):
+        """Record a response."""
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += size
+            for doc_id in doc_ids:
+                self.first_served.setdefault(doc_id, now)
+
+
+class ColiboHandler(JSONHandler):
+    """The parts of the Colibo API used by colibo/client.py."""
+
+    def _render(self, document):
+        """Build the API representation of a document."""
+        document = dict(document)
+        target_id = document.pop("target_id", None)
+        if target_id is not None:
+            fields = dict(document["fields"])
+            fields["url"] = f"{self.server.state.base_url}/documents/{target_id}"
+            document["fields"] = fields
+        return document
+
+    def do_POST(self):
+        # Token endpoint
+        self.read_body()
+        self.send_json(200, {"access_token": "benchmark", "expires_in": 3600})
+
+    def do_GET(self):
+        state = self.server.state
+        time.sleep(state.latency)
+
+        match = re.fullmatch(r"/api/documents/(\d+)(/children)?", self.path)
+        doc_id = int(match.group(1)) if match else None
+        if doc_id not in state.tree.documents:
+            self.send_json(404, {"message": "Not found"})
+            return
+
+        with state.tree._lock:
+            if match.group(2):
+                doc_ids = state.tree.children[doc_id]
+            else:
+                doc_ids = [doc_id]
+            data = [self._render(state.tree.documents[i]) for i in doc_ids]
+        if not match.group(2):
+            data = data[0]
+
+        body = json.dumps(data).encode("utf-8")
+        headers = {}
+        if state.etags:
+            etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                state.served(doc_ids, 0)
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+        state.served(doc_ids, len(body))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_colibo(tree, latency=0.0, etags=False):
+    """
+    Start a fake Colibo serving a document tree.
+
+    Args:
+        tree (DocumentTree): The documents to serve
+        latency (float): Seconds added to every request
+        etags (bool): Send ETags and answer If-None-Match with 304
+
+    Returns:
+        Tuple of the server and its base URL
+    """
+    state = ColiboState(tree, latency=latency, etags=etags)
+    server, base_url = start_server(ColiboHandler, state)
+    state.base_url = base_url
+    return server, base_url
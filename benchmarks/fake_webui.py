@@ -0,0 +1,185 @@
+import re
+import threading
+import time
+import uuid
+
+from benchmarks.server import JSONHandler, start_server
+
+
+class WebUIState:
+    """The files and knowledge bases of the fake Open-WebUI, and what the benchmark measures."""
+
+    def __init__(self, latency=0.0, processing_time=0.0):
+        self.latency = latency
+        self.processing_time = processing_time
+        # File ID -> Colibo document ID
+        self.files = {}
+        # File ID -> time.monotonic() processing in the background is done
+        self.processing = {}
+        # Knowledge base ID -> set of file IDs
+        self.knowledge = {}
+        self.requests = 0
+        self.bytes_received = 0
+        self.uploads = 0
+        self.updates = 0
+        self.removals = 0
+        # Colibo document ID -> time.monotonic() the document was synced
+        self.completed = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget the measurements of the last run, but keep the files."""
+        with self._lock:
+            self.requests = 0
+            self.bytes_received = 0
+            self.uploads = 0
+            self.updates = 0
+            self.removals = 0
+            self.completed = {}
+
+    def complete(self, file_id):
+        """Record that the document of a file has been synced."""
+        with self._lock:
+            doc_id = self.files.get(file_id)
+            if doc_id is not None:
+                self.completed[doc_id] = time.monotonic()
+
+
+class WebUIHandler(JSONHandler):
+    """The file and knowledge endpoints used by openwebui/client.py."""
+
+    def _start(self):
+        state = self.server.state
+        body = self.read_body()
+        with state._lock:
+            state.requests += 1
+            state.bytes_received += len(body)
+        time.sleep(state.latency)
+        return body
+
+    def do_GET(self):
+        state = self.server.state
+        self._start()
+
+        match = re.fullmatch(r"/api/v1/files/([^/]+)/process/status", self.path)
+        if match:
+            file_id = match.group(1)
+            with state._lock:
+                if file_id not in state.files:
+                    self.send_json(404, {"detail": "Not found"})
+                    return
+                ready_at = state.processing.get(file_id, 0)
+            status = "completed" if time.monotonic() >= ready_at else "pending"
+            self.send_json(200, {"status": status})
+            return
+
+        match = re.fullmatch(r"/api/v1/knowledge/([^/]+)", self.path)
+        if match:
+            knowledge_id = match.group(1)
+            with state._lock:
+                file_ids = sorted(state.knowledge.get(knowledge_id, ()))
+            self.send_json(
+                200,
+                {
+                    "id": knowledge_id,
+                    "name": "Benchmark",
+                    "description": "Fake knowledge base",
+                    "files": [{"id": file_id} for file_id in file_ids],
+                },
+            )
+            return
+
+        self.send_json(404, {"detail": "Not found"})
+
+    def do_POST(self):
+        state = self.server.state
+        body = self._start()
+        path = self.path.split("?")[0]
+
+        if path == "/api/v1/files/":
+            # The Colibo ID is part of the document URL in the metadata
+            match = re.search(rb"/documents/(\d+)", body)
+            file_id = str(uuid.uuid4())
+            with state._lock:
+                state.uploads += 1
+                state.files[file_id] = int(match.group(1)) if match else None
+            if "process_in_background=true" in self.path:
+                with state._lock:
+                    state.processing[file_id] = time.monotonic() + state.processing_time
+            else:
+                time.sleep(state.processing_time)
+            self.send_json(200, {"id": file_id})
+            return
+
+        match = re.fullmatch(r"/api/v1/files/([^/]+)/data/content/update", path)
+        if match:
+            file_id = match.group(1)
+            # Updates are always processed before the response
+            time.sleep(state.processing_time)
+            with state._lock:
+                state.updates += 1
+            state.complete(file_id)
+            self.send_json(200, {"id": file_id})
+            return
+
+        match = re.fullmatch(
+            r"/api/v1/knowledge/([^/]+)/(file/add|file/remove|reset)", path
+        )
+        if match:
+            knowledge_id, action = match.groups()
+            file_id = None
+            if action != "reset":
+                match = re.search(rb'"file_id":\s*"([^"]+)"', body)
+                file_id = match.group(1).decode() if match else None
+
+            with state._lock:
+                files = state.knowledge.setdefault(knowledge_id, set())
+                if action == "file/add":
+                    files.add(file_id)
+                elif action == "file/remove":
+                    if file_id not in files:
+                        self.send_json(404, {"detail": "Not found"})
+                        return
+                    files.discard(file_id)
+                    state.files.pop(file_id, None)
+                    state.removals += 1
+                else:
+                    state.removals += len(files)
+                    files.clear()
+
+            if action == "file/add":
+                state.complete(file_id)
+            self.send_json(200, {"id": knowledge_id})
+            return
+
+        self.send_json(404, {"detail": "Not found"})
+
+    def do_DELETE(self):
+        state = self.server.state
+        self._start()
+
+        match = re.fullmatch(r"/api/v1/files/([^/]+)", self.path)
+        with state._lock:
+            if not match or state.files.pop(match.group(1), None) is None:
+                self.send_json(404, {"detail": "Not found"})
+                return
+            for files in state.knowledge.values():
+                files.discard(match.group(1))
+        self.send_json(200, {"status": True})
+
+
+def start_webui(latency=0.0, processing_time=0.0):
+    """
+    Start a fake Open-WebUI.
+
+    Args:
+        latency (float): Seconds added to every request
+        processing_time (float): Seconds it takes to process (extract and embed)
+            an uploaded or updated file
+
+    Returns:
+        Tuple of the server and its base URL
+    """
+    return start_server(
+        WebUIHandler, WebUIState(latency=latency, processing_time=processing_time)
+    )
@@ -0,0 +1,230 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+from benchmarks.fake_colibo import DocumentTree, start_colibo
+from benchmarks.fake_webui import start_webui
+from pipeline.trace import percentile
+
+MAIN = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py"
+)
+KNOWLEDGE_ID = "benchmark"
+
+
+def run_sync(env, root_doc_id, sync_args, log_path):
+    """
+    Run main.py sync in a child process.
+
+    Returns:
+        Tuple of the exit code, the duration in seconds and the peak RSS of
+        the process in bytes
+    """
+    with open(log_path, "w") as log:
+        started = time.monotonic()
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                MAIN,
+                "sync",
+                "--quiet",
+                "--root-doc-id",
+                str(root_doc_id),
+                "--knowledge-id",
+                KNOWLEDGE_ID,
+                *sync_args,
+            ],
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        # wait4 gives the resource usage of this child only
+        _, status, usage = os.wait4(process.pid, 0)
+        duration = time.monotonic() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return process.returncode, duration, peak_rss
+
+
+def measure(name, colibo, webui, duration, peak_rss):
+    """Collect the results of a run from the fake servers."""
+    # Time from Colibo serving a document to Open-WebUI having it synced
+    latencies = sorted(
+        completed - colibo.first_served[doc_id]
+        for doc_id, completed in webui.completed.items()
+        if doc_id in colibo.first_served
+    )
+    crawled = len(colibo.first_served)
+    return {
+        "name": name,
+        "duration": duration,
+        "crawled": crawled,
+        "synced": len(webui.completed),
+        "docs_per_second": crawled / duration if duration else 0.0,
+        # No latencies when nothing was synced, shown as "-"
+        "p50": percentile(latencies, 50) if latencies else None,
+        "p99": percentile(latencies, 99) if latencies else None,
+        "peak_rss": peak_rss,
+        "colibo_requests": colibo.requests,
+        "webui_requests": webui.requests,
+    }
+
+
+def echo_results(results):
+    """Display the results of all runs."""
+
+    def ms(seconds):
+        return f"{seconds * 1000:.0f}ms" if seconds is not None else "-"
+
+    click.echo("")
+    click.echo(
+        f"{'Run':<14} {'Time':>8} {'Crawled':>8} {'Synced':>7} {'Docs/s':>8} "
+        f"{'p50':>8} {'p99':>8} {'Peak RSS':>9} {'Colibo':>7} {'WebUI':>7}"
+    )
+    for result in results:
+        click.echo(
+            f"{result['name']:<14} {result['duration']:>7.2f}s {result['crawled']:>8} "
+            f"{result['synced']:>7} {result['docs_per_second']:>8.1f} "
+            f"{ms(result['p50']):>8} {ms(result['p99']):>8} "
+            f"{result['peak_rss'] / 1024 / 1024:>6.0f}MiB "
+            f"{result['colibo_requests']:>7} {result['webui_requests']:>7}"
+        )
+
+
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.option(
+    "--size",
+    default=1000,
+    type=click.IntRange(min=1),
+    help="Number of documents in the tree.",
+)
+@click.option(
+    "--depth", default=4, type=click.IntRange(min=1), help="Maximum depth of the tree."
+)
+@click.option(
+    "--link-density",
+    default=0.05,
+    type=click.FloatRange(min=0, max=1),
+    help="Share of the documents that are links to pages.",
+)
+@click.option(
+    "--body-size",
+    default=4000,
+    type=click.IntRange(min=0),
+    help="Size of a page body in bytes.",
+)
+@click.option("--seed", default=1, help="Seed of the generated tree.")
+@click.option(
+    "--colibo-latency",
+    default=0.005,
+    type=click.FloatRange(min=0),
+    help="Seconds added to every Colibo request.",
+)
+@click.option(
+    "--webui-latency",
+    default=0.01,
+    type=click.FloatRange(min=0),
+    help="Seconds added to every Open-WebUI request.",
+)
+@click.option(
+    "--processing-time",
+    default=0.05,
+    type=click.FloatRange(min=0),
+    help="Seconds Open-WebUI takes to process an uploaded file.",
+)
+@click.option("--etags", is_flag=True, help="Let the fake Colibo send ETags.")
+@click.option(
+    "--incremental-runs",
+    default=1,
+    type=click.IntRange(min=0),
+    help="Number of syncs after the full one.",
+)
+@click.option(
+    "--change-percent",
+    default=5.0,
+    type=click.FloatRange(min=0, max=100),
+    help="Percentage of the pages changed before each incremental sync.",
+)
+@click.argument("sync_args", nargs=-1, type=click.UNPROCESSED)
+def benchmark(
+    size,
+    depth,
+    link_density,
+    body_size,
+    seed,
+    colibo_latency,
+    webui_latency,
+    processing_time,
+    etags,
+    incremental_runs,
+    change_percent,
+    sync_args,
+):
+    """
+    Benchmark main.py sync against local fake Colibo and Open-WebUI servers.
+
+    Runs a full sync into an empty database, then incremental syncs after
+    changing some of the pages. Options after -- are passed to sync, e.g.
+    -- --upload-workers 4.
+    """
+    tree = DocumentTree(
+        size=size,
+        depth=depth,
+        link_density=link_density,
+        body_size=body_size,
+        seed=seed,
+    )
+    colibo_server, colibo_url = start_colibo(tree, latency=colibo_latency, etags=etags)
+    webui_server, webui_url = start_webui(
+        latency=webui_latency, processing_time=processing_time
+    )
+    colibo = colibo_server.state
+    webui = webui_server.state
+
+    with tempfile.TemporaryDirectory(prefix="colibo-benchmark-") as directory:
+        env = {
+            **os.environ,
+            "COLIBO_BASE_URL": colibo_url,
+            "COLIBO_CLIENT_ID": "benchmark",
+            "COLIBO_CLIENT_SECRET": "benchmark",
+            "COLIBO_SCOPE": "benchmark",
+            "WEBUI_BASE_URL": webui_url,
+            "WEBUI_TOKEN": "benchmark",
+            "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'sync.db')}",
+        }
+
+        results = []
+        for run in range(incremental_runs + 1):
+            name = "full" if run == 0 else f"incremental {run}"
+            if run:
+                tree.change(change_percent)
+            colibo.reset()
+            webui.reset()
+
+            click.echo(f"Running {name} sync...")
+            log_path = os.path.join(directory, f"run-{run}.log")
+            returncode, duration, peak_rss = run_sync(
+                env, tree.root_id, sync_args, log_path
+            )
+            if returncode != 0:
+                with open(log_path) as log:
+                    click.echo(log.read(), err=True)
+                raise click.ClickException(
+                    f"The {name} sync failed with exit code {returncode}"
+                )
+
+            results.append(measure(name, colibo, webui, duration, peak_rss))
+
+    colibo_server.shutdown()
+    webui_server.shutdown()
+    echo_results(results)
+
+
+if __name__ == "__main__":
+    benchmark()
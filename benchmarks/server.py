@@ -0,0 +1,54 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    """Request handler answering with JSON, used by the fake servers."""
+
+    def log_message(self, format, *args):
+        # Keep the benchmark output clean
+        pass
+
+    def read_body(self):
+        """Read the request body."""
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def send_json(self, status_code, data, headers=None):
+        """Send a JSON response."""
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Server(ThreadingHTTPServer):
+    """HTTP server with a thread per request."""
+
+    daemon_threads = True
+    # Every request opens a connection (HTTP/1.0), the default backlog of 5
+    # resets connections when many clients connect at once
+    request_queue_size = 128
+
+
+def start_server(handler_class, state):
+    """
+    Serve requests on a free local port in a background thread.
+
+    Args:
+        handler_class: The request handler class
+        state: Object shared by all requests, available as self.server.state
+
+    Returns:
+        Tuple of the server and its base URL
+    """
+    server = Server(("127.0.0.1", 0), handler_class)
+    server.state = state
+    threading.Thread(
+        target=server.serve_forever, name=handler_class.__name__, daemon=True
+    ).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
@@ -0,0 +1,313 @@
+import asyncio
+
+import httpx
+
+from colibo.client import BaseClient
+from colibo.crawler import Crawler
+from colibo.rate_limit import (
+    RETRY_STATUS_CODES,
+    THROTTLE_STATUS_CODES,
+    AsyncAdaptiveLimiter,
+    backoff,
+    retry_after,
+)
+
+
+class AsyncClient(BaseClient):
+    """Asyncio version of the Colibo client built on httpx."""
+
+    def __init__(
+        self,
+        base_url,
+        client_id,
+        client_secret,
+        scope,
+        pool_size=20,
+        markdown_cache=None,
+        http_cache=None,
+        document_tree=None,
+        max_retries=5,
+    ):
+        """
+        Initialize the client.
+
+        Args:
+            base_url (str): Base URL of the Colibo installation
+            client_id (str): OAuth2 client ID
+            client_secret (str): OAuth2 client secret
+            scope (str): OAuth2 scope
+            pool_size (int): Size of the shared connection pool
+            markdown_cache: Optional db.markdown_cache.MarkdownCacheManager
+            http_cache: Optional db.http_cache.HttpCacheManager, makes requests
+                conditional
+            document_tree: Optional db.document_tree.DocumentTreeManager, records
+                the tree and prunes unchanged folders
+            max_retries (int): Number of retries when Colibo is overloaded or unreachable
+        """
+        super().__init__(
+            base_url,
+            client_id,
+            client_secret,
+            scope,
+            markdown_cache,
+            http_cache,
+            document_tree,
+        )
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+            ),
+            timeout=httpx.Timeout(60.0),
+        )
+        self._token_lock = asyncio.Lock()
+
+        # Back off when Colibo is overloaded, and speed up again when it is not
+        self.limiter = AsyncAdaptiveLimiter(pool_size)
+        self.max_retries = max_retries
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """Close the connection pool."""
+        await self.http.aclose()
+
+    async def _get_token(self):
+        """Get a valid access token, renewing if necessary."""
+        token = self.token_manager.current_token()
+        if token is None:
+            # Only one task refreshes the token, the others wait for the result.
+            async with self._token_lock:
+                loop = asyncio.get_running_loop()
+
+                def fetch():
+                    # Called in the worker thread, the request runs on the event loop
+                    return asyncio.run_coroutine_threadsafe(
+                        self._request_token(), loop
+                    ).result()
+
+                # The manager may wait for another process, so keep it off the event loop
+                token = await asyncio.to_thread(self.token_manager.get_token, fetch)
+
+        self.access_token = token
+        return token
+
+    async def _send(self, method, path, **kwargs):
+        """Send a request through the rate limiter, see Client._send()."""
+        attempt = 0
+        while True:
+            ticket = await self.limiter.acquire()
+            delay = None
+            try:
+                response = await self.http.request(method, path, **kwargs)
+            except httpx.TransportError:
+                # No answer, most likely an overloaded Colibo
+                self.limiter.release(ticket, throttled=True)
+                if attempt >= self.max_retries:
+                    raise
+            except BaseException:
+                self.limiter.release(ticket, failed=True)
+                raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    self.limiter.release(ticket)
+                    return response
+
+                delay = retry_after(response.headers.get("Retry-After"))
+                throttled = response.status_code in THROTTLE_STATUS_CODES
+                self.limiter.release(
+                    ticket, throttled=throttled, delay=delay, failed=not throttled
+                )
+                if attempt >= self.max_retries:
+                    return response
+
+            self.limiter.retried()
+            await asyncio.sleep(backoff(attempt, delay))
+            attempt += 1
+
+    async def _request_token(self):
+        """Fetch a new token from the API."""
+        response = await self._send(
+            "POST", "/auth/oauth2/connect/token", data=self._token_request_data()
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def _get(self, path, headers=None):
+        """Make an authenticated GET request, renewing the token once if it is rejected."""
+        token = await self._get_token()
+        response = await self._send(
+            "GET", path, headers={**self._auth_headers(token), **(headers or {})}
+        )
+        if response.status_code == 401:
+            # The token was revoked or expired early, retry once with a new one.
+            # The manager may be busy refreshing, so do not block the event loop.
+            await asyncio.to_thread(self.token_manager.invalidate, token)
+            response = await self._send(
+                "GET",
+                path,
+                headers={
+                    **self._auth_headers(await self._get_token()),
+                    **(headers or {}),
+                },
+            )
+        return response
+
+    async def _get_json(self, path):
+        """Make an authenticated GET request and return the decoded JSON."""
+        if self.http_cache is None:
+            response = await self._get(path)
+            response.raise_for_status()
+            return response.json()
+
+        # The cache is keyed by the full URL, like the synchronous client
+        url = f"{self.base_url}{path}"
+        response = await self._get(path, self.http_cache.conditional_headers(url))
+        if response.status_code == 304:
+            data = self.http_cache.not_modified(url)
+            if data is not None:
+                return data
+            # The entry has been evicted in the meantime
+            response = await self._get(path)
+
+        # Check if the response is successful
+        response.raise_for_status()
+
+        data = response.json()
+        self.http_cache.store(url, response.headers, response.text, data)
+        return data
+
+    async def get_document(self, document_id):
+        """Get a single document by ID."""
+        return self._build_document(await self._fetch_document(document_id))
+
+    async def _fetch_document(self, document_id):
+        """Fetch the raw document API response of a document."""
+        return await self._get_json(f"/api/documents/{document_id}")
+
+    async def _fetch_children(self, document_id):
+        """Fetch the raw list of direct children of a document."""
+        return await self._get_json(f"/api/documents/{document_id}/children")
+
+    async def get_children(
+        self, document_id, max_depth=10, current_depth=0, visited_ids=None
+    ):
+        """
+        Get all children of a document by ID recursively up to a specified maximum depth.
+
+        Sibling folders and linked documents are fetched concurrently, limited by
+        the size of the connection pool, and documents are yielded in the order
+        they are fetched.
+
+        Args:
+            document_id: The ID of the document to get children for
+            max_depth: Maximum depth of recursion (default: 10)
+            current_depth: Depth of the document in the tree
+            visited_ids: Set of already visited document IDs to prevent circular references
+
+        Returns:
+            Async generator yielding document information with all descendants up to max_depth
+        """
+        if visited_ids is None:
+            visited_ids = set()
+        visited_ids.update([Crawler._key(visited_id) for visited_id in visited_ids])
+
+        pending = {}
+        linked_ids = set()
+        # Stored child folder of an unchanged folder being checked -> the folder
+        check_parents = {}
+
+        def list_children(parent_id, depth, force=False):
+            key = Crawler._key(parent_id)
+            if depth >= max_depth or (key in visited_ids and not force):
+                return
+            visited_ids.add(key)
+            task = asyncio.create_task(self._fetch_children(parent_id))
+            pending[task] = ("children", parent_id, depth)
+
+        def check_folders(folder_id, depth):
+            # The stored child folders and linked documents of an unchanged
+            # folder at the given depth, its timestamp does not cover them
+            if depth >= max_depth:
+                return
+            for linked_doc_id in self.document_tree.linked_children(folder_id):
+                key = Crawler._key(linked_doc_id)
+                if key not in visited_ids and key not in linked_ids:
+                    linked_ids.add(key)
+                    fetch_linked(linked_doc_id, depth)
+            for child_id in self.document_tree.child_folders(folder_id):
+                key = Crawler._key(child_id)
+                if key in visited_ids or key in check_parents:
+                    continue
+                check_parents[key] = folder_id
+                task = asyncio.create_task(self._fetch_document(child_id))
+                pending[task] = ("check", child_id, depth + 1)
+
+        def fetch_linked(linked_doc_id, depth):
+            task = asyncio.create_task(self.get_document(linked_doc_id))
+            pending[task] = ("document", linked_doc_id, depth)
+
+        try:
+            # The caller usually marks the start document as visited already.
+            list_children(document_id, current_depth, force=True)
+
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    kind, parent_id, depth = pending.pop(task)
+                    result = task.result()
+
+                    if kind == "check":
+                        if self._check_folder(
+                            check_parents[Crawler._key(parent_id)], result
+                        ):
+                            yield self._build_document(result)
+                            list_children(parent_id, depth)
+                        else:
+                            visited_ids.add(Crawler._key(parent_id))
+                            check_folders(parent_id, depth)
+                        continue
+
+                    if kind == "document":
+                        yield result
+                        if result["childCount"]:
+                            list_children(parent_id, depth + 1)
+                        continue
+
+                    self._record_listing(parent_id, result)
+                    for item in result:
+                        doctype = item.get("type", {}).get("name").lower()
+                        match doctype:
+                            case "link":
+                                url = item.get("fields", {}).get("url")
+                                linked_doc_id = (
+                                    self._extract_id_from_url(url) if url else None
+                                )
+                                key = Crawler._key(linked_doc_id)
+                                if (
+                                    linked_doc_id
+                                    and key not in visited_ids
+                                    and key not in linked_ids
+                                ):
+                                    linked_ids.add(key)
+                                    fetch_linked(linked_doc_id, depth)
+
+                                # We do not yield the link page.
+                                continue
+                            case "folder":
+                                if self._list_folder(item):
+                                    list_children(item.get("id"), depth + 1)
+                                else:
+                                    check_folders(item.get("id"), depth + 1)
+
+                        yield self._build_child(item, doctype)
+        finally:
+            for task in pending:
+                task.cancel()
@@ -1,57 +1,69 @@
 from datetime import datetime
-from markdownify import markdownify
 
 import requests
+from requests.adapters import HTTPAdapter
 import urllib.parse
 import re
+import time
 from datetime import datetime, timedelta
 
+from colibo.converter import html_clean_up, html_to_markdown
+from colibo.crawler import Crawler
+from colibo.document import Document
+from colibo.rate_limit import (
+    RETRY_STATUS_CODES,
+    THROTTLE_STATUS_CODES,
+    AdaptiveLimiter,
+    backoff,
+    retry_after,
+)
 from db.token_manager import TokenManager
 
 
-class Client:
-    def __init__(self, base_url, client_id, client_secret, scope):
+class BaseClient:
+    """Transport independent parts of the Colibo clients."""
+
+    def __init__(
+        self,
+        base_url,
+        client_id,
+        client_secret,
+        scope,
+        markdown_cache=None,
+        http_cache=None,
+        document_tree=None,
+        metrics=None,
+    ):
         self.base_url = base_url
         self.client_id = client_id
         self.client_secret = client_secret
         self.scope = scope
         self.access_token = None
         self.token_manager = TokenManager("colibo")
-
-    def _get_token(self):
-        """Get a valid access token, renewing if necessary."""
-        # Try to get from the cache first
-        cached_token = self.token_manager.get_valid_token()
-        if cached_token:
-            self.access_token = cached_token
-            return cached_token
-
-        # If not in cache or expired, get a new one
-        return self._refresh_token()
-
-    def _refresh_token(self):
-        """Fetch a new token from the API."""
-        data = {
+        # Optional db.markdown_cache.MarkdownCacheManager
+        self.markdown_cache = markdown_cache
+        # Optional db.http_cache.HttpCacheManager
+        self.http_cache = http_cache
+        # Optional db.document_tree.DocumentTreeManager
+        self.document_tree = document_tree
+        # Optional metrics.Metrics
+        self.metrics = metrics
+
+    def _token_request_data(self):
+        """Build the form data used to fetch a new token."""
+        return {
             "grant_type": "client_credentials",
             "client_id": self.client_id,
             "client_secret": self.client_secret,
             "scope": self.scope,
         }
-        response = requests.post(
-            f"{self.base_url}/auth/oauth2/connect/token", data=data
-        )
-        response.raise_for_status()
-        token_data = response.json()
 
-        # Store the token and calculate expiry time
-        self.access_token = token_data["access_token"]
-        # Convert expires_in (seconds) to a datetime
-        expires_in = token_data.get("expires_in", 3600)
-
-        # Cache the token
-        self.token_manager.cache_token(self.access_token, expires_in)
-
-        return self.access_token
+    def _auth_headers(self, token):
+        """Build the headers of an authenticated API request."""
+        return {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        }
 
     def _extract_id_from_url(self, url):
         """
@@ -86,78 +98,169 @@ class Client:
 
         return None
 
-    def _html_clean_up(self, html_content):
-        if html_content is None:
-            return None
+    def _record_listing(self, document_id, items):
+        """Store the children of a document in the document tree."""
+        if self.document_tree is None:
+            return
+
+        child_ids = []
+        for item in items:
+            doctype = item.get("type", {}).get("name").lower()
+            if doctype == "link":
+                # The tree points to the linked document instead of the link
+                url = item.get("fields", {}).get("url")
+                linked_doc_id = self._extract_id_from_url(url) if url else None
+                if linked_doc_id:
+                    child_ids.append(linked_doc_id)
+                continue
+
+            self.document_tree.record(
+                item.get("id"),
+                document_id,
+                doctype,
+                item.get("updated"),
+                item.get("childCount"),
+            )
+            child_ids.append(item.get("id"))
+
+        self.document_tree.record_children(document_id, child_ids)
 
-        # Remove CDATA sections
-        html_content = re.sub(
-            r"<!\[CDATA\[(.*?)\]\]>", r"\1", html_content, flags=re.DOTALL
+    def _list_folder(self, item):
+        """Check if the children of a folder must be listed, or are unchanged since the last crawl."""
+        if self.document_tree is None:
+            return True
+        return not self.document_tree.prune(
+            item.get("id"), item.get("updated"), item.get("childCount")
         )
 
-        # Remove extra whitespace
-        html_content = " ".join(html_content.split())
+    def _check_folder(self, parent_id, json):
+        """
+        Check a stored child folder of an unchanged folder.
 
-        # Remove common problematic elements or replace them with better tags
-        html_content = html_content.replace("&nbsp;", " ")
+        Args:
+            parent_id: ID of the unchanged folder
+            json: The folder, as returned by the document API
 
-        # Fix common HTML issues
-        html_content = html_content.replace("<br>", "<br />")
+        Returns:
+            True if the folder changed and must be listed, its metadata is
+            then recorded in the document tree
+        """
+        if self.document_tree.prune(
+            json.get("id"), json.get("updated"), json.get("childCount"), True
+        ):
+            return False
+
+        self.document_tree.record(
+            json.get("id"),
+            parent_id,
+            json.get("type", {}).get("name", "").lower(),
+            json.get("updated"),
+            json.get("childCount"),
+        )
+        return True
 
-        # Remove any HTML comments
-        html_content = re.sub(r"<!--.*?-->", "", html_content, flags=re.DOTALL)
+    def _crawl_linked(self, linked_doc_id, max_depth, depth, visited_ids):
+        """
+        Yield a linked document and its descendants.
 
-        # Handle special characters and entities
-        html_content = html_content.replace("&oslash;", "ø")
-        html_content = html_content.replace("&aelig;", "æ")
-        html_content = html_content.replace("&aring;", "å")
-        html_content = html_content.replace("&Oslash;", "Ø")
-        html_content = html_content.replace("&Aelig;", "Æ")
-        html_content = html_content.replace("&Aring;", "Å")
+        Args:
+            linked_doc_id: ID of the linked document
+            max_depth: Maximum depth of recursion
+            depth: Depth of the link
+            visited_ids: Set of already visited document IDs
+        """
+        linked_doc = self.get_document(linked_doc_id)
+        linked_doc.depth = depth
+        yield linked_doc
 
-        return html_content
+        if linked_doc["childCount"]:
+            yield from self.get_children(linked_doc_id, max_depth, depth, visited_ids)
 
-    def _html_to_markdown(self, html_content):
-        """Convert HTML content to Markdown format."""
-        try:
-            if html_content is None:
-                return None
-
-            # Configure markdownify with options to handle HTML properly
-            markdown_content = markdownify(
-                html_content,
-                strip=["script", "style"],
-                heading_style="ATX",
-                bullets="-",
-                convert_links=True,
-            )
+    def _crawl_unchanged(self, folder_id, max_depth, depth, visited_ids):
+        """
+        Yield the changed folders below an unchanged folder, with their
+        descendants, and the documents it links to.
 
-            markdown_content = re.sub(r"<br\s*/?>", "\n\n", markdown_content)
+        Args:
+            folder_id: ID of the unchanged folder
+            max_depth: Maximum depth of recursion
+            depth: Depth of the unchanged folder
+            visited_ids: Set of already visited document IDs
+        """
+        if depth >= max_depth:
+            return
 
-            return markdown_content
-        except ImportError:
-            print("markdownify package is not installed. Run 'pip install markdownify'")
-            return None
-        except Exception as e:
-            print(f"An error occurred while converting HTML to Markdown: {e}")
-            return None
+        # A change in a linked document does not bump the folder
+        for linked_doc_id in self.document_tree.linked_children(folder_id):
+            if linked_doc_id not in visited_ids:
+                yield from self._crawl_linked(
+                    linked_doc_id, max_depth, depth + 1, visited_ids
+                )
+
+        for child_id in self.document_tree.child_folders(folder_id):
+            if child_id in visited_ids:
+                continue
+
+            started = time.perf_counter()
+            json = self._fetch_document(child_id)
+            fetch_time = time.perf_counter() - started
+            if not self._check_folder(folder_id, json):
+                visited_ids.add(child_id)
+                yield from self._crawl_unchanged(
+                    child_id, max_depth, depth + 1, visited_ids
+                )
+                continue
+
+            child = self._build_document(json)
+            child.depth = depth + 1
+            child.spans["fetch"] = fetch_time
+            yield child
+            yield from self.get_children(child_id, max_depth, depth + 1, visited_ids)
 
-    def get_document(self, document_id):
-        """Get a single document by ID."""
-        headers = {
-            "Authorization": f"Bearer {self._get_token()}",
-            "Content-Type": "application/json",
-        }
-        url = f"{self.base_url}/api/documents/{document_id}"
-        response = requests.get(url, headers=headers)
+    def _html_clean_up(self, html_content):
+        """Clean up Colibo HTML before converting it."""
+        return html_clean_up(html_content)
 
-        # Check if the response is successful
-        response.raise_for_status()
+    def _html_to_markdown(self, html_content):
+        """Convert HTML content to Markdown format."""
+        if self.metrics is None:
+            return html_to_markdown(html_content)
 
-        # Parse the JSON response
-        json = response.json()
+        started = time.perf_counter()
+        markdown_content = html_to_markdown(html_content)
+        self.metrics.observe(
+            "colibo_sync_conversion_duration_seconds", time.perf_counter() - started
+        )
+        return markdown_content
+
+    def _convert_body(self, html_content, spans=None):
+        """
+        Clean up an HTML body and convert it to Markdown.
 
-        if response:
+        Args:
+            html_content (str): The HTML body
+            spans (dict): Optional dict to store the "clean_up" and "convert" times in
+        """
+        started = time.perf_counter()
+        html_content = self._html_clean_up(html_content)
+        cleaned = time.perf_counter()
+
+        if self.markdown_cache is None or html_content is None:
+            markdown_content = self._html_to_markdown(html_content)
+        else:
+            markdown_content = self.markdown_cache.get(html_content)
+            if markdown_content is None:
+                markdown_content = self._html_to_markdown(html_content)
+                self.markdown_cache.put(html_content, markdown_content)
+
+        if spans is not None:
+            spans["clean_up"] = cleaned - started
+            spans["convert"] = time.perf_counter() - cleaned
+        return markdown_content
+
+    def _build_document(self, json):
+        """Build the document dict from a document API response."""
+        if json:
             # Convert date strings to datetime objects
             created = None
             updated = None
@@ -189,30 +292,263 @@ class Client:
                 if json.get("fields", {}).get("body")
                 else None
             )
-            if body:
-                body = self._html_clean_up(body)
-                body = self._html_to_markdown(body)
 
             doctype = json.get("type", {}).get("name").lower()
 
-            # Extract the requested fields
-            return {
-                "id": json.get("id"),
-                "url": f"{self.base_url}/documents/{json.get('id')}",
+            # Extract the requested fields, the body is converted on first use
+            return Document(
+                {
+                    "id": json.get("id"),
+                    "url": f"{self.base_url}/documents/{json.get('id')}",
+                    "doctype": doctype,
+                    "childCount": json.get("childCount"),
+                    "created": created,
+                    "updated": updated,
+                    "revisioning": json.get("revisioning"),
+                    "title": json.get("fields", {}).get("title"),
+                    "description": json.get("fields", {}).get("description"),
+                    "raw_body": body,
+                    "keywords": keywords_array,
+                },
+                converter=self._convert_body,
+            )
+        return None
+
+    def _build_child(self, item, doctype):
+        """Build the document dict for an item from a children listing."""
+        created = None
+        updated = None
+
+        if "created" in item and item["created"]:
+            try:
+                created = datetime.fromisoformat(
+                    item["created"].replace("Z", "+00:00")
+                ).replace(tzinfo=None)
+            except (ValueError, AttributeError):
+                pass
+
+        if "updated" in item and item["updated"]:
+            try:
+                updated = datetime.fromisoformat(
+                    item["updated"].replace("Z", "+00:00")
+                ).replace(tzinfo=None)
+            except (ValueError, AttributeError):
+                pass
+
+        # Split keywords into an array by comma
+        keywords = item.get("fields", {}).get("keywords", "")
+        keywords_array = (
+            [keyword.strip() for keyword in keywords.split(",")] if keywords else []
+        )
+
+        body = (
+            item.get("fields", {}).get("body", "")
+            if item.get("fields", {}).get("body")
+            else None
+        )
+
+        # The body is converted on first use
+        return Document(
+            {
+                "id": item.get("id"),
+                "url": f"{self.base_url}/documents/{item.get('id')}",
                 "doctype": doctype,
-                "childCount": json.get("childCount"),
                 "created": created,
                 "updated": updated,
-                "revisioning": json.get("revisioning"),
-                "title": json.get("fields", {}).get("title"),
-                "description": json.get("fields", {}).get("description"),
-                "body": body,
+                "title": item.get("fields", {}).get("title"),
+                "description": item.get("fields", {}).get("description"),
+                "raw_body": body,
                 "keywords": keywords_array,
-            }
-        return None
+            },
+            converter=self._convert_body,
+        )
+
+
+class Client(BaseClient):
+    def __init__(
+        self,
+        base_url,
+        client_id,
+        client_secret,
+        scope,
+        pool_size=10,
+        markdown_cache=None,
+        http_cache=None,
+        document_tree=None,
+        max_retries=5,
+        memoize=False,
+        metrics=None,
+    ):
+        super().__init__(
+            base_url,
+            client_id,
+            client_secret,
+            scope,
+            markdown_cache,
+            http_cache,
+            document_tree,
+            metrics,
+        )
+
+        # Reuse connections (keep-alive) for all requests made by this client
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if metrics is not None:
+            metrics.instrument_session(self.session, "colibo")
+
+        # Back off when Colibo is overloaded, and speed up again when it is not
+        self.limiter = AdaptiveLimiter(pool_size)
+        self.max_retries = max_retries
+
+        # With memoize, responses are kept by URL for the lifetime of the
+        # client, so a document reached from several roots is fetched once
+        self.responses = {} if memoize else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+
+    def _get_token(self):
+        """Get a valid access token, renewing if necessary."""
+        # Only one thread refreshes the token, see TokenManager
+        self.access_token = self.token_manager.get_token(self._request_token)
+        return self.access_token
+
+    def _send(self, method, url, **kwargs):
+        """
+        Send a request through the rate limiter.
+
+        Requests that fail because Colibo is overloaded (429, 502, 503, 504) or
+        unreachable are retried up to max_retries times, waiting as long as
+        Retry-After asks or with jittered exponential backoff.
+
+        Returns:
+            The response, which may still be an error response
+        """
+        attempt = 0
+        while True:
+            ticket = self.limiter.acquire()
+            delay = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                # No answer, most likely an overloaded Colibo
+                self.limiter.release(ticket, throttled=True)
+                if attempt >= self.max_retries:
+                    raise
+            except BaseException:
+                self.limiter.release(ticket, failed=True)
+                raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    self.limiter.release(ticket)
+                    return response
+
+                delay = retry_after(response.headers.get("Retry-After"))
+                throttled = response.status_code in THROTTLE_STATUS_CODES
+                self.limiter.release(
+                    ticket, throttled=throttled, delay=delay, failed=not throttled
+                )
+                if attempt >= self.max_retries:
+                    return response
+
+            self.limiter.retried()
+            time.sleep(backoff(attempt, delay))
+            attempt += 1
+
+    def _request_token(self):
+        """Fetch a new token from the API."""
+        response = self._send(
+            "POST",
+            f"{self.base_url}/auth/oauth2/connect/token",
+            data=self._token_request_data(),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def _get(self, url, headers=None):
+        """Make an authenticated GET request, renewing the token once if it is rejected."""
+        token = self._get_token()
+        response = self._send(
+            "GET", url, headers={**self._auth_headers(token), **(headers or {})}
+        )
+        if response.status_code == 401:
+            # The token was revoked or expired early, retry once with a new one
+            self.token_manager.invalidate(token)
+            response = self._send(
+                "GET",
+                url,
+                headers={**self._auth_headers(self._get_token()), **(headers or {})},
+            )
+        return response
+
+    def _get_json(self, url):
+        """Make an authenticated GET request and return the decoded JSON."""
+        if self.responses is None:
+            return self._fetch_json(url)
+
+        data = self.responses.get(url)
+        if data is None:
+            data = self._fetch_json(url)
+            self.responses[url] = data
+        return data
+
+    def _fetch_json(self, url):
+        """
+        Make an authenticated GET request and return the decoded JSON.
+
+        With an HTTP cache the request is conditional, and the cached body is
+        used when the server answers 304 Not Modified.
+        """
+        if self.http_cache is None:
+            response = self._get(url)
+            response.raise_for_status()
+            return response.json()
+
+        response = self._get(url, self.http_cache.conditional_headers(url))
+        if response.status_code == 304:
+            data = self.http_cache.not_modified(url)
+            if data is not None:
+                return data
+            # The entry has been evicted in the meantime
+            response = self._get(url)
+
+        # Check if the response is successful
+        response.raise_for_status()
+
+        data = response.json()
+        self.http_cache.store(url, response.headers, response.text, data)
+        return data
+
+    def get_document(self, document_id):
+        """Get a single document by ID."""
+        started = time.perf_counter()
+        document = self._build_document(self._fetch_document(document_id))
+        if document is not None:
+            document.spans["fetch"] = time.perf_counter() - started
+        return document
+
+    def _fetch_document(self, document_id):
+        """Fetch the raw document API response of a document."""
+        return self._get_json(f"{self.base_url}/api/documents/{document_id}")
 
     def get_children(
-        self, document_id, max_depth=10, current_depth=0, visited_ids=None
+        self,
+        document_id,
+        max_depth=10,
+        current_depth=0,
+        visited_ids=None,
+        workers=1,
+        checkpoint=None,
+        resume=False,
     ):
         """
         Get all children of a document by ID recursively up to a specified maximum depth.
@@ -222,10 +558,26 @@ class Client:
             max_depth: Maximum depth of recursion (default: 10)
             current_depth: Current depth in the recursion (used internally)
             visited_ids: Set of already visited document IDs to prevent circular references (used internally)
+            workers: Number of concurrent requests. With more than one worker the
+                tree is crawled in parallel and documents are yielded in the order
+                they are fetched instead of depth-first order (default: 1)
+            checkpoint: Optional db.checkpoint.CheckpointManager recording the
+                progress of the crawl, always crawled with the Crawler
+            resume (bool): Continue the crawl saved in the checkpoint
 
         Returns:
             Generator yielding document information with all descendants up to max_depth
         """
+        if workers > 1 or checkpoint is not None:
+            yield from Crawler(self, workers=workers, max_depth=max_depth).crawl(
+                document_id,
+                visited_ids=visited_ids,
+                current_depth=current_depth,
+                checkpoint=checkpoint,
+                resume=resume,
+            )
+            return
+
         if current_depth >= max_depth:
             return
 
@@ -240,29 +592,18 @@ class Client:
         # Mark this document as visited
         visited_ids.add(document_id)
 
-        headers = {
-            "Authorization": f"Bearer {self._get_token()}",
-            "Content-Type": "application/json",
-        }
-        response = requests.get(
-            f"{self.base_url}/api/documents/{document_id}/children", headers=headers
-        )
-
-        # Check if the response is successful
-        response.raise_for_status()
-
-        # Parse the JSON response
-        json = response.json()
+        started = time.perf_counter()
+        items = self._fetch_children(document_id)
+        # The listing is shared by its children
+        fetch_time = (time.perf_counter() - started) / max(1, len(items))
+        self._record_listing(document_id, items)
 
         # Extract only id, created, and updated fields from each child
-        for item in json:
+        for item in items:
             # if item['id'] in visited_ids:
             #     # Skip it if it has already been visited
             #     continue
 
-            created = None
-            updated = None
-
             doctype = item.get("type", {}).get("name").lower()
             match doctype:
                 case "link":
@@ -274,16 +615,9 @@ class Client:
                             continue
 
                         if linked_doc_id:
-                            linked_doc = self.get_document(linked_doc_id)
-                            yield linked_doc
-
-                            if linked_doc["childCount"]:
-                                yield from self.get_children(
-                                    linked_doc_id,
-                                    max_depth,
-                                    current_depth + 1,
-                                    visited_ids,
-                                )
+                            yield from self._crawl_linked(
+                                linked_doc_id, max_depth, current_depth + 1, visited_ids
+                            )
                         else:
                             # TODO: Extern link
                             # print(f"External document_id: {document_id} ({url})")
@@ -293,48 +627,20 @@ class Client:
                     # Stop processing this doc, we do not yield the link page.
                     continue
                 case "folder":
-                    yield from self.get_children(
-                        item.get("id"), max_depth, current_depth + 1, visited_ids
-                    )
-
-            if "created" in item and item["created"]:
-                try:
-                    created = datetime.fromisoformat(
-                        item["created"].replace("Z", "+00:00")
-                    ).replace(tzinfo=None)
-                except (ValueError, AttributeError):
-                    pass
-
-            if "updated" in item and item["updated"]:
-                try:
-                    updated = datetime.fromisoformat(
-                        item["updated"].replace("Z", "+00:00")
-                    ).replace(tzinfo=None)
-                except (ValueError, AttributeError):
-                    pass
-
-            # Split keywords into an array by comma
-            keywords = item.get("fields", {}).get("keywords", "")
-            keywords_array = (
-                [keyword.strip() for keyword in keywords.split(",")] if keywords else []
-            )
-
-            body = (
-                item.get("fields", {}).get("body", "")
-                if item.get("fields", {}).get("body")
-                else None
-            )
-            body = self._html_clean_up(body)
-            body = self._html_to_markdown(body)
-
-            yield {
-                "id": item.get("id"),
-                "url": f"{self.base_url}/documents/{item.get('id')}",
-                "doctype": doctype,
-                "created": created,
-                "updated": updated,
-                "title": item.get("fields", {}).get("title"),
-                "description": item.get("fields", {}).get("description"),
-                "body": body,
-                "keywords": keywords_array,
-            }
+                    if self._list_folder(item):
+                        yield from self.get_children(
+                            item.get("id"), max_depth, current_depth + 1, visited_ids
+                        )
+                    else:
+                        yield from self._crawl_unchanged(
+                            item.get("id"), max_depth, current_depth + 1, visited_ids
+                        )
+
+            child = self._build_child(item, doctype)
+            child.depth = current_depth + 1
+            child.spans["fetch"] = fetch_time
+            yield child
+
+    def _fetch_children(self, document_id):
+        """Fetch the raw list of direct children of a document."""
+        return self._get_json(f"{self.base_url}/api/documents/{document_id}/children")
@@ -0,0 +1,198 @@
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version
+from multiprocessing import get_context
+
+from markdownify import markdownify
+
+# Options used when converting HTML to Markdown
+MARKDOWN_OPTIONS = {
+    "strip": ["script", "style"],
+    "heading_style": "ATX",
+    "bullets": "-",
+    "convert_links": True,
+}
+
+# Bump when html_clean_up() or html_to_markdown() changes the output, so
+# cached conversions are invalidated.
+CONVERTER_VERSION = 1
+
+
+def converter_settings():
+    """Get everything that affects the Markdown output, used as cache key."""
+    return {
+        "options": MARKDOWN_OPTIONS,
+        "version": CONVERTER_VERSION,
+        "markdownify": version("markdownify"),
+    }
+
+
+def html_clean_up(html_content):
+    """Clean up Colibo HTML before converting it."""
+    if html_content is None:
+        return None
+
+    # Remove CDATA sections
+    html_content = re.sub(
+        r"<!\[CDATA\[(.*?)\]\]>", r"\1", html_content, flags=re.DOTALL
+    )
+
+    # Remove extra whitespace
+    html_content = " ".join(html_content.split())
+
+    # Remove common problematic elements or replace them with better tags
+    html_content = html_content.replace("&nbsp;", " ")
+
+    # Fix common HTML issues
+    html_content = html_content.replace("<br>", "<br />")
+
+    # Remove any HTML comments
+    html_content = re.sub(r"<!--.*?-->", "", html_content, flags=re.DOTALL)
+
+    # Handle special characters and entities
+    html_content = html_content.replace("&oslash;", "ø")
+    html_content = html_content.replace("&aelig;", "æ")
+    html_content = html_content.replace("&aring;", "å")
+    html_content = html_content.replace("&Oslash;", "Ø")
+    html_content = html_content.replace("&Aelig;", "Æ")
+    html_content = html_content.replace("&Aring;", "Å")
+
+    return html_content
+
+
+def html_to_markdown(html_content):
+    """Convert HTML content to Markdown format."""
+    try:
+        if html_content is None:
+            return None
+
+        # Configure markdownify with options to handle HTML properly
+        markdown_content = markdownify(html_content, **MARKDOWN_OPTIONS)
+
+        markdown_content = re.sub(r"<br\s*/?>", "\n\n", markdown_content)
+
+        return markdown_content
+    except ImportError:
+        print("markdownify package is not installed. Run 'pip install markdownify'")
+        return None
+    except Exception as e:
+        print(f"An error occurred while converting HTML to Markdown: {e}")
+        return None
+
+
+def convert(html_content):
+    """Clean up HTML and convert it to Markdown."""
+    return html_to_markdown(html_clean_up(html_content))
+
+
+def timed(func, html_content):
+    """Run a conversion in a worker process, and return its result and duration."""
+    started = time.perf_counter()
+    markdown_content = func(html_content)
+    return markdown_content, time.perf_counter() - started
+
+
+class ConversionPool:
+    """Convert document bodies to Markdown in a pool of worker processes."""
+
+    def __init__(self, workers, markdown_cache=None, window=None, metrics=None):
+        """
+        Initialize the pool.
+
+        Args:
+            workers (int): Number of worker processes
+            markdown_cache: Optional db.markdown_cache.MarkdownCacheManager,
+                cached bodies are not sent to the workers
+            window (int): Maximum number of documents waiting for conversion
+                (default: 4 per worker)
+            metrics: Optional metrics.Metrics recording the conversion times
+        """
+        self.workers = workers
+        self.markdown_cache = markdown_cache
+        self.metrics = metrics
+        self.window = window or workers * 4
+        # Spawn rather than fork, as the parent runs other threads (crawler,
+        # uploads, database flushes) whose locks must not be copied.
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context("spawn")
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Stop the worker processes."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _submit(self, document):
+        """Start converting the body of a document, if needed."""
+        if document.converted or not document.get("raw_body"):
+            return None, None
+
+        if self.markdown_cache is None:
+            # Cleaned up in the worker, and part of the "convert" span
+            return self.executor.submit(timed, convert, document["raw_body"]), None
+
+        started = time.perf_counter()
+        html_content = html_clean_up(document["raw_body"])
+        cleaned = time.perf_counter()
+        document.spans["clean_up"] = cleaned - started
+
+        cached = self.markdown_cache.get(html_content)
+        if cached is not None:
+            document["body"] = cached
+            document.spans["convert"] = time.perf_counter() - cleaned
+            return None, None
+
+        return (
+            self.executor.submit(timed, html_to_markdown, html_content),
+            html_content,
+        )
+
+    def _finish(self, item, document, future, html_content):
+        """Store the converted body of a document."""
+        if future is None:
+            return item
+
+        document["body"], duration = future.result()
+        document.spans["convert"] = duration
+        if self.metrics is not None:
+            self.metrics.observe("colibo_sync_conversion_duration_seconds", duration)
+        if html_content is not None:
+            self.markdown_cache.put(html_content, document["body"])
+
+        return item
+
+    def convert(self, items, key=None):
+        """
+        Convert the bodies of documents in the worker processes.
+
+        Args:
+            items: Iterable of colibo.document.Document, or of items holding one
+            key: Function returning the document of an item (default: the item)
+
+        Returns:
+            Generator yielding the items, with their body converted, in the order
+            they were given
+        """
+        pending = deque()
+        for item in items:
+            document = key(item) if key else item
+            pending.append((item, document, *self._submit(document)))
+
+            # Hand back finished items in order, and wait for the oldest when
+            # too many are in flight.
+            while pending and (
+                len(pending) > self.window
+                or pending[0][2] is None
+                or pending[0][2].done()
+            ):
+                yield self._finish(*pending.popleft())
+
+        while pending:
+            yield self._finish(*pending.popleft())
@@ -0,0 +1,210 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def timed(func, *args):
+    """Call a function, and return its result and how long it took."""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+class Crawler:
+    """Crawl a Colibo document tree with a pool of worker threads."""
+
+    def __init__(self, client, workers=4, max_depth=10):
+        """
+        Initialize the crawler.
+
+        Args:
+            client: The Colibo client used to fetch documents and children
+            workers (int): Number of requests kept in flight at the same time
+            max_depth (int): Maximum depth of the crawl
+        """
+        self.client = client
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+
+    @staticmethod
+    def _key(document_id):
+        """Normalize a document ID, so "123" and 123 are the same document."""
+        if isinstance(document_id, str) and document_id.isdigit():
+            return int(document_id)
+        return document_id
+
+    def crawl(
+        self,
+        document_id,
+        visited_ids=None,
+        current_depth=0,
+        checkpoint=None,
+        resume=False,
+    ):
+        """
+        Get all children of a document, fetching sibling folders and linked
+        documents in parallel.
+
+        Documents are yielded as soon as they are fetched, so the order differs
+        from the depth-first order of Client.get_children. Only the consuming
+        thread touches visited_ids, the workers only do HTTP requests.
+
+        Args:
+            document_id: The ID of the document to get children for
+            visited_ids: Set of already visited document IDs to prevent circular references
+            current_depth: Depth of the document in the tree
+            checkpoint: Optional db.checkpoint.CheckpointManager, recording the
+                progress of the crawl
+            resume (bool): Continue the crawl from the checkpoint instead of
+                starting at the document: re-fetch its pending documents and
+                list its frontier
+
+        Returns:
+            Generator yielding document information with all descendants up to max_depth
+        """
+        if visited_ids is None:
+            visited_ids = set()
+        visited_ids.update([self._key(visited_id) for visited_id in visited_ids])
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="colibo-crawler"
+        )
+        pending = {}
+        linked_ids = set()
+        # Stored child folder of an unchanged folder being checked -> the folder
+        check_parents = {}
+
+        def list_children(parent_id, depth, force=False):
+            key = self._key(parent_id)
+            if depth >= self.max_depth or (key in visited_ids and not force):
+                return
+            visited_ids.add(key)
+            if checkpoint is not None:
+                checkpoint.queued(parent_id, depth)
+            future = executor.submit(timed, self.client._fetch_children, parent_id)
+            pending[future] = ("children", parent_id, depth)
+
+        def check_folders(folder_id, depth):
+            # The stored child folders and linked documents of an unchanged
+            # folder at the given depth, its timestamp does not cover them
+            if depth >= self.max_depth:
+                return
+            for linked_doc_id in self.client.document_tree.linked_children(folder_id):
+                key = self._key(linked_doc_id)
+                if key in visited_ids or key in linked_ids:
+                    continue
+                linked_ids.add(key)
+                if checkpoint is not None:
+                    checkpoint.found(linked_doc_id, depth + 1)
+                fetch_document(linked_doc_id, depth + 1)
+            for child_id in self.client.document_tree.child_folders(folder_id):
+                key = self._key(child_id)
+                if key in visited_ids or key in check_parents:
+                    continue
+                check_parents[key] = folder_id
+                if checkpoint is not None:
+                    # A resumed crawl lists it instead of checking it
+                    checkpoint.queued(child_id, depth + 1)
+                future = executor.submit(timed, self.client._fetch_document, child_id)
+                pending[future] = ("check", child_id, depth + 1)
+
+        def fetch_document(doc_id, depth):
+            # Its children are listed at the given depth
+            future = executor.submit(self.client.get_document, doc_id)
+            pending[future] = ("document", doc_id, depth)
+
+        try:
+            if resume:
+                # Documents in the frontier are marked as visited, so pending
+                # documents do not list them a second time.
+                visited_ids.update(checkpoint.listed_ids)
+                visited_ids.update(checkpoint.frontier)
+                for parent_id, depth in checkpoint.frontier.items():
+                    list_children(parent_id, depth, force=True)
+                for doc_id, depth in checkpoint.pending.items():
+                    linked_ids.add(doc_id)
+                    fetch_document(doc_id, depth)
+            else:
+                # The caller usually marks the start document as visited already.
+                list_children(document_id, current_depth, force=True)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, parent_id, depth = pending.pop(future)
+                    result = future.result()
+
+                    if kind == "check":
+                        result, fetch_time = result
+                        if self.client._check_folder(
+                            check_parents[self._key(parent_id)], result
+                        ):
+                            child = self.client._build_document(result)
+                            child.depth = depth
+                            child.spans["fetch"] = fetch_time
+                            list_children(parent_id, depth)
+                            yield child
+                        else:
+                            visited_ids.add(self._key(parent_id))
+                            if checkpoint is not None:
+                                checkpoint.listed(parent_id, {})
+                            check_folders(parent_id, depth)
+                        continue
+
+                    if kind == "document":
+                        result.depth = depth
+                        if result["childCount"]:
+                            list_children(parent_id, depth)
+                        yield result
+                        continue
+
+                    result, fetch_time = result
+                    # The listing is shared by its children
+                    fetch_time /= max(1, len(result))
+                    self.client._record_listing(parent_id, result)
+                    # Queue the requests of the whole listing before yielding
+                    # anything, so a checkpoint never has the listed document
+                    # without the folders it still has to list.
+                    children = []
+                    found = {}
+                    for item in result:
+                        doctype = item.get("type", {}).get("name").lower()
+                        match doctype:
+                            case "link":
+                                url = item.get("fields", {}).get("url")
+                                linked_doc_id = (
+                                    self.client._extract_id_from_url(url)
+                                    if url
+                                    else None
+                                )
+                                key = self._key(linked_doc_id)
+                                if (
+                                    linked_doc_id
+                                    and key not in visited_ids
+                                    and key not in linked_ids
+                                ):
+                                    # Linked documents are only fetched once, even
+                                    # when several links point to them.
+                                    linked_ids.add(key)
+                                    fetch_document(linked_doc_id, depth + 1)
+                                    found[linked_doc_id] = depth + 1
+
+                                # We do not yield the link page.
+                                continue
+                            case "folder":
+                                if self.client._list_folder(item):
+                                    list_children(item.get("id"), depth + 1)
+                                else:
+                                    check_folders(item.get("id"), depth + 1)
+
+                        child = self.client._build_child(item, doctype)
+                        child.depth = depth + 1
+                        child.spans["fetch"] = fetch_time
+                        children.append(child)
+                        found[item.get("id")] = depth + 1
+
+                    if checkpoint is not None:
+                        checkpoint.listed(parent_id, found)
+                    yield from children
+        finally:
+            # Stop outstanding requests if the consumer stops iterating early.
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,45 @@
+class Document(dict):
+    """
+    A document from Colibo.
+
+    The Markdown "body" is converted from the raw HTML in "raw_body" the first
+    time it is read, so documents that are skipped are never converted.
+    """
+
+    def __init__(self, *args, converter=None, **kwargs):
+        """
+        Initialize the document.
+
+        Args:
+            converter: Function converting the raw HTML body to Markdown,
+                called with the HTML and the spans of the document
+        """
+        super().__init__(*args, **kwargs)
+        self._converter = converter
+        # Depth in the crawled tree, and the seconds spent on the document per
+        # step ("fetch", "clean_up", "convert"), see pipeline.trace
+        self.depth = None
+        self.spans = {}
+
+    def __missing__(self, key):
+        if key != "body":
+            raise KeyError(key)
+
+        html = super().get("raw_body")
+        body = self._converter(html, self.spans) if html and self._converter else None
+        self["body"] = body
+
+        return body
+
+    def __contains__(self, key):
+        return key == "body" or super().__contains__(key)
+
+    def get(self, key, default=None):
+        if key == "body":
+            return self["body"]
+        return super().get(key, default)
+
+    @property
+    def converted(self):
+        """Check if the body has been converted yet."""
+        return super().__contains__("body")
@@ -0,0 +1,196 @@
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Status codes that mean the server is overloaded, the request can be retried
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+# Status codes that mean the client should slow down
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def retry_after(value):
+    """
+    Parse a Retry-After header.
+
+    Returns:
+        Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff(attempt, retry_after=None, base=0.5, cap=30.0):
+    """
+    Seconds to wait before a retry, exponential with full jitter.
+
+    Args:
+        attempt (int): Number of retries so far
+        retry_after (float): Seconds the server asked to wait, the minimum delay
+    """
+    delay = random.uniform(0, min(cap, base * 2**attempt))
+    return max(delay, retry_after or 0.0)
+
+
+class AdaptiveLimiter:
+    """
+    Limit the number of concurrent requests to an API, adapting to its load.
+
+    The limit grows by one request per window of successful requests
+    (additive increase), and is halved when the server throttles or does not
+    answer (multiplicative decrease). Other failures leave it as it is. Requests in flight when the limit is halved
+    are often throttled together, so only requests started after the last
+    decrease can decrease it again. A Retry-After from the server pauses all
+    new requests until it has passed.
+    """
+
+    def __init__(self, max_limit, min_limit=1, decrease=0.5):
+        """
+        Initialize the limiter.
+
+        Args:
+            max_limit (int): Maximum number of concurrent requests, the starting limit
+            min_limit (int): Minimum number of concurrent requests
+            decrease (float): Factor the limit is multiplied with when throttled
+        """
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.decrease = decrease
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        # Incremented on every decrease, see acquire()
+        self._epoch = 0
+
+        # Statistics
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.lowest_limit = self.limit
+
+        self._lock = threading.Condition()
+
+    def _ready(self):
+        """Check if a request may start now, or return the seconds to wait."""
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            return delay
+        if self.in_flight < int(self.limit):
+            return 0
+        return None
+
+    def _start(self):
+        self.in_flight += 1
+        self.requests += 1
+        return self._epoch
+
+    def _finish(self, epoch, throttled=False, delay=None, failed=False):
+        self.in_flight -= 1
+        if throttled:
+            self.throttled += 1
+            if epoch == self._epoch:
+                self._epoch += 1
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+                self.lowest_limit = min(self.lowest_limit, self.limit)
+            if delay:
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        elif not failed:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def acquire(self, timeout=None):
+        """
+        Wait until a request may start.
+
+        Args:
+            timeout (float): Optional number of seconds to wait at most
+
+        Returns:
+            A ticket to pass to release(), or None if the timeout passed first
+        """
+        waited_until = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while True:
+                delay = self._ready()
+                if delay == 0:
+                    return self._start()
+                if waited_until is not None:
+                    remaining = waited_until - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    delay = remaining if delay is None else min(delay, remaining)
+                self._lock.wait(delay)
+
+    def release(self, ticket, throttled=False, delay=None, failed=False):
+        """
+        Mark a request as finished.
+
+        Args:
+            ticket: The ticket returned by acquire()
+            throttled (bool): The server answered 429 or 503, or did not answer
+            delay (float): Seconds the server asked to wait (Retry-After)
+            failed (bool): The request failed otherwise, the limit is not raised
+        """
+        with self._lock:
+            self._finish(ticket, throttled, delay, failed)
+            self._lock.notify_all()
+
+    def retried(self):
+        """Count a retried request."""
+        with self._lock:
+            self.retries += 1
+
+    def stats(self):
+        """Get the statistics of the limiter."""
+        return {
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "limit": int(self.limit),
+            "lowest_limit": int(self.lowest_limit),
+            "max_limit": self.max_limit,
+        }
+
+
+class AsyncAdaptiveLimiter(AdaptiveLimiter):
+    """Asyncio version of AdaptiveLimiter."""
+
+    def __init__(self, max_limit, min_limit=1, decrease=0.5):
+        super().__init__(max_limit, min_limit, decrease)
+        self._changed = None
+
+    async def acquire(self):
+        """Wait until a request may start, see AdaptiveLimiter.acquire()."""
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        while True:
+            delay = self._ready()
+            if delay == 0:
+                return self._start()
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, ticket, throttled=False, delay=None, failed=False):
+        """Mark a request as finished, see AdaptiveLimiter.release()."""
+        self._finish(ticket, throttled, delay, failed)
+        if self._changed is not None:
+            self._changed.set()
+
+    def retried(self):
+        """Count a retried request."""
+        self.retries += 1
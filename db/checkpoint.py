@@ -0,0 +1,222 @@
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, insert
+
+from .models import SyncCheckpoint, SyncCheckpointItem, get_session
+
+
+class CheckpointManager:
+    """
+    Progress of a sync run, saved so a stopped or crashed sync can be resumed.
+
+    A checkpoint holds the crawl frontier (documents whose children are still
+    to be listed), the documents that have been listed, and the pending
+    documents: found by the crawl but not finished yet. All children of a
+    listing become pending at once, so a sync stopped halfway through a
+    listing does not lose the rest of it.
+
+    The state is kept in memory and written by save(), which writes the sync
+    records first, so a document is never saved as finished before its sync
+    record has been written.
+    """
+
+    def __init__(self, root_doc_id, knowledge_id, session=None):
+        """
+        Initialize the checkpoint.
+
+        Args:
+            root_doc_id: ID of the root document of the sync
+            knowledge_id (str): The knowledge base of the sync
+            session: Optional database session
+        """
+        self.session = session or get_session()
+        self.root_doc_id = str(root_doc_id)
+        self.knowledge_id = knowledge_id
+
+        self.checkpoint = None
+        # Document ID -> depth in the tree, for frontier and pending documents
+        self.frontier = {}
+        self.listed_ids = set()
+        self.pending = {}
+        self.processed = 0
+
+        self._lock = threading.Lock()
+        self._new_listed = set()
+
+    def _find(self):
+        return (
+            self.session.query(SyncCheckpoint)
+            .filter_by(root_doc_id=self.root_doc_id, knowledge_id=self.knowledge_id)
+            .order_by(SyncCheckpoint.id.desc())
+            .first()
+        )
+
+    def _delete(self, checkpoint):
+        self.session.execute(
+            delete(SyncCheckpointItem).where(
+                SyncCheckpointItem.checkpoint_id == checkpoint.id
+            )
+        )
+        self.session.delete(checkpoint)
+
+    def start(self):
+        """Start a new checkpoint, replacing an unfinished one."""
+        with self._lock:
+            checkpoint = self._find()
+            if checkpoint:
+                self._delete(checkpoint)
+
+            now = datetime.now(timezone.utc)
+            self.checkpoint = SyncCheckpoint(
+                root_doc_id=self.root_doc_id,
+                knowledge_id=self.knowledge_id,
+                status="running",
+                started_at=now,
+                updated_at=now,
+                processed=0,
+            )
+            self.session.add(self.checkpoint)
+            self.session.commit()
+
+    def resume(self):
+        """
+        Load the unfinished checkpoint of the root document and knowledge base.
+
+        Returns:
+            True if there was a checkpoint to resume
+        """
+        with self._lock:
+            self.checkpoint = self._find()
+            if self.checkpoint is None:
+                return False
+
+            for kind, document_id, depth in self.session.query(
+                SyncCheckpointItem.kind,
+                SyncCheckpointItem.colibo_doc_id,
+                SyncCheckpointItem.depth,
+            ).filter_by(checkpoint_id=self.checkpoint.id):
+                if kind == "frontier":
+                    self.frontier[document_id] = depth
+                elif kind == "listed":
+                    self.listed_ids.add(document_id)
+                else:
+                    self.pending[document_id] = depth
+
+            self.processed = self.checkpoint.processed
+            self.checkpoint.status = "running"
+            self.session.commit()
+            return True
+
+    def queued(self, document_id, depth):
+        """Add a document whose children will be listed to the frontier."""
+        with self._lock:
+            self.frontier[int(document_id)] = depth
+
+    def listed(self, document_id, children):
+        """
+        Move a listed document from the frontier, and make its children pending.
+
+        Args:
+            document_id: ID of the listed document
+            children (dict): Child document ID -> depth in the tree
+        """
+        with self._lock:
+            document_id = int(document_id)
+            self.frontier.pop(document_id, None)
+            self.listed_ids.add(document_id)
+            self._new_listed.add(document_id)
+            for child_id, depth in children.items():
+                self.pending[int(child_id)] = depth
+
+    def found(self, document_id, depth):
+        """Make a document pending."""
+        with self._lock:
+            self.pending[int(document_id)] = depth
+
+    def done(self, document_id):
+        """Mark a pending document as finished."""
+        with self._lock:
+            if self.pending.pop(int(document_id), None) is not None:
+                self.processed += 1
+
+    def save(self, status="running", flush=None):
+        """
+        Write the checkpoint.
+
+        Args:
+            status (str): "running", or "interrupted" for a sync stopped on purpose
+            flush: Optional function writing the sync records. It is called
+                after the state is copied, so every document saved as finished
+                has its sync record written
+        """
+        with self._lock:
+            frontier = dict(self.frontier)
+            pending = dict(self.pending)
+            processed = self.processed
+            new_listed = self._new_listed
+            self._new_listed = set()
+
+        try:
+            if flush is not None:
+                flush()
+
+            with self._lock:
+                checkpoint_id = self.checkpoint.id
+                self.session.execute(
+                    delete(SyncCheckpointItem).where(
+                        SyncCheckpointItem.checkpoint_id == checkpoint_id,
+                        SyncCheckpointItem.kind.in_(["frontier", "pending"]),
+                    )
+                )
+                rows = (
+                    [
+                        {
+                            "checkpoint_id": checkpoint_id,
+                            "kind": "frontier",
+                            "colibo_doc_id": document_id,
+                            "depth": depth,
+                        }
+                        for document_id, depth in frontier.items()
+                    ]
+                    + [
+                        {
+                            "checkpoint_id": checkpoint_id,
+                            "kind": "pending",
+                            "colibo_doc_id": document_id,
+                            "depth": depth,
+                        }
+                        for document_id, depth in pending.items()
+                    ]
+                    + [
+                        {
+                            "checkpoint_id": checkpoint_id,
+                            "kind": "listed",
+                            "colibo_doc_id": document_id,
+                            "depth": None,
+                        }
+                        for document_id in new_listed
+                    ]
+                )
+                if rows:
+                    self.session.execute(insert(SyncCheckpointItem), rows)
+
+                self.checkpoint.status = status
+                self.checkpoint.processed = processed
+                self.checkpoint.updated_at = datetime.now(timezone.utc)
+                self.session.commit()
+        except Exception:
+            with self._lock:
+                self.session.rollback()
+                # Written by the next save instead
+                self._new_listed |= new_listed
+            raise
+
+    def finish(self):
+        """Remove the checkpoint of a completed sync, or the unfinished one if none was started."""
+        with self._lock:
+            checkpoint = self.checkpoint or self._find()
+            if checkpoint is not None:
+                self._delete(checkpoint)
+                self.session.commit()
+                self.checkpoint = None
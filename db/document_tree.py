@@ -0,0 +1,250 @@
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, insert
+
+from .models import DocumentTreeNode, get_session
+
+
+class DocumentTreeManager:
+    """
+    The Colibo document tree found by the last crawl.
+
+    The crawler records every listing: the metadata of each child and the IDs
+    of the children of the listed document. With prune_unchanged, a folder
+    whose updated timestamp and child count are the same as in the last crawl
+    is not listed again, and its stored documents are counted as seen
+    instead. A change in a nested folder does not bump the timestamps of its
+    ancestors, so the stored child folders of an unchanged folder are still
+    fetched and checked one by one, see child_folders(). Neither does a change
+    in a linked document, so the documents an unchanged folder links to are
+    fetched again as well, see linked_children().
+
+    Decisions are always made against the tree as it was when the manager was
+    created. The new tree is kept in memory and only written by save(), which
+    must only be called after a complete crawl, so a crawl that stops halfway
+    never makes an unlisted branch look listed.
+    """
+
+    def __init__(self, prune_unchanged=False, session=None):
+        """
+        Initialize the tree.
+
+        Args:
+            prune_unchanged (bool): Skip listing folders that have not changed
+            session: Optional database session
+        """
+        self.session = session or get_session()
+        self.prune_unchanged = prune_unchanged
+
+        # Documents under pruned folders, found in the stored tree
+        self.pruned = set()
+        self.pruned_folders = 0
+        self.listings = 0
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._nodes = {
+            node.colibo_doc_id: self._to_row(node)
+            for node in self.session.query(DocumentTreeNode)
+        }
+
+    @staticmethod
+    def _to_row(node):
+        return {
+            "colibo_doc_id": node.colibo_doc_id,
+            "parent_id": node.parent_id,
+            "doctype": node.doctype,
+            "updated": node.updated,
+            "child_count": node.child_count,
+            "child_ids": (
+                [int(child_id) for child_id in node.child_ids.split(",")]
+                if node.child_ids
+                else []
+            ),
+            "listed_at": node.listed_at,
+        }
+
+    def _row(self, document_id):
+        """Get the pending row of a document, starting from the stored one."""
+        row = self._pending.get(document_id)
+        if row is None:
+            stored = self._nodes.get(document_id)
+            row = (
+                dict(stored, child_ids=list(stored["child_ids"]))
+                if stored
+                else {
+                    "colibo_doc_id": document_id,
+                    "parent_id": None,
+                    "doctype": None,
+                    "updated": None,
+                    "child_count": None,
+                    "child_ids": [],
+                    "listed_at": None,
+                }
+            )
+            self._pending[document_id] = row
+        return row
+
+    def record(self, document_id, parent_id, doctype, updated, child_count):
+        """Record the metadata of a document found in a listing."""
+        with self._lock:
+            row = self._row(int(document_id))
+            row.update(
+                parent_id=int(parent_id),
+                doctype=doctype,
+                updated=updated,
+                child_count=child_count,
+            )
+
+    def record_children(self, document_id, child_ids):
+        """Record the children of a listed document."""
+        with self._lock:
+            document_id = int(document_id)
+            row = self._row(document_id)
+            row["child_ids"] = [int(child_id) for child_id in child_ids]
+            row["listed_at"] = datetime.now(timezone.utc)
+            self.listings += 1
+
+            # Linked documents are not recorded with metadata, but still need
+            # a parent for invalidate()
+            for child_id in row["child_ids"]:
+                child = self._row(child_id)
+                if child["parent_id"] is None:
+                    child["parent_id"] = document_id
+
+    def prune(self, document_id, updated, child_count, include_self=False):
+        """
+        Check if the listing of a folder can be skipped.
+
+        The children of an unchanged folder that are not folders themselves
+        are added to pruned. Its child folders and linked documents are not,
+        they must be checked as well, see child_folders() and linked_children().
+
+        Args:
+            document_id: ID of the folder
+            updated: The updated timestamp of the folder, as returned by Colibo
+            child_count: The child count of the folder
+            include_self (bool): Also add the folder to pruned if it is
+                unchanged, for folders that are not yielded by the crawl
+
+        Returns:
+            True if the folder is unchanged
+        """
+        if not self.prune_unchanged or updated is None:
+            return False
+
+        with self._lock:
+            node = self._nodes.get(int(document_id))
+            if (
+                node is None
+                or node["listed_at"] is None
+                or node["updated"] != updated
+                or node["child_count"] != child_count
+            ):
+                return False
+
+            if include_self:
+                self.pruned.add(int(document_id))
+            for child_id in node["child_ids"]:
+                child = self._nodes.get(child_id)
+                if not self._is_linked(document_id, child) and not self._is_folder(
+                    child
+                ):
+                    self.pruned.add(child_id)
+
+            self.pruned_folders += 1
+            return True
+
+    @staticmethod
+    def _is_folder(node):
+        """Check if a stored document has children, linked documents have no doctype."""
+        return node is not None and bool(
+            node["doctype"] == "folder" or node["child_ids"] or node["child_count"]
+        )
+
+    @staticmethod
+    def _is_linked(document_id, node):
+        """Check if a stored child of a document is linked to, rather than in it."""
+        return (
+            node is None
+            or node["doctype"] is None
+            or node["parent_id"] != int(document_id)
+        )
+
+    def child_folders(self, document_id):
+        """Get the IDs of the stored child folders of a folder."""
+        with self._lock:
+            node = self._nodes.get(int(document_id))
+            if node is None:
+                return []
+            return [
+                child_id
+                for child_id in node["child_ids"]
+                if not self._is_linked(document_id, self._nodes.get(child_id))
+                and self._is_folder(self._nodes.get(child_id))
+            ]
+
+    def linked_children(self, document_id):
+        """Get the IDs of the stored documents a folder links to."""
+        with self._lock:
+            node = self._nodes.get(int(document_id))
+            if node is None:
+                return []
+            return [
+                child_id
+                for child_id in node["child_ids"]
+                if self._is_linked(document_id, self._nodes.get(child_id))
+            ]
+
+    def invalidate(self, document_id):
+        """
+        Make sure the next crawl lists the parents of a document again.
+
+        Used when a document failed to sync, so it is not hidden by an
+        unchanged folder on the next run.
+        """
+        with self._lock:
+            seen = set()
+            document_id = int(document_id)
+            while document_id is not None and document_id not in seen:
+                seen.add(document_id)
+                row = self._row(document_id)
+                row["listed_at"] = None
+                document_id = row["parent_id"]
+
+    def save(self):
+        """Write the recorded tree, call it only after a complete crawl."""
+        with self._lock:
+            rows = [
+                dict(row, child_ids=",".join(str(i) for i in row["child_ids"]))
+                for row in self._pending.values()
+            ]
+            for i in range(0, len(rows), 500):
+                chunk = rows[i : i + 500]
+                self.session.execute(
+                    delete(DocumentTreeNode).where(
+                        DocumentTreeNode.colibo_doc_id.in_(
+                            [row["colibo_doc_id"] for row in chunk]
+                        )
+                    )
+                )
+                self.session.execute(insert(DocumentTreeNode), chunk)
+            self.session.commit()
+            self._pending = {}
+
+    def clear(self):
+        """Forget the stored tree, so the next crawl lists every folder."""
+        with self._lock:
+            self.session.query(DocumentTreeNode).delete()
+            self.session.commit()
+            self._nodes = {}
+            self._pending = {}
+
+    def stats(self):
+        """Get the listing and pruning counters of this run."""
+        return {
+            "listings": self.listings,
+            "pruned_folders": self.pruned_folders,
+            "pruned_documents": len(self.pruned),
+        }
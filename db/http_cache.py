@@ -0,0 +1,231 @@
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, insert, update
+
+from .models import HttpCache, get_session
+
+
+class HttpCacheManager:
+    """
+    Disk-backed cache of API responses, revalidated with conditional requests.
+
+    Responses with an ETag or Last-Modified header are stored with their
+    validators. The next request for the same URL sends If-None-Match and
+    If-Modified-Since, and when the server answers 304 Not Modified the stored
+    body is used instead of downloading it again. The validators of all entries
+    are loaded when the cache is opened, so only 304 responses read from the
+    database. The most recently used bodies are also kept decoded in memory, so
+    a 304 for them is answered without reading or parsing anything. New entries
+    and usage timestamps are written in batches, call flush() before exiting.
+    """
+
+    # Number of queued writes that triggers a flush
+    FLUSH_SIZE = 100
+    # Number of decoded bodies kept in memory
+    DECODED_SIZE = 1024
+
+    def __init__(self, max_size=256 * 1024 * 1024, session=None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size (int): Maximum size of the cached bodies in bytes
+            session: Optional database session
+        """
+        self.session = session or get_session()
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+        self._lock = threading.Lock()
+        self._new = {}
+        self._used = set()
+        # (URL, etag, last_modified) -> (decoded body, size), least recently used first
+        self._decoded = OrderedDict()
+
+        # URL -> (etag, last_modified)
+        self._validators = {
+            url: (etag, last_modified)
+            for url, etag, last_modified in self.session.query(
+                HttpCache.url, HttpCache.etag, HttpCache.last_modified
+            )
+        }
+        self.size = self.session.query(
+            func.coalesce(func.sum(HttpCache.size), 0)
+        ).scalar()
+
+    def conditional_headers(self, url):
+        """
+        Get the headers that make a request for the URL conditional.
+
+        Returns:
+            dict with If-None-Match and/or If-Modified-Since, empty if the URL is not cached
+        """
+        with self._lock:
+            etag, last_modified = self._validators.get(url, (None, None))
+
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def not_modified(self, url):
+        """
+        Get the cached body after the server answered 304 Not Modified.
+
+        Returns:
+            The decoded JSON body, or None if the URL is not cached. It is
+            shared with other calls, and must not be modified
+        """
+        with self._lock:
+            key = (url, *self._validators.get(url, (None, None)))
+            decoded = self._decoded.get(key)
+            if decoded is not None:
+                self._decoded.move_to_end(key)
+                data, size = decoded
+            else:
+                body = self._new.get(url, {}).get("body")
+                if body is None:
+                    body = (
+                        self.session.query(HttpCache.body).filter_by(url=url).scalar()
+                    )
+                if body is None:
+                    return None
+                data = None
+                size = len(body.encode("utf-8"))
+
+            self.hits += 1
+            self.bytes_saved += size
+            self._used.add(url)
+            self._flush_if_needed()
+
+        if data is None:
+            data = json.loads(body)
+            with self._lock:
+                self._remember(key, data, size)
+        return data
+
+    def _remember(self, key, data, size):
+        """Keep a decoded body in memory, forgetting the least recently used one."""
+        self._decoded[key] = (data, size)
+        self._decoded.move_to_end(key)
+        if len(self._decoded) > self.DECODED_SIZE:
+            self._decoded.popitem(last=False)
+
+    def store(self, url, headers, body, data=None):
+        """
+        Cache a full (200) response, if it has validators.
+
+        Args:
+            url (str): The requested URL
+            headers: The response headers
+            body (str): The response body
+            data: Optional decoded body, kept in memory for not_modified()
+        """
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+
+        with self._lock:
+            self.misses += 1
+            if not etag and not last_modified:
+                return
+
+            self._validators[url] = (etag, last_modified)
+            self._new[url] = {
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "body": body,
+                "size": len(body.encode("utf-8")),
+            }
+            if data is not None:
+                self._remember((url, etag, last_modified), data, self._new[url]["size"])
+            self._flush_if_needed()
+
+    def _flush_if_needed(self):
+        if len(self._new) + len(self._used) >= self.FLUSH_SIZE:
+            self._flush()
+
+    def flush(self):
+        """Write new entries and usage timestamps, and evict old entries."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        now = datetime.now(timezone.utc)
+
+        if self._new:
+            # Changed responses replace the entry stored for the URL
+            urls = list(self._new)
+            old_sizes = dict(
+                self.session.query(HttpCache.url, HttpCache.size).filter(
+                    HttpCache.url.in_(urls)
+                )
+            )
+            self.session.execute(delete(HttpCache).where(HttpCache.url.in_(urls)))
+            self.session.execute(
+                insert(HttpCache),
+                [dict(row, last_used=now) for row in self._new.values()],
+            )
+            self.size += sum(row["size"] for row in self._new.values())
+            self.size -= sum(old_sizes.values())
+            self._used.difference_update(self._new)
+            self._new = {}
+
+        if self._used:
+            self.session.execute(
+                update(HttpCache)
+                .where(HttpCache.url.in_(list(self._used)))
+                .values(last_used=now)
+            )
+            self._used = set()
+
+        self._evict()
+        self.session.commit()
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits max_size."""
+        if self.size <= self.max_size:
+            return
+
+        evict = []
+        freed = 0
+        entries = (
+            self.session.query(HttpCache.url, HttpCache.size)
+            .order_by(HttpCache.last_used)
+            .all()
+        )
+        for url, size in entries:
+            evict.append(url)
+            freed += size
+            if self.size - freed <= self.max_size:
+                break
+
+        for i in range(0, len(evict), 500):
+            self.session.execute(
+                delete(HttpCache).where(HttpCache.url.in_(evict[i : i + 500]))
+            )
+        for url in evict:
+            self._validators.pop(url, None)
+        self.size -= freed
+        self.evictions += len(evict)
+
+    def stats(self):
+        """Get the hit and miss counters of this run."""
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "evictions": self.evictions,
+            "size": self.size,
+        }
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, insert, update
+
+from .models import MarkdownCache, get_session
+
+
+class MarkdownCacheManager:
+    """
+    Disk-backed cache of HTML to Markdown conversions.
+
+    Entries are keyed by a digest of the cleaned HTML and the converter
+    settings. Entries made with other settings are removed when the cache is
+    opened, and the least recently used entries are evicted when the cache
+    grows beyond max_size bytes. New entries and usage timestamps are written
+    in batches, call flush() before exiting.
+    """
+
+    # Number of queued writes that triggers a flush
+    FLUSH_SIZE = 100
+
+    def __init__(self, options, max_size=256 * 1024 * 1024, session=None):
+        """
+        Initialize the cache.
+
+        Args:
+            options (dict): Converter settings, entries made with other settings are dropped
+            max_size (int): Maximum size of the cached Markdown in bytes
+            session: Optional database session
+        """
+        self.session = session or get_session()
+        self.max_size = max_size
+        self.options_digest = hashlib.sha256(
+            json.dumps(options, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._new = {}
+        self._used = set()
+
+        # Invalidate entries made with other converter settings
+        self.session.execute(
+            delete(MarkdownCache).where(
+                MarkdownCache.options_digest != self.options_digest
+            )
+        )
+        self.session.commit()
+        self.size = self.session.query(
+            func.coalesce(func.sum(MarkdownCache.size), 0)
+        ).scalar()
+
+    def _digest(self, html):
+        return hashlib.sha256((self.options_digest + html).encode("utf-8")).hexdigest()
+
+    def get(self, html):
+        """
+        Get the cached Markdown for some cleaned HTML.
+
+        Returns:
+            The Markdown, or None if it is not cached
+        """
+        digest = self._digest(html)
+        with self._lock:
+            markdown = self._new.get(digest)
+            if markdown is None:
+                markdown = (
+                    self.session.query(MarkdownCache.markdown)
+                    .filter_by(digest=digest)
+                    .scalar()
+                )
+
+            if markdown is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._used.add(digest)
+            self._flush_if_needed()
+            return markdown
+
+    def put(self, html, markdown):
+        """Cache the Markdown converted from some cleaned HTML."""
+        if markdown is None:
+            return
+
+        with self._lock:
+            self._new[self._digest(html)] = markdown
+            self._flush_if_needed()
+
+    def _flush_if_needed(self):
+        if len(self._new) + len(self._used) >= self.FLUSH_SIZE:
+            self._flush()
+
+    def flush(self):
+        """Write new entries and usage timestamps, and evict old entries."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        now = datetime.now(timezone.utc)
+
+        if self._new:
+            # Another process may have cached the same conversion in the meantime
+            existing = {
+                digest
+                for (digest,) in self.session.query(MarkdownCache.digest).filter(
+                    MarkdownCache.digest.in_(list(self._new))
+                )
+            }
+            rows = [
+                {
+                    "digest": digest,
+                    "options_digest": self.options_digest,
+                    "markdown": markdown,
+                    "size": len(markdown.encode("utf-8")),
+                    "last_used": now,
+                }
+                for digest, markdown in self._new.items()
+                if digest not in existing
+            ]
+            if rows:
+                self.session.execute(insert(MarkdownCache), rows)
+                self.size += sum(row["size"] for row in rows)
+            self._new = {}
+
+        if self._used:
+            self.session.execute(
+                update(MarkdownCache)
+                .where(MarkdownCache.digest.in_(list(self._used)))
+                .values(last_used=now)
+            )
+            self._used = set()
+
+        self._evict()
+        self.session.commit()
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits max_size."""
+        if self.size <= self.max_size:
+            return
+
+        evict = []
+        freed = 0
+        entries = (
+            self.session.query(MarkdownCache.digest, MarkdownCache.size)
+            .order_by(MarkdownCache.last_used)
+            .all()
+        )
+        for digest, size in entries:
+            evict.append(digest)
+            freed += size
+            if self.size - freed <= self.max_size:
+                break
+
+        for i in range(0, len(evict), 500):
+            self.session.execute(
+                delete(MarkdownCache).where(
+                    MarkdownCache.digest.in_(evict[i : i + 500])
+                )
+            )
+        self.size -= freed
+        self.evictions += len(evict)
+
+    def stats(self):
+        """Get the hit and miss counters of this run."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": self.size,
+        }
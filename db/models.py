@@ -1,7 +1,17 @@
 # db/models.py
 import os
 from datetime import datetime, timezone, timedelta
-from sqlalchemy import Column, Integer, String, DateTime, Text, create_engine
+from sqlalchemy import (
+    Column,
+    Integer,
+    String,
+    DateTime,
+    Text,
+    UniqueConstraint,
+    create_engine,
+    inspect,
+    text,
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -12,12 +22,21 @@ class SyncedDocument(Base):
     """Model to track synced documents between Colibo and OpenWebUI."""
 
     __tablename__ = "synced_documents"
+    # A document can be synced to several knowledge bases
+    __table_args__ = (UniqueConstraint("colibo_doc_id", "knowledge_id"),)
 
     id = Column(Integer, primary_key=True)
-    colibo_doc_id = Column(Integer, nullable=False, unique=True, index=True)
+    colibo_doc_id = Column(Integer, nullable=False, index=True)
     webui_doc_id = Column(String, nullable=False)
     knowledge_id = Column(String, nullable=False)
     last_synced = Column(DateTime, nullable=False)
+    # SHA-256 of the content uploaded to Open-WebUI, see helpers.content_digest()
+    content_hash = Column(String(64), nullable=True)
+    # The last sync that saw the document in Colibo, see SyncManager.mark_seen()
+    generation = Column(Integer, nullable=True)
+    # The root document whose crawl last found the document, a sync only
+    # removes the unseen documents of the roots it crawled
+    root_doc_id = Column(Integer, nullable=True, index=True)
 
     def __repr__(self):
         return f"<SyncedDocument(colibo_id={self.colibo_doc_id}, webui_id={self.webui_doc_id})>"
@@ -33,6 +52,8 @@ class TokenCache(Base):
     access_token = Column(Text, nullable=False)
     expires_at = Column(DateTime, nullable=False)
     created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    # Set while a process fetches a new token, see TokenManager
+    refreshing_until = Column(DateTime, nullable=True)
 
     def is_valid(self, buffer_seconds=60):
         """Check if the token is still valid with a safety buffer."""
@@ -44,6 +65,128 @@ class TokenCache(Base):
         return now < expires - timedelta(seconds=buffer_seconds)
 
 
+class MarkdownCache(Base):
+    """Model to cache HTML to Markdown conversions."""
+
+    __tablename__ = "markdown_cache"
+
+    # Digest of the cleaned HTML and the converter settings
+    digest = Column(String(64), primary_key=True)
+    # Digest of the converter settings only, used to drop outdated entries
+    options_digest = Column(String(64), nullable=False, index=True)
+    markdown = Column(Text, nullable=False)
+    size = Column(Integer, nullable=False)
+    last_used = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<MarkdownCache(digest={self.digest}, size={self.size})>"
+
+
+class HttpCache(Base):
+    """Model to cache API responses that can be revalidated with the server."""
+
+    __tablename__ = "http_cache"
+
+    url = Column(String, primary_key=True)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    # The response body as received, decoded again when the server answers 304
+    body = Column(Text, nullable=False)
+    size = Column(Integer, nullable=False)
+    last_used = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<HttpCache(url={self.url}, etag={self.etag}, size={self.size})>"
+
+
+class DocumentTreeNode(Base):
+    """Model to store the Colibo document tree found by the last crawl."""
+
+    __tablename__ = "document_tree"
+
+    colibo_doc_id = Column(Integer, primary_key=True)
+    parent_id = Column(Integer, nullable=True, index=True)
+    doctype = Column(String, nullable=True)
+    # The updated timestamp as returned by Colibo
+    updated = Column(String, nullable=True)
+    child_count = Column(Integer, nullable=True)
+    # Comma separated IDs of the children, linked documents instead of links
+    child_ids = Column(Text, nullable=True)
+    # When the children were listed, None if they have not been listed
+    listed_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<DocumentTreeNode(colibo_id={self.colibo_doc_id}, parent_id={self.parent_id})>"
+
+
+class SyncCheckpoint(Base):
+    """Model to store the progress of a sync, so it can be resumed."""
+
+    __tablename__ = "sync_checkpoints"
+
+    id = Column(Integer, primary_key=True)
+    root_doc_id = Column(String, nullable=False)
+    knowledge_id = Column(String, nullable=False)
+    # "running" while the sync runs (or if it died), "interrupted" if it was stopped
+    status = Column(String, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    # Number of documents finished before the last save
+    processed = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<SyncCheckpoint(root_doc_id={self.root_doc_id}, status={self.status})>"
+
+
+class SyncCheckpointItem(Base):
+    """Model to store the crawl frontier, listed documents and pending documents of a checkpoint."""
+
+    __tablename__ = "sync_checkpoint_items"
+
+    id = Column(Integer, primary_key=True)
+    checkpoint_id = Column(Integer, nullable=False, index=True)
+    # "frontier", "listed" or "pending"
+    kind = Column(String, nullable=False)
+    colibo_doc_id = Column(Integer, nullable=False)
+    # Depth of a frontier or pending document in the tree
+    depth = Column(Integer, nullable=True)
+
+
+class SyncRun(Base):
+    """Model to keep the history of sync runs, see db:runs."""
+
+    __tablename__ = "sync_runs"
+
+    id = Column(Integer, primary_key=True)
+    # Comma separated when a run syncs several targets, see sync:config
+    root_doc_id = Column(String, nullable=False, index=True)
+    knowledge_id = Column(String, nullable=False)
+    # "running" while the sync runs (or if it died), "completed", "interrupted"
+    # (stopped by the user or by --max-duration) or "failed"
+    status = Column(String, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    processed = Column(Integer, nullable=False, default=0)
+    new = Column(Integer, nullable=False, default=0)
+    updated = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    # Size of the content uploaded to Open-WebUI
+    uploaded_bytes = Column(Integer, nullable=False, default=0)
+    # JSON object of the seconds the workers of each pipeline stage were busy
+    stage_seconds = Column(Text, nullable=True)
+
+    @property
+    def duration(self):
+        """Seconds the run took, None if it has not finished."""
+        if self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    def __repr__(self):
+        return f"<SyncRun(id={self.id}, root_doc_id={self.root_doc_id}, status={self.status})>"
+
+
 def get_session(engine=None):
     """Create and return a session factory bound to the engine."""
     if engine is None:
@@ -62,8 +205,71 @@ def get_engine():
     return create_engine(get_database_path())
 
 
+def migrate_db(engine):
+    """Add columns that are missing in tables created by an older version."""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    )
+                )
+
+    migrate_synced_documents(engine)
+
+
+def migrate_synced_documents(engine):
+    """
+    Rebuild synced_documents if colibo_doc_id is unique on its own.
+
+    Older versions allowed a document in one knowledge base only, the unique
+    index cannot be changed in place in SQLite.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table("synced_documents"):
+        return
+
+    indexes = inspector.get_indexes("synced_documents")
+    if not any(
+        index["unique"] and index["column_names"] == ["colibo_doc_id"]
+        for index in indexes
+    ) and not any(
+        constraint["column_names"] == ["colibo_doc_id"]
+        for constraint in inspector.get_unique_constraints("synced_documents")
+    ):
+        return
+
+    table = SyncedDocument.__table__
+    columns = ", ".join(column.name for column in table.columns)
+    with engine.begin() as connection:
+        connection.execute(
+            text("ALTER TABLE synced_documents RENAME TO synced_documents_old")
+        )
+        # Index names are global, and were kept by the renamed table
+        for index in indexes:
+            connection.execute(text(f"DROP INDEX {index['name']}"))
+        table.create(connection)
+        connection.execute(
+            text(
+                f"INSERT INTO synced_documents ({columns}) "
+                f"SELECT {columns} FROM synced_documents_old"
+            )
+        )
+        connection.execute(text("DROP TABLE synced_documents_old"))
+
+
 def init_db():
     """Initialize the database, creating tables if they don't exist."""
     engine = get_engine()
     Base.metadata.create_all(engine)
+    migrate_db(engine)
     return engine
@@ -1,65 +1,446 @@
-# db/sync_manager.py
+import contextlib
+import logging
+import threading
 from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, insert, or_, update
+
 from .models import SyncedDocument, get_session
 
+logger = logging.getLogger(__name__)
+
 
 class SyncManager:
     """Manager class for document synchronization operations."""
 
+    # Maximum number of ids in a single IN (...) clause
+    QUERY_CHUNK_SIZE = 500
+
     def __init__(self, session=None):
         """Initialize with an optional session."""
         self.session = session or get_session()
 
-    def record_sync(self, colibo_doc_id, knowledge_id, webui_doc_id: str = None):
-        """Record a new sync or update an existing record."""
-        doc = (
-            self.session.query(SyncedDocument)
-            .filter_by(colibo_doc_id=colibo_doc_id, knowledge_id=knowledge_id)
-            .first()
+        # The session is shared, so all access to it goes through this lock.
+        self._lock = threading.RLock()
+
+        # In-memory index of synced documents per knowledge base, see load_index()
+        self._indexes = {}
+
+        # Write-behind queue used in batch mode, see batch()
+        self._batching = False
+        self._batch_size = None
+        self._pending = {}
+
+    @staticmethod
+    def _index_key(colibo_doc_id):
+        """Colibo ids may be given as strings (e.g. from the command line)."""
+        return int(colibo_doc_id)
+
+    def _indexed(self, knowledge_id):
+        """Check if lookups for the knowledge base can be answered from the index."""
+        return knowledge_id in self._indexes
+
+    def _remember(self, doc):
+        """Store a detached copy of a document in the index."""
+        if not self._indexed(doc.knowledge_id):
+            return
+
+        # The database gives naive UTC timestamps back, so the index does too.
+        last_synced = doc.last_synced
+        if last_synced is not None and last_synced.tzinfo is not None:
+            last_synced = last_synced.astimezone(timezone.utc).replace(tzinfo=None)
+
+        # Copies are never attached to the session, so reading them does not
+        # trigger any queries, even after the session has been committed.
+        self._indexes[doc.knowledge_id][self._index_key(doc.colibo_doc_id)] = (
+            SyncedDocument(
+                id=doc.id,
+                colibo_doc_id=doc.colibo_doc_id,
+                webui_doc_id=doc.webui_doc_id,
+                knowledge_id=doc.knowledge_id,
+                last_synced=last_synced,
+                content_hash=doc.content_hash,
+                generation=doc.generation,
+                root_doc_id=doc.root_doc_id,
+            )
         )
 
-        if doc:
-            # Update existing record
-            if webui_doc_id is not None:
-                doc.webui_doc_id = webui_doc_id
-            doc.last_synced = datetime.now(timezone.utc)
-        else:
-            # Create a new record
-            doc = SyncedDocument(
-                colibo_doc_id=colibo_doc_id,
-                webui_doc_id=webui_doc_id,
-                knowledge_id=knowledge_id,
-                last_synced=datetime.now(timezone.utc),
+    def load_index(self, knowledge_id):
+        """
+        Load all synced documents for a knowledge base with a single query.
+
+        Later calls to get_document() for the knowledge base are answered from
+        memory, and the index is kept up to date by record_sync() and
+        delete_document().
+
+        Args:
+            knowledge_id (str): The knowledge base to load documents for
+
+        Returns:
+            Number of documents loaded
+        """
+        with self._lock:
+            docs = self.session.query(SyncedDocument).filter_by(
+                knowledge_id=knowledge_id
             )
-            self.session.add(doc)
 
+            self._indexes[knowledge_id] = {}
+            for doc in docs:
+                self._remember(doc)
+
+            return len(self._indexes[knowledge_id])
+
+    @contextlib.contextmanager
+    def batch(self, size=100, interval=5.0):
+        """
+        Queue sync records and write them in bulk instead of one commit each.
+
+        Records are flushed when size records are queued, every interval
+        seconds, and when the context exits, also when it exits with an error.
+
+        Args:
+            size (int): Number of queued records that triggers a flush
+            interval (float): Maximum number of seconds between flushes
+        """
+        with self._lock:
+            self._batching = True
+            self._batch_size = size
+
+        stop = threading.Event()
+
+        def flush_periodically():
+            while not stop.wait(interval):
+                try:
+                    self.flush()
+                except Exception:
+                    # Records stay queued and are retried on the next flush.
+                    logger.exception("Failed to flush sync records")
+
+        flusher = threading.Thread(
+            target=flush_periodically, name="sync-manager-flush", daemon=True
+        )
+        flusher.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            flusher.join()
+            with self._lock:
+                self._batching = False
+                self.flush()
+
+    def flush(self):
+        """
+        Write all queued sync records in one transaction.
+
+        Returns:
+            Number of records written
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+
+            pending, self._pending = self._pending, {}
+            try:
+                self._write(list(pending.values()))
+            except Exception:
+                self.session.rollback()
+                # Put the records back, keeping anything queued in the meantime.
+                pending.update(self._pending)
+                self._pending = pending
+                raise
+
+            return len(pending)
+
+    def _write(self, records):
+        """Bulk upsert sync records."""
+        # Find the rows that already exist
+        existing = {}
+        for knowledge_id in {record["knowledge_id"] for record in records}:
+            ids = [
+                record["colibo_doc_id"]
+                for record in records
+                if record["knowledge_id"] == knowledge_id
+            ]
+            for i in range(0, len(ids), self.QUERY_CHUNK_SIZE):
+                rows = self.session.query(
+                    SyncedDocument.id, SyncedDocument.colibo_doc_id
+                ).filter(
+                    SyncedDocument.knowledge_id == knowledge_id,
+                    SyncedDocument.colibo_doc_id.in_(
+                        ids[i : i + self.QUERY_CHUNK_SIZE]
+                    ),
+                )
+                for row_id, colibo_doc_id in rows:
+                    existing[(colibo_doc_id, knowledge_id)] = row_id
+
+        updates = []
+        inserts = []
+        for record in records:
+            row_id = existing.get((record["colibo_doc_id"], record["knowledge_id"]))
+            if row_id is None:
+                inserts.append(record)
+            else:
+                # Only overwrite the values that were given to record_sync()
+                values = {
+                    key: value for key, value in record.items() if value is not None
+                }
+                updates.append({**values, "id": row_id})
+
+        if inserts:
+            self.session.execute(insert(SyncedDocument), inserts)
+        if updates:
+            self.session.execute(update(SyncedDocument), updates)
         self.session.commit()
+
+    def record_sync(
+        self,
+        colibo_doc_id,
+        knowledge_id,
+        webui_doc_id: str = None,
+        content_hash: str = None,
+    ):
+        """Record a new sync or update an existing record."""
+        with self._lock:
+            if self._batching:
+                return self._queue_sync(
+                    colibo_doc_id, knowledge_id, webui_doc_id, content_hash
+                )
+
+            doc = (
+                self.session.query(SyncedDocument)
+                .filter_by(colibo_doc_id=colibo_doc_id, knowledge_id=knowledge_id)
+                .first()
+            )
+
+            if doc:
+                # Update existing record
+                if webui_doc_id is not None:
+                    doc.webui_doc_id = webui_doc_id
+                if content_hash is not None:
+                    doc.content_hash = content_hash
+                doc.last_synced = datetime.now(timezone.utc)
+            else:
+                # Create a new record
+                doc = SyncedDocument(
+                    colibo_doc_id=colibo_doc_id,
+                    webui_doc_id=webui_doc_id,
+                    knowledge_id=knowledge_id,
+                    last_synced=datetime.now(timezone.utc),
+                    content_hash=content_hash,
+                )
+                self.session.add(doc)
+
+            self.session.commit()
+            self._remember(doc)
+            return doc
+
+    def _queue_sync(self, colibo_doc_id, knowledge_id, webui_doc_id, content_hash):
+        """Queue a sync record for the next flush."""
+        colibo_doc_id = self._index_key(colibo_doc_id)
+        key = (colibo_doc_id, knowledge_id)
+
+        # Later records for the same document only overwrite the given values
+        record = self._pending.setdefault(
+            key,
+            {
+                "colibo_doc_id": colibo_doc_id,
+                "knowledge_id": knowledge_id,
+                "webui_doc_id": None,
+                "content_hash": None,
+            },
+        )
+        if webui_doc_id is not None:
+            record["webui_doc_id"] = webui_doc_id
+        if content_hash is not None:
+            record["content_hash"] = content_hash
+        record["last_synced"] = datetime.now(timezone.utc)
+
+        # Keep the index in line with what will be written
+        previous = (
+            self._indexes[knowledge_id].get(colibo_doc_id)
+            if self._indexed(knowledge_id)
+            else None
+        )
+        doc = SyncedDocument(
+            id=previous.id if previous else None,
+            colibo_doc_id=colibo_doc_id,
+            webui_doc_id=record["webui_doc_id"]
+            or (previous.webui_doc_id if previous else None),
+            knowledge_id=knowledge_id,
+            last_synced=record["last_synced"],
+            content_hash=record["content_hash"]
+            or (previous.content_hash if previous else None),
+        )
+        self._remember(doc)
+
+        if len(self._pending) >= self._batch_size:
+            self.flush()
+
         return doc
 
     def delete_document(self, colibo_doc_id, knowledge_id):
         """Permanently delete a document from the database."""
-        doc = (
-            self.session.query(SyncedDocument)
-            .filter_by(colibo_doc_id=colibo_doc_id, knowledge_id=knowledge_id)
-            .first()
-        )
-        if doc:
-            self.session.delete(doc)
+        with self._lock:
+            self._pending.pop((self._index_key(colibo_doc_id), knowledge_id), None)
+            doc = (
+                self.session.query(SyncedDocument)
+                .filter_by(colibo_doc_id=colibo_doc_id, knowledge_id=knowledge_id)
+                .first()
+            )
+            if doc:
+                self.session.delete(doc)
+                self.session.commit()
+            if self._indexed(knowledge_id):
+                self._indexes[knowledge_id].pop(self._index_key(colibo_doc_id), None)
+            return doc
+
+    def delete_documents(self, colibo_doc_ids, knowledge_id):
+        """
+        Permanently delete documents from the database in bulk.
+
+        Returns:
+            Number of documents deleted
+        """
+        ids = [self._index_key(colibo_doc_id) for colibo_doc_id in colibo_doc_ids]
+        with self._lock:
+            for colibo_doc_id in ids:
+                self._pending.pop((colibo_doc_id, knowledge_id), None)
+
+            deleted = 0
+            for i in range(0, len(ids), self.QUERY_CHUNK_SIZE):
+                result = self.session.execute(
+                    delete(SyncedDocument).where(
+                        SyncedDocument.knowledge_id == knowledge_id,
+                        SyncedDocument.colibo_doc_id.in_(
+                            ids[i : i + self.QUERY_CHUNK_SIZE]
+                        ),
+                    )
+                )
+                deleted += result.rowcount
             self.session.commit()
-        return doc
+
+            if self._indexed(knowledge_id):
+                for colibo_doc_id in ids:
+                    self._indexes[knowledge_id].pop(colibo_doc_id, None)
+            return deleted
+
+    def next_generation(self, knowledge_id):
+        """Get the generation number for the next sync of a knowledge base."""
+        with self._lock:
+            self.flush()
+            generation = (
+                self.session.query(func.max(SyncedDocument.generation))
+                .filter_by(knowledge_id=knowledge_id)
+                .scalar()
+            )
+            return (generation or 0) + 1
+
+    def mark_seen(self, colibo_doc_ids, knowledge_id, generation, root_doc_id=None):
+        """
+        Tag the documents a sync has seen in Colibo with its generation.
+
+        Args:
+            colibo_doc_ids: IDs of the documents seen
+            knowledge_id (str): The knowledge base of the documents
+            generation (int): Generation of the sync, see next_generation()
+            root_doc_id: The root whose crawl found the documents, which then
+                owns them. The owner is kept if not given.
+
+        Returns:
+            Number of documents tagged
+        """
+        ids = [self._index_key(colibo_doc_id) for colibo_doc_id in colibo_doc_ids]
+        values = {"generation": generation}
+        if root_doc_id is not None:
+            values["root_doc_id"] = self._index_key(root_doc_id)
+        with self._lock:
+            self.flush()
+            marked = 0
+            for i in range(0, len(ids), self.QUERY_CHUNK_SIZE):
+                result = self.session.execute(
+                    update(SyncedDocument)
+                    .where(
+                        SyncedDocument.knowledge_id == knowledge_id,
+                        SyncedDocument.colibo_doc_id.in_(
+                            ids[i : i + self.QUERY_CHUNK_SIZE]
+                        ),
+                    )
+                    .values(**values)
+                )
+                marked += result.rowcount
+            self.session.commit()
+            if self._indexed(knowledge_id):
+                index = self._indexes[knowledge_id]
+                for colibo_doc_id in ids:
+                    doc = index.get(colibo_doc_id)
+                    if doc is not None:
+                        doc.generation = generation
+                        doc.root_doc_id = values.get("root_doc_id", doc.root_doc_id)
+            return marked
+
+    def _owned_by(self, root_doc_ids):
+        """Filter on the documents owned by the given roots, see mark_seen()."""
+        return SyncedDocument.root_doc_id.in_(
+            [self._index_key(root_doc_id) for root_doc_id in root_doc_ids]
+        )
+
+    def get_unseen_documents(self, knowledge_id, generation, root_doc_ids):
+        """
+        Get the documents of the roots in a knowledge base that the sync of a generation did not see.
+
+        Documents of other roots synced to the same knowledge base, and
+        documents without an owner (synced by an older version and not seen
+        since), are left out.
+        """
+        with self._lock:
+            self.flush()
+            return (
+                self.session.query(SyncedDocument)
+                .filter(
+                    SyncedDocument.knowledge_id == knowledge_id,
+                    self._owned_by(root_doc_ids),
+                    or_(
+                        SyncedDocument.generation.is_(None),
+                        SyncedDocument.generation != generation,
+                    ),
+                )
+                .all()
+            )
+
+    def count_documents(self, knowledge_id, root_doc_ids=None):
+        """Count the synced documents of a knowledge base, or those owned by some roots in it."""
+        with self._lock:
+            self.flush()
+            query = self.session.query(func.count(SyncedDocument.id)).filter(
+                SyncedDocument.knowledge_id == knowledge_id
+            )
+            if root_doc_ids is not None:
+                query = query.filter(self._owned_by(root_doc_ids))
+            return query.scalar()
 
     def get_document(self, colibo_doc_id, knowledge_id):
         """Get a synced document by Colibo ID."""
-        return (
-            self.session.query(SyncedDocument)
-            .filter_by(colibo_doc_id=colibo_doc_id, knowledge_id=knowledge_id)
-            .first()
-        )
+        with self._lock:
+            if self._indexed(knowledge_id):
+                return self._indexes[knowledge_id].get(self._index_key(colibo_doc_id))
+
+            # Make queued records visible to the query
+            self.flush()
+            return (
+                self.session.query(SyncedDocument)
+                .filter_by(colibo_doc_id=colibo_doc_id, knowledge_id=knowledge_id)
+                .first()
+            )
 
-    def get_all_documents(self):
-        """Get all synced documents."""
-        query = self.session.query(SyncedDocument)
-        return query.all()
+    def get_all_documents(self, knowledge_id=None):
+        """Get all synced documents, or those of a knowledge base."""
+        with self._lock:
+            self.flush()
+            query = self.session.query(SyncedDocument)
+            if knowledge_id is not None:
+                query = query.filter_by(knowledge_id=knowledge_id)
+            return query.all()
 
     def get_webui_id(self, colibo_doc_id, knowledge_id: str = None):
         """Get WebUI document ID for a given Colibo document ID."""
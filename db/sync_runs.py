@@ -0,0 +1,108 @@
+import json
+import statistics
+from datetime import datetime, timezone
+
+from .models import SyncRun, get_session
+
+
+class SyncRunManager:
+    """
+    History of the sync runs, to follow their performance over time.
+
+    A run is saved as "running" when it starts and updated when it ends, so
+    runs that died show up as still running.
+    """
+
+    def __init__(self, session=None):
+        """Initialize with an optional session."""
+        self.session = session or get_session()
+        self.run = None
+
+    def start(self, targets):
+        """
+        Save the start of a run.
+
+        Args:
+            targets (list): (root document ID, knowledge base ID) tuples
+        """
+        roots = dict.fromkeys(str(root_doc_id) for root_doc_id, _ in targets)
+        knowledge_ids = dict.fromkeys(knowledge_id for _, knowledge_id in targets)
+        self.run = SyncRun(
+            root_doc_id=",".join(roots),
+            knowledge_id=",".join(knowledge_ids),
+            status="running",
+            started_at=datetime.now(timezone.utc),
+        )
+        self.session.add(self.run)
+        self.session.commit()
+
+    def finish(self, status, counts, uploaded_bytes=0, stats=()):
+        """
+        Save the end of the run.
+
+        Args:
+            status (str): "completed", "interrupted" or "failed"
+            counts: The document counts of the pipeline
+            uploaded_bytes (int): Size of the content uploaded to Open-WebUI
+            stats (list): The statistics of the pipeline stages
+        """
+        run = self.run
+        run.status = status
+        run.finished_at = datetime.now(timezone.utc)
+        for outcome in ("processed", "new", "updated", "skipped", "failed"):
+            setattr(run, outcome, counts[outcome])
+        run.uploaded_bytes = uploaded_bytes
+        run.stage_seconds = json.dumps(
+            {stage["name"]: round(stage["busy"], 3) for stage in stats}
+        )
+        self.session.commit()
+
+    def get_runs(self, root_doc_id=None, knowledge_id=None):
+        """Get the runs, oldest first, optionally of a root document or knowledge base only."""
+        query = self.session.query(SyncRun)
+        if root_doc_id is not None:
+            query = query.filter_by(root_doc_id=str(root_doc_id))
+        if knowledge_id is not None:
+            query = query.filter_by(knowledge_id=knowledge_id)
+        return query.order_by(SyncRun.id).all()
+
+
+def stage_seconds(run):
+    """Get the busy seconds per stage of a run."""
+    return json.loads(run.stage_seconds) if run.stage_seconds else {}
+
+
+def compare_runs(runs, window=5):
+    """
+    Compare each run with the median of the runs before it.
+
+    Only completed runs of the same roots and knowledge bases are compared,
+    as incomplete runs did not do the whole work.
+
+    Args:
+        runs (list): Runs, oldest first, see SyncRunManager.get_runs()
+        window (int): Number of completed runs the median is taken from
+
+    Returns:
+        Dict of run ID -> (median duration, {stage: median busy seconds}), or
+        None for runs without completed runs before them
+    """
+    previous = {}
+    medians = {}
+    for run in runs:
+        key = (run.root_doc_id, run.knowledge_id)
+        before = previous.setdefault(key, [])[-window:]
+        if before:
+            stages = {}
+            for other in before:
+                for name, seconds in stage_seconds(other).items():
+                    stages.setdefault(name, []).append(seconds)
+            medians[run.id] = (
+                statistics.median(other.duration for other in before),
+                {name: statistics.median(values) for name, values in stages.items()},
+            )
+        else:
+            medians[run.id] = None
+        if run.status == "completed" and run.duration is not None:
+            previous[key].append(run)
+    return medians
@@ -1,27 +1,275 @@
+import logging
+import threading
+import time
 from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+
 from .models import TokenCache, get_session
 
+logger = logging.getLogger(__name__)
+
+
+class _TokenHolder:
+    """The token of a service held in memory, shared by all managers in the process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.token = None
+        self.expires_at = None
+        self.refresh_at = None
+
+
+_holders = {}
+_holders_lock = threading.Lock()
+
+
+def _holder(service_name):
+    with _holders_lock:
+        return _holders.setdefault(service_name, _TokenHolder())
+
+
+def _utc(value):
+    """SQLite drops the time zone, all stored times are UTC."""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
 
 class TokenManager:
+    """
+    Token cache for an API.
+
+    The token is held in memory and only read from the token_cache table when
+    it is due for a refresh. Tokens are refreshed before they expire, and only
+    one thread per process fetches a new token while the others keep using the
+    current one (or wait, if it has expired). Across processes, the process
+    holding the refresh lease in token_cache fetches the token, and the others
+    wait for it to appear in the table.
+    """
+
+    # Refresh tokens this many seconds before they expire (at most half their lifetime)
+    REFRESH_BEFORE = 300
+    # Seconds a process may hold the refresh lease before another takes over
+    LEASE_SECONDS = 30
+    # Seconds between checks for a token fetched by another process
+    POLL_INTERVAL = 0.2
+
     def __init__(self, service_name="colibo"):
         self.service_name = service_name
         self.session = get_session()
+        self._holder = _holder(service_name)
+        # Number of tokens fetched by this manager
+        self.refreshes = 0
+
+    def _remember(self, access_token, expires_at, created_at=None):
+        """Hold a token in memory."""
+        expires_at = _utc(expires_at)
+        lifetime = (
+            (expires_at - _utc(created_at)).total_seconds()
+            if created_at
+            else self.REFRESH_BEFORE * 2
+        )
+        holder = self._holder
+        holder.token = access_token
+        holder.expires_at = expires_at
+        holder.refresh_at = expires_at - timedelta(
+            seconds=min(self.REFRESH_BEFORE, max(lifetime, 0) / 2)
+        )
+
+    def current_token(self):
+        """Get the token held in memory, or None if it is due for a refresh."""
+        holder = self._holder
+        token, refresh_at = holder.token, holder.refresh_at
+        if token and datetime.now(timezone.utc) < refresh_at:
+            return token
+        return None
+
+    def _usable_token(self):
+        """Get the token held in memory if it has not expired, even if it is due for a refresh."""
+        holder = self._holder
+        token, expires_at = holder.token, holder.expires_at
+        if token and datetime.now(timezone.utc) < expires_at - timedelta(seconds=10):
+            return token
+        return None
+
+    def get_token(self, fetch):
+        """
+        Get a valid token, fetching a new one if needed.
+
+        Args:
+            fetch: Function requesting a new token from the API. Returns the
+                token response, with "access_token" and "expires_in"
+
+        Returns:
+            The access token
+        """
+        token = self.current_token()
+        if token:
+            return token
+
+        lock = self._holder.lock
+        usable = self._usable_token()
+        if usable:
+            # Another thread is already refreshing, keep using the current token
+            if not lock.acquire(blocking=False):
+                return usable
+        else:
+            lock.acquire()
+
+        try:
+            # The token may have been refreshed while waiting for the lock
+            token = self.current_token()
+            if token:
+                return token
+            return self._refresh(fetch)
+        except Exception as e:
+            usable = self._usable_token()
+            if usable is None:
+                raise
+            logger.warning(f"Token refresh for {self.service_name} failed: {e}")
+            return usable
+        finally:
+            lock.release()
+
+    def _refresh(self, fetch):
+        """Adopt a token fetched by another process, or fetch one holding the lease."""
+        while True:
+            token = self._load()
+            if token:
+                return token
+
+            if self._acquire_lease():
+                # Another process may have stored a token since it was loaded
+                token = self._load()
+                if token:
+                    self._release_lease()
+                    return token
+
+                try:
+                    token_data = fetch()
+                except BaseException:
+                    self._release_lease()
+                    raise
+                self.cache_token(
+                    token_data["access_token"], token_data.get("expires_in", 3600)
+                )
+                self.refreshes += 1
+                return self._holder.token
+
+            time.sleep(self.POLL_INTERVAL)
+
+    def _load(self):
+        """Hold the token stored in the database, and return it if it is not due for a refresh."""
+        row = self.session.execute(
+            select(
+                TokenCache.access_token,
+                TokenCache.expires_at,
+                TokenCache.created_at,
+            ).filter_by(service_name=self.service_name)
+        ).first()
+        self.session.commit()
+
+        if row and row.access_token:
+            self._remember(row.access_token, row.expires_at, row.created_at)
+        return self.current_token()
+
+    def _acquire_lease(self):
+        """Try to become the process that fetches the next token."""
+        now = datetime.now(timezone.utc)
+        lease = now + timedelta(seconds=self.LEASE_SECONDS)
+        result = self.session.execute(
+            update(TokenCache)
+            .where(
+                TokenCache.service_name == self.service_name,
+                or_(
+                    TokenCache.refreshing_until.is_(None),
+                    TokenCache.refreshing_until < now,
+                ),
+            )
+            .values(refreshing_until=lease)
+        )
+        self.session.commit()
+        if result.rowcount:
+            return True
+
+        if (
+            self.session.query(TokenCache)
+            .filter_by(service_name=self.service_name)
+            .first()
+        ):
+            # Another process holds the lease
+            return False
+
+        # No token has been cached yet, the first process to add the row wins
+        try:
+            self.session.add(
+                TokenCache(
+                    service_name=self.service_name,
+                    access_token="",
+                    expires_at=now,
+                    created_at=now,
+                    refreshing_until=lease,
+                )
+            )
+            self.session.commit()
+        except IntegrityError:
+            self.session.rollback()
+            return False
+        return True
+
+    def _release_lease(self):
+        self.session.execute(
+            update(TokenCache)
+            .where(TokenCache.service_name == self.service_name)
+            .values(refreshing_until=None)
+        )
+        self.session.commit()
+
+    def invalidate(self, access_token):
+        """
+        Drop a token the API has rejected, so the next get_token() fetches a new one.
+
+        Only the given token is dropped, in case another thread has already
+        replaced it.
+        """
+        with self._holder.lock:
+            if self._holder.token == access_token:
+                self._holder.token = None
+                self._holder.expires_at = None
+                self._holder.refresh_at = None
+
+            self.session.execute(
+                update(TokenCache)
+                .where(
+                    TokenCache.service_name == self.service_name,
+                    TokenCache.access_token == access_token,
+                )
+                .values(expires_at=datetime.now(timezone.utc))
+            )
+            self.session.commit()
 
     def get_valid_token(self):
         """Get a valid token from the cache or return None."""
+        token = self.current_token()
+        if token:
+            return token
+
         token = (
             self.session.query(TokenCache)
             .filter_by(service_name=self.service_name)
             .first()
         )
-        if token and token.is_valid():
+        if token and token.access_token and token.is_valid():
             return token.access_token
         return None
 
     def cache_token(self, access_token, expires_in):
         """Cache a new token or update an existing one."""
         # Calculate expiration time
-        expires_at = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+        created_at = datetime.now(timezone.utc)
+        expires_at = created_at + timedelta(seconds=expires_in)
 
         # Check if a record exists
         token = (
@@ -34,14 +282,17 @@ class TokenManager:
             # Update existing token
             token.access_token = access_token
             token.expires_at = expires_at
-            token.created_at = datetime.now(timezone.utc)
+            token.created_at = created_at
+            token.refreshing_until = None
         else:
             # Create a new token record
             token = TokenCache(
                 service_name=self.service_name,
                 access_token=access_token,
                 expires_at=expires_at,
+                created_at=created_at,
             )
             self.session.add(token)
 
         self.session.commit()
+        self._remember(access_token, expires_at, created_at)
@@ -1,3 +1,6 @@
+import hashlib
+
+
 def build_content(item):
     """Build the content of a document."""
     # Check if all content fields are None
@@ -19,3 +22,8 @@ def build_content(item):
 def filename(doc_id: int, extension: str = "md"):
     """Build a filename for a document"""
     return str(doc_id) + "." + extension
+
+
+def content_digest(content: str):
+    """Build a digest of document content, used to detect changes"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
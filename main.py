@@ -1,18 +1,35 @@
 from email.policy import default
 
+import asyncio
 import click
 import contextlib
 import logging
 import os
+import time
+import tomllib
+from collections import Counter
 
 from dotenv import load_dotenv
 
+from colibo.async_client import AsyncClient as AsyncColiboClient
 from colibo.client import Client as ColiboClient
+from colibo.converter import ConversionPool, converter_settings
+from openwebui.async_client import AsyncClient as AsyncWebUIClient
 from openwebui.client import Client as WebUIClient
+from db.checkpoint import CheckpointManager
+from db.document_tree import DocumentTreeManager
+from db.http_cache import HttpCacheManager
+from db.markdown_cache import MarkdownCacheManager
 from db.models import init_db
 from db.sync_manager import SyncManager
-from helpers import build_content, filename
+from db.sync_runs import SyncRunManager, compare_runs, stage_seconds
+from helpers import build_content, content_digest, filename
+from metrics import Metrics
+from profiler import SamplingProfiler
 from openwebui.exceptions import WebUIError, WebUINotFoundError
+from pipeline.sweep import remove_documents, sweep_documents
+from pipeline.sync import SyncPipeline
+from pipeline.trace import TraceWriter, read_trace, summarize_trace
 
 load_dotenv()
 
@@ -22,11 +39,61 @@ COLIBO_CLIENT_ID = os.environ.get("COLIBO_CLIENT_ID")
 COLIBO_CLIENT_SECRET = os.environ.get("COLIBO_CLIENT_SECRET")
 COLIBO_SCOPE = os.environ.get("COLIBO_SCOPE")
 COLIBO_ROOT_DOC_ID = os.environ.get("COLIBO_ROOT_DOC_ID")
+COLIBO_CRAWL_WORKERS = int(os.environ.get("COLIBO_CRAWL_WORKERS", 1))
+# Retries of Colibo requests when it is overloaded (429/502/503/504) or unreachable
+COLIBO_MAX_RETRIES = int(os.environ.get("COLIBO_MAX_RETRIES", 5))
 
 # Open-webui settings
 WEBUI_BASE_URL = os.environ.get("WEBUI_BASE_URL")
 WEBUI_TOKEN = os.environ.get("WEBUI_TOKEN")
 WEBUI_KNOWLEDGE_ID = os.environ.get("WEBUI_KNOWLEDGE_ID")
+WEBUI_UPLOAD_WORKERS = int(os.environ.get("WEBUI_UPLOAD_WORKERS", 1))
+WEBUI_DELETE_WORKERS = int(os.environ.get("WEBUI_DELETE_WORKERS", 1))
+# Let Open-WebUI process (extract and embed) new documents in the background
+WEBUI_BACKGROUND_PROCESSING = os.environ.get(
+    "WEBUI_BACKGROUND_PROCESSING", "false"
+).lower() in ("true", "1", "yes")
+# Maximum number of files being processed in the background at the same time
+WEBUI_MAX_BACKLOG = int(os.environ.get("WEBUI_MAX_BACKLOG", 20))
+# Seconds between checks of the processing status of a file
+WEBUI_POLL_INTERVAL = float(os.environ.get("WEBUI_POLL_INTERVAL", 1))
+# Seconds after which a file that has not been processed counts as failed
+WEBUI_PROCESSING_TIMEOUT = float(os.environ.get("WEBUI_PROCESSING_TIMEOUT", 600))
+
+# Database write batching during sync
+DB_BATCH_SIZE = int(os.environ.get("DB_BATCH_SIZE", 100))
+DB_FLUSH_INTERVAL = float(os.environ.get("DB_FLUSH_INTERVAL", 5))
+
+# Number of processes converting HTML to Markdown during sync, 0 converts in
+# the main process
+CONVERT_WORKERS = int(os.environ.get("CONVERT_WORKERS", 0))
+
+# Sync pipeline settings
+TRANSFORM_WORKERS = int(os.environ.get("TRANSFORM_WORKERS", 1))
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 100))
+# Seconds between saves of the sync checkpoint, used by sync --resume
+SYNC_CHECKPOINT_INTERVAL = float(os.environ.get("SYNC_CHECKPOINT_INTERVAL", 30))
+# TOML file listing the roots and knowledge resources synced by sync:config
+SYNC_CONFIG = os.environ.get("SYNC_CONFIG")
+# Maximum percentage of the synced documents a sync may remove as deleted in Colibo
+SWEEP_MAX_PERCENT = float(os.environ.get("SWEEP_MAX_PERCENT", 10))
+# Metrics written at the end of every sync, in the Prometheus text format
+# (e.g. for the textfile collector of the node exporter) and as JSON
+SYNC_METRICS_FILE = os.environ.get("SYNC_METRICS_FILE")
+SYNC_METRICS_JSON = os.environ.get("SYNC_METRICS_JSON")
+# JSON lines file with the time spent on every document during sync
+SYNC_TRACE_FILE = os.environ.get("SYNC_TRACE_FILE")
+
+# Maximum size in bytes of the Markdown conversion cache, 0 disables it
+MARKDOWN_CACHE_MAX_SIZE = int(
+    os.environ.get("MARKDOWN_CACHE_MAX_SIZE", 256 * 1024 * 1024)
+)
+
+# Maximum size in bytes of the Colibo HTTP response cache, 0 disables it
+HTTP_CACHE_MAX_SIZE = int(os.environ.get("HTTP_CACHE_MAX_SIZE", 256 * 1024 * 1024))
+
+# Number of pooled (keep-alive) connections per API client
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 10))
 
 # SSL verification settings
 VERIFY_SSL = os.environ.get("VERIFY_SSL", "true").lower() in ("true", "1", "yes")
@@ -45,9 +112,137 @@ sync_manager = SyncManager()
 
 
 @click.group()
-def cli():
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Sample where the command spends its time, and show a report per subsystem when it ends.",
+)
+@click.option(
+    "--profile-output",
+    help="Also write the sampled stacks to this file, in the collapsed format of flamegraph.pl.",
+    default=None,
+    type=click.Path(dir_okay=False, writable=True),
+)
+@click.pass_context
+def cli(ctx, profile, profile_output):
     """Colibo document synchronization tool."""
-    pass
+    if not profile and not profile_output:
+        return
+
+    profiler = SamplingProfiler()
+    profiler.start()
+
+    def report():
+        profiler.stop()
+        click.echo("", err=True)
+        for line in profiler.report():
+            click.echo(line, err=True)
+        if profile_output:
+            profiler.write_collapsed(profile_output)
+
+    # Also called when the command fails
+    ctx.call_on_close(report)
+
+
+def get_markdown_cache():
+    """Open the Markdown conversion cache, or return None if it is disabled."""
+    if MARKDOWN_CACHE_MAX_SIZE <= 0:
+        return None
+    return MarkdownCacheManager(converter_settings(), max_size=MARKDOWN_CACHE_MAX_SIZE)
+
+
+def echo_markdown_cache_stats(echo, markdown_cache):
+    """Write the cache statistics and the cached conversions to disk."""
+    if markdown_cache is None:
+        return
+    markdown_cache.flush()
+    stats = markdown_cache.stats()
+    echo(
+        f"Markdown cache: {stats['hits']} hits, {stats['misses']} misses "
+        f"({stats['hit_rate']:.0%} hit rate), {stats['evictions']} evicted"
+    )
+
+
+def get_http_cache():
+    """Open the Colibo HTTP response cache, or return None if it is disabled."""
+    if HTTP_CACHE_MAX_SIZE <= 0:
+        return None
+    return HttpCacheManager(max_size=HTTP_CACHE_MAX_SIZE)
+
+
+def echo_rate_limit_stats(echo, stats):
+    """Display how often Colibo asked the client to slow down."""
+    if not stats["throttled"] and not stats["retries"]:
+        return
+    echo(
+        f"Colibo rate limit: {stats['throttled']} throttled responses, "
+        f"{stats['retries']} retries, concurrency {stats['limit']}/{stats['max_limit']} "
+        f"(lowest {stats['lowest_limit']})"
+    )
+
+
+def echo_http_cache_stats(echo, http_cache):
+    """Write the cached responses to disk and display how many were revalidated."""
+    if http_cache is None:
+        return
+    http_cache.flush()
+    stats = http_cache.stats()
+    echo(
+        f"HTTP cache: {stats['hits']} not modified, {stats['misses']} fetched "
+        f"({stats['hit_rate']:.0%} hit rate), "
+        f"{stats['bytes_saved'] / 1024 / 1024:.1f} MiB not downloaded, "
+        f"{stats['evictions']} evicted, {stats['size'] / 1024 / 1024:.1f} MiB cached"
+    )
+
+
+def echo_document_tree_stats(echo, document_tree):
+    """Display how much of the tree was skipped because it had not changed."""
+    if not document_tree.prune_unchanged:
+        return
+    stats = document_tree.stats()
+    echo(
+        f"Unchanged folders pruned: {stats['pruned_folders']} "
+        f"({stats['pruned_documents']} documents not listed, "
+        f"{stats['listings']} folders listed)"
+    )
+
+
+def echo_sweep_stats(echo, counts, max_percent):
+    """Display how many documents deleted in Colibo were removed."""
+    if counts is None:
+        echo("Documents removed: none, the crawl was not complete")
+        return
+    if counts["refused"]:
+        echo(
+            click.style(
+                f"Documents removed: none, {counts['unseen']} documents were not "
+                f"found in Colibo, more than {max_percent:g}% of the knowledge base. "
+                "Check the root document, or raise --sweep-max-percent.",
+                fg="yellow",
+                bold=True,
+            )
+        )
+        return
+    echo(f"Documents removed: {counts['swept']}")
+    if counts["failed"]:
+        echo(f"Failed to remove documents: {counts['failed']}")
+
+
+def echo_pipeline_stats(echo, stats):
+    """Display how busy each stage of the sync pipeline was."""
+    echo("")
+    echo(click.style("Pipeline stages:", fg="blue", bold=True))
+    echo(
+        f"{'Stage':<10} {'Workers':>7} {'In':>7} {'Out':>7} {'Busy':>8} "
+        f"{'Util':>5} {'Docs/s':>8} {'Queue max/avg':>14}"
+    )
+    for stage in stats:
+        echo(
+            f"{stage['name']:<10} {stage['workers']:>7} {stage['received']:>7} "
+            f"{stage['emitted']:>7} {stage['busy']:>7.1f}s "
+            f"{stage['utilization']:>5.0%} {stage['throughput']:>8.1f} "
+            f"{stage['max_queued']:>7}/{stage['avg_queued']:<6.1f}"
+        )
 
 
 @contextlib.contextmanager
@@ -56,27 +251,294 @@ def silent_progressbar(iterable, **kwargs):
     yield iterable
 
 
+def sync_options(command):
+    """Add the options shared by sync and sync:config to a command."""
+    options = [
+        click.option("--quiet", is_flag=True, help="Do not display progress."),
+        click.option(
+            "--force-update", is_flag=True, help="Force update all documents."
+        ),
+        click.option(
+            "--crawl-workers",
+            help="Number of concurrent requests used to crawl Colibo.",
+            default=COLIBO_CRAWL_WORKERS,
+            type=click.IntRange(min=1),
+        ),
+        click.option(
+            "--upload-workers",
+            help="Number of documents uploaded to Open-Webui at the same time.",
+            default=WEBUI_UPLOAD_WORKERS,
+            type=click.IntRange(min=1),
+        ),
+        click.option(
+            "--background-processing",
+            is_flag=True,
+            default=WEBUI_BACKGROUND_PROCESSING,
+            help="Let Open-Webui process new documents in the background, and add them to the knowledge resource once they are processed.",
+        ),
+        click.option(
+            "--max-backlog",
+            help="Maximum number of documents being processed in the background at the same time.",
+            default=WEBUI_MAX_BACKLOG,
+            type=click.IntRange(min=1),
+        ),
+        click.option(
+            "--convert-workers",
+            help="Number of processes converting HTML to Markdown (0 converts in the main process).",
+            default=CONVERT_WORKERS,
+            type=click.IntRange(min=0),
+        ),
+        click.option(
+            "--transform-workers",
+            help="Number of threads building document content (ignored with --convert-workers).",
+            default=TRANSFORM_WORKERS,
+            type=click.IntRange(min=1),
+        ),
+        click.option(
+            "--queue-size",
+            help="Maximum number of documents waiting in front of each pipeline stage.",
+            default=PIPELINE_QUEUE_SIZE,
+            type=click.IntRange(min=1),
+        ),
+        click.option(
+            "--stats-interval",
+            help="Log the progress of each pipeline stage every N seconds.",
+            default=None,
+            type=click.FloatRange(min=0, min_open=True),
+        ),
+        click.option(
+            "--prune-unchanged",
+            is_flag=True,
+            help="Do not list folders that have not changed since the last sync.",
+        ),
+        click.option(
+            "--no-sweep",
+            is_flag=True,
+            help="Do not remove documents that were deleted in Colibo.",
+        ),
+        click.option(
+            "--sweep-max-percent",
+            help="Do not remove documents if more than this percentage of the knowledge base would be removed.",
+            default=SWEEP_MAX_PERCENT,
+            type=click.FloatRange(min=0, max=100),
+        ),
+        click.option(
+            "--metrics-file",
+            help="Write metrics of the run to this file in the Prometheus text format.",
+            default=SYNC_METRICS_FILE,
+            type=click.Path(dir_okay=False, writable=True),
+        ),
+        click.option(
+            "--metrics-json",
+            help="Write metrics of the run to this file as JSON.",
+            default=SYNC_METRICS_JSON,
+            type=click.Path(dir_okay=False, writable=True),
+        ),
+        click.option(
+            "--trace-file",
+            help="Write the time spent on every document to this file as JSON lines, see trace:summarize.",
+            default=SYNC_TRACE_FILE,
+            type=click.Path(dir_okay=False, writable=True),
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def load_sync_targets(path):
+    """
+    Read the targets of sync:config from a TOML file.
+
+    Returns:
+        List of (root document ID, knowledge base ID) tuples
+    """
+    with open(path, "rb") as f:
+        try:
+            config = tomllib.load(f)
+        except tomllib.TOMLDecodeError as e:
+            raise click.BadParameter(str(e), param_hint="--config")
+
+    targets = []
+    for number, target in enumerate(config.get("targets", []), start=1):
+        for key in ("root_doc_id", "knowledge_id"):
+            if not target.get(key):
+                raise click.BadParameter(
+                    f"target {number} has no {key}", param_hint="--config"
+                )
+        # Colibo IDs are numbers, 1012 and "1012" are the same root
+        root_doc_id = target["root_doc_id"]
+        try:
+            if isinstance(root_doc_id, (bool, float)):
+                raise ValueError(root_doc_id)
+            root_doc_id = int(root_doc_id)
+        except ValueError:
+            raise click.BadParameter(
+                f"target {number} has an invalid root_doc_id "
+                f"{target['root_doc_id']!r}",
+                param_hint="--config",
+            )
+        targets.append((root_doc_id, target["knowledge_id"]))
+
+    if not targets:
+        raise click.BadParameter("no [[targets]] found", param_hint="--config")
+    return targets
+
+
 @cli.command(name="sync")
 @click.option(
-    "--root-doc-id", help="Id of the root document.", default=COLIBO_ROOT_DOC_ID
+    "--root-doc-id",
+    help="Id of the root document.",
+    default=COLIBO_ROOT_DOC_ID,
+    type=int,
 )
-@click.option("--quiet", is_flag=True, help="Do not display progress.")
 @click.option(
     "--knowledge-id",
     help="ID of the knowledge resource to retrieve",
     default=WEBUI_KNOWLEDGE_ID,
 )
-@click.option("--force-update", is_flag=True, help="Force update all documents.")
-def sync(
-    root_doc_id,
+@sync_options
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue the last sync of the root document that was stopped or failed.",
+)
+@click.option(
+    "--max-duration",
+    help="Stop after N seconds, continue later with --resume.",
+    default=None,
+    type=click.FloatRange(min=0, min_open=True),
+)
+def sync(root_doc_id, knowledge_id: str = WEBUI_KNOWLEDGE_ID, **options):
+    """Synchronize documents from Colibo to Open-Webui."""
+    run_sync([(root_doc_id, knowledge_id)], **options)
+
+
+@cli.command(name="sync:config")
+@click.option(
+    "--config",
+    "config_path",
+    help="TOML file listing the root documents and the knowledge resources to sync them to.",
+    default=SYNC_CONFIG,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False),
+)
+@sync_options
+def sync_config(config_path, **options):
+    """Synchronize several Colibo roots to several knowledge resources at once."""
+    run_sync(load_sync_targets(config_path), **options)
+
+
+def run_sync(targets, metrics_file=None, metrics_json=None, **options):
+    """
+    Synchronize Colibo roots to Open-Webui knowledge resources, see sync_targets().
+
+    With a metrics file, the metrics of the run are written when it ends, also
+    when it fails.
+    """
+    if not metrics_file and not metrics_json:
+        return sync_targets(targets, **options)
+
+    metrics = Metrics()
+    success = False
+    try:
+        with metrics.instrument_db():
+            sync_targets(targets, metrics=metrics, **options)
+        success = True
+    finally:
+        metrics.set("colibo_sync_run_success", int(success))
+        metrics.set("colibo_sync_run_duration_seconds", time.time() - metrics.created)
+        metrics.set("colibo_sync_last_run_timestamp_seconds", time.time())
+        if metrics_file:
+            metrics.write_prometheus(metrics_file)
+        if metrics_json:
+            metrics.write_json(metrics_json)
+
+
+def record_sync_metrics(metrics, counts, sweep_counts, stats):
+    """Add the document counts and the pipeline statistics of a sync to its metrics."""
+    for outcome in ("new", "updated", "skipped", "failed"):
+        metrics.inc("colibo_sync_documents", counts[outcome], outcome=outcome)
+    for knowledge_counts in sweep_counts.values():
+        metrics.inc(
+            "colibo_sync_documents", knowledge_counts["swept"], outcome="removed"
+        )
+        metrics.inc(
+            "colibo_sync_documents", knowledge_counts["failed"], outcome="remove_failed"
+        )
+    for stage in stats:
+        metrics.set(
+            "colibo_sync_stage_busy_seconds", stage["busy"], stage=stage["name"]
+        )
+        metrics.set(
+            "colibo_sync_stage_documents", stage["received"], stage=stage["name"]
+        )
+
+
+def sync_targets(
+    targets,
     quiet: bool = False,
-    knowledge_id: str = WEBUI_KNOWLEDGE_ID,
     force_update: bool = False,
+    crawl_workers: int = COLIBO_CRAWL_WORKERS,
+    upload_workers: int = WEBUI_UPLOAD_WORKERS,
+    background_processing: bool = WEBUI_BACKGROUND_PROCESSING,
+    max_backlog: int = WEBUI_MAX_BACKLOG,
+    convert_workers: int = CONVERT_WORKERS,
+    transform_workers: int = TRANSFORM_WORKERS,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    stats_interval: float = None,
+    prune_unchanged: bool = False,
+    resume: bool = False,
+    max_duration: float = None,
+    no_sweep: bool = False,
+    sweep_max_percent: float = SWEEP_MAX_PERCENT,
+    trace_file: str = None,
+    metrics: Metrics = None,
 ):
-    """Synchronize documents from Colibo to Open-Webui."""
-    webui = WebUIClient(WEBUI_TOKEN, WEBUI_BASE_URL, verify_ssl=VERIFY_SSL)
+    """
+    Synchronize Colibo roots to Open-Webui knowledge resources.
+
+    All targets share the connection pools, the token and the caches, and
+    each root is crawled once for all its knowledge resources. Checkpoints
+    (--resume and --max-duration) are only supported with a single target.
+
+    Args:
+        targets (list): (root document ID, knowledge base ID) tuples
+        trace_file (str): Optional JSON lines file receiving the time spent on
+            every document, see pipeline.trace
+        metrics: Optional Metrics recording requests, conversions and outcomes
+    """
+    deadline = time.monotonic() + max_duration if max_duration else None
+    knowledge_ids = list(dict.fromkeys(knowledge_id for _, knowledge_id in targets))
+    roots = list(dict.fromkeys(root_doc_id for root_doc_id, _ in targets))
+
+    markdown_cache = get_markdown_cache()
+    http_cache = get_http_cache()
+    document_tree = DocumentTreeManager(prune_unchanged=prune_unchanged)
+    webui = WebUIClient(
+        WEBUI_TOKEN,
+        WEBUI_BASE_URL,
+        verify_ssl=VERIFY_SSL,
+        # The processing status of every file in the backlog is polled
+        pool_size=max(
+            HTTP_POOL_SIZE,
+            upload_workers + (max_backlog if background_processing else 0),
+        ),
+        metrics=metrics,
+    )
     colibo = ColiboClient(
-        COLIBO_BASE_URL, COLIBO_CLIENT_ID, COLIBO_CLIENT_SECRET, COLIBO_SCOPE
+        COLIBO_BASE_URL,
+        COLIBO_CLIENT_ID,
+        COLIBO_CLIENT_SECRET,
+        COLIBO_SCOPE,
+        pool_size=max(HTTP_POOL_SIZE, crawl_workers),
+        max_retries=COLIBO_MAX_RETRIES,
+        markdown_cache=markdown_cache,
+        http_cache=http_cache,
+        document_tree=document_tree,
+        # Overlapping roots are only fetched once
+        memoize=len(roots) > 1,
+        metrics=metrics,
     )
 
     # Custom echo function that respects the quiet flag
@@ -85,162 +547,453 @@ def sync(
             click.echo(*args, **kwargs)
 
     # Test knowledge exists before processing documents
+    for knowledge_id in knowledge_ids:
+        try:
+            webui.get_knowledge(knowledge_id)
+        except Exception as e:
+            echo(
+                click.style("Error accessing knowledge resource!", fg="red", bold=True)
+            )
+            echo(f"Error: {e}")
+            exit(-1)
+
+        # Look up synced documents in memory instead of one query per document
+        sync_manager.load_index(knowledge_id)
+
+    checkpoint = None
+    resumed = False
+    # Only the syncs that can be resumed save their progress
+    if len(targets) == 1 and (resume or max_duration):
+        root_doc_id, knowledge_id = targets[0]
+        checkpoint = CheckpointManager(root_doc_id, knowledge_id)
+        resumed = resume and checkpoint.resume()
+        if resumed:
+            echo(
+                f"Resuming sync of root document {root_doc_id} (Colibo): "
+                f"{checkpoint.processed} documents done, {len(checkpoint.pending)} pending, "
+                f"{len(checkpoint.frontier)} folders to list"
+            )
+        else:
+            if resume:
+                echo("No sync to resume, starting a new one")
+            checkpoint.start()
+
+    if not resumed:
+        for root_doc_id, knowledge_id in targets:
+            echo(f"Syncing root document {root_doc_id} (Colibo) to {knowledge_id}")
+
+    # Choose the appropriate progress bar based on the quiet flag
+    progress_context = silent_progressbar if quiet else click.progressbar
+
+    def progress(docs):
+        with progress_context(docs, label="Syncing child documents") as bar:
+            yield from bar
+
+    # Convert bodies in worker processes, handing documents back in order
+    conversion_pool = (
+        ConversionPool(convert_workers, markdown_cache=markdown_cache, metrics=metrics)
+        if convert_workers
+        else contextlib.nullcontext()
+    )
+
+    trace = TraceWriter(trace_file) if trace_file else contextlib.nullcontext()
+
+    pipeline = SyncPipeline(
+        colibo,
+        webui,
+        sync_manager,
+        targets,
+        force_update=force_update,
+        crawl_workers=crawl_workers,
+        transform_workers=transform_workers,
+        upload_workers=upload_workers,
+        queue_size=queue_size,
+        conversion_pool=conversion_pool if convert_workers else None,
+        progress=progress,
+        echo=lambda message: echo(click.style(message, fg="red", bold=True)),
+        checkpoint=checkpoint,
+        resume=resumed,
+        deadline=deadline,
+        checkpoint_interval=SYNC_CHECKPOINT_INTERVAL,
+        background=background_processing,
+        max_backlog=max_backlog,
+        poll_interval=WEBUI_POLL_INTERVAL,
+        processing_timeout=WEBUI_PROCESSING_TIMEOUT,
+        trace=trace if trace_file else None,
+    )
+
+    # The run is saved whatever happens, so it never stays "running"
+    run_history = SyncRunManager()
+    run_history.start(targets)
+    status = "failed"
+    counts = pipeline.counts
     try:
-        webui.get_knowledge(knowledge_id)
-    except Exception as e:
-        echo(click.style("Error accessing knowledge resource!", fg="red", bold=True))
-        echo(f"Error: {e}")
-        exit(-1)
+        # Sync records are written in batches, and flushed on exit or on errors
+        with (
+            sync_manager.batch(size=DB_BATCH_SIZE, interval=DB_FLUSH_INTERVAL),
+            conversion_pool,
+            trace,
+        ):
+            try:
+                counts = pipeline.run(monitor_interval=stats_interval)
+            except BaseException:
+                if checkpoint is not None:
+                    pipeline.save_checkpoint("interrupted")
+                raise
+
+        if pipeline.timed_out:
+            if checkpoint is not None:
+                pipeline.save_checkpoint("interrupted")
+        else:
+            if checkpoint is not None:
+                checkpoint.finish()
+            elif len(targets) == 1:
+                # A complete sync replaces a stopped one
+                CheckpointManager(*targets[0]).finish()
+            # Only a complete crawl is stored, the next one prunes against it. A
+            # resumed crawl only saw the part of the tree left by the last run.
+            if not resumed:
+                document_tree.save()
+
+        # Remove the documents the crawl did not find, which needs a complete crawl.
+        # Documents under pruned folders were not crawled, but are still there.
+        sweep_counts = {}
+        if not no_sweep and not resumed and not pipeline.timed_out:
+            for knowledge_id in knowledge_ids:
+                knowledge_roots = [
+                    root_doc_id
+                    for root_doc_id, target in targets
+                    if target == knowledge_id
+                ]
+                generation = sync_manager.next_generation(knowledge_id)
+                # Pruned documents keep their owner, they were not crawled
+                sync_manager.mark_seen(document_tree.pruned, knowledge_id, generation)
+                seen_ids = pipeline.seen_ids[knowledge_id]
+                for root_doc_id in knowledge_roots:
+                    sync_manager.mark_seen(
+                        [
+                            doc_id
+                            for doc_id, found_by in seen_ids.items()
+                            if found_by == root_doc_id
+                        ],
+                        knowledge_id,
+                        generation,
+                        root_doc_id=root_doc_id,
+                    )
+                sweep_counts[knowledge_id] = sweep_documents(
+                    webui,
+                    sync_manager,
+                    knowledge_id,
+                    generation,
+                    knowledge_roots,
+                    max_percent=sweep_max_percent,
+                    workers=upload_workers,
+                    echo=lambda message: echo(
+                        click.style(message, fg="red", bold=True)
+                    ),
+                )
 
-    # Track statistics
-    processed_count = 0
-    skipped_count = 0
-    updated_count = 0
-    new_count = 0
-    failed_count = 0
+        status = "interrupted" if pipeline.timed_out else "completed"
+    except KeyboardInterrupt:
+        status = "interrupted"
+        raise
+    finally:
+        run_history.finish(status, counts, pipeline.uploaded_bytes, pipeline.stats())
 
-    echo(f"Syncing root document {root_doc_id} (Colibo)")
+    if metrics is not None:
+        record_sync_metrics(metrics, counts, sweep_counts, pipeline.stats())
 
-    # Get root document
-    doc = colibo.get_document(root_doc_id)
-    content = build_content(doc)
+    # Add a summary at the end
+    echo("")
+    echo(click.style(f"Sync Summary:", fg="blue", bold=True))
+    for root_doc_id in roots:
+        echo(f"Root document: {root_doc_id} (Colibo)")
+    echo(f"Total documents processed: {counts['processed']}")
+    echo(f"New documents created: {counts['new']}")
+    echo(f"Existing documents updated: {counts['updated']}")
+    echo(f"Failed to sync documents: {counts['failed']}")
+    echo(f"Documents skipped: {counts['skipped']}")
+    if not no_sweep:
+        for knowledge_id in knowledge_ids:
+            if len(knowledge_ids) > 1:
+                echo(f"Knowledge {knowledge_id}:")
+            echo_sweep_stats(echo, sweep_counts.get(knowledge_id), sweep_max_percent)
+    echo_document_tree_stats(echo, document_tree)
+    echo_markdown_cache_stats(echo, markdown_cache)
+    echo_http_cache_stats(echo, http_cache)
+    echo_rate_limit_stats(echo, colibo.limiter.stats())
+    echo_pipeline_stats(echo, pipeline.stats())
+    echo("")
+    if pipeline.timed_out:
+        echo(
+            click.style(
+                f"Sync stopped after {max_duration:g} seconds, "
+                f"{len(checkpoint.pending)} documents and {len(checkpoint.frontier)} "
+                "folders left. Continue with --resume.",
+                fg="yellow",
+                bold=True,
+            )
+        )
+        return
+    echo(click.style("✓ Sync completed successfully!", fg="green", bold=True))
+
+
+async def sync_document_async(
+    webui, item, knowledge_id, force_update=False, root=False
+):
+    """
+    Synchronize a single Colibo document to Open-WebUI.
 
+    The root document is compared by content only, not by timestamp, like in
+    the sync pipeline.
+
+    Returns:
+        "new", "updated" or "skipped", or None for documents that are ignored
+    """
     # Check if the document already exists
-    existing = sync_manager.get_document(doc["id"], knowledge_id)
+    existing = sync_manager.get_document(item["id"], knowledge_id)
+
+    # Check if the document has been updated since the last sync, before
+    # building the content, so unchanged documents are never converted.
+    if (
+        existing
+        and not force_update
+        and not root
+        and (item["updated"] is None or existing.last_synced >= item["updated"])
+    ):
+        return "skipped"
+
+    content = build_content(item)
+    if content is None:
+        return "skipped"
+
+    content_hash = content_digest(content)
 
     if existing:
+        # Only re-upload (and re-embed) when the content has actually changed
+        if not force_update and existing.content_hash == content_hash:
+            sync_manager.record_sync(
+                colibo_doc_id=item["id"], knowledge_id=knowledge_id
+            )
+            return "skipped"
+
         # Update existing document
-        status = webui.update_file_content(existing.webui_doc_id, content)
-        if not status:
-            echo(click.style("Error updating document!", fg="red", bold=True))
-            exit(-1)
+        await webui.update_file_content(existing.webui_doc_id, content)
 
         # Update timestamp for sync in db
         sync_manager.record_sync(
-            colibo_doc_id=root_doc_id,
+            colibo_doc_id=item["id"],
             knowledge_id=knowledge_id,
+            content_hash=content_hash,
         )
 
-        updated_count += 1
-    else:
-        res = webui.upload_from_string(
-            content=content,
-            filename=filename(doc.get("title", doc["id"])),
-            content_type="text/markdown",
-            metadata={
-                "doctype": doc["doctype"],
-                "keywords": doc["keywords"],
-                "url": doc["url"],
-            },
-        )
-        status = webui.add_file_to_knowledge(knowledge_id, res["id"])
-        if not status:
-            echo(
-                click.style(
-                    f"Error adding to knowledge {knowledge_id} with file id {res['id']} and doc id {doc['id']}",
-                    fg="red",
-                    bold=True,
-                )
-            )
-            failed_count += 1
-        else:
-            new_count += 1
+        return "updated"
+
+    if item["doctype"] == "file":
+        # Ignore files for now.
+        # TODO: Figure out what to do with files.
+        return None
+
+    res = await webui.upload_from_string(
+        content=content,
+        filename=filename(item.get("title", item["id"])),
+        content_type="text/markdown",
+        metadata={
+            "doctype": item["doctype"],
+            "keywords": item["keywords"],
+            "url": item["url"],
+        },
+    )
+    await webui.add_file_to_knowledge(knowledge_id, res["id"])
+
+    # Record sync in the database
+    sync_manager.record_sync(
+        colibo_doc_id=item["id"],
+        webui_doc_id=res["id"],
+        knowledge_id=knowledge_id,
+        content_hash=content_hash,
+    )
 
-        # Record sync in the database
-        sync_manager.record_sync(
-            colibo_doc_id=root_doc_id,
-            webui_doc_id=res["id"],
-            knowledge_id=knowledge_id,
-        )
+    return "new"
 
-    processed_count += 1
 
-    # Choose the appropriate progress bar based on the quiet flag
-    progress_context = silent_progressbar if quiet else click.progressbar
+async def run_sync_async(
+    root_doc_id,
+    knowledge_id,
+    force_update,
+    concurrency,
+    echo,
+    markdown_cache=None,
+    http_cache=None,
+    document_tree=None,
+):
+    """
+    Crawl Colibo and synchronize documents with a bounded number of tasks.
+
+    Returns:
+        The document counters and the statistics of the Colibo rate limiter
+    """
+    stats = Counter()
+
+    async with (
+        AsyncColiboClient(
+            COLIBO_BASE_URL,
+            COLIBO_CLIENT_ID,
+            COLIBO_CLIENT_SECRET,
+            COLIBO_SCOPE,
+            pool_size=concurrency,
+            markdown_cache=markdown_cache,
+            http_cache=http_cache,
+            document_tree=document_tree,
+            max_retries=COLIBO_MAX_RETRIES,
+        ) as colibo,
+        AsyncWebUIClient(
+            WEBUI_TOKEN,
+            WEBUI_BASE_URL,
+            verify_ssl=VERIFY_SSL,
+            pool_size=concurrency,
+        ) as webui,
+    ):
+        # Test knowledge exists before processing documents
+        try:
+            await webui.get_knowledge(knowledge_id)
+        except Exception as e:
+            echo(
+                click.style("Error accessing knowledge resource!", fg="red", bold=True)
+            )
+            echo(f"Error: {e}")
+            exit(-1)
 
-    # Get children
-    docs = colibo.get_children(doc["id"], visited_ids={root_doc_id})
-
-    # Process each child document with a progress bar
-    with progress_context(docs, label="Syncing child documents") as bar:
-        for item in bar:
-            content = build_content(item)
-            if content is None:
-                skipped_count += 1
-                continue
-
-            # Check if the document already exists
-            existing = sync_manager.get_document(item["id"], knowledge_id)
-            if existing:
-                # Check if the document has been updated since the last sync
-                if not force_update and (
-                    item["updated"] is None or existing.last_synced >= item["updated"]
-                ):
-                    skipped_count += 1
-                    processed_count += 1
-                    continue
-
-                # Update existing document
-                status = webui.update_file_content(existing.webui_doc_id, content)
-                if not status:
-                    echo(click.style("Error updating document!", fg="red", bold=True))
-                    exit(-1)
-
-                # Update timestamp for sync in db
-                sync_manager.record_sync(
-                    colibo_doc_id=root_doc_id,
-                    knowledge_id=knowledge_id,
-                )
+        # Look up synced documents in memory instead of one query per document
+        sync_manager.load_index(knowledge_id)
 
-                updated_count += 1
-            else:
-                if item["doctype"] == "file":
-                    # Ignore files for now.
-                    # TODO: Figure out what to do with files.
-                    continue
-
-                res = webui.upload_from_string(
-                    content=content,
-                    filename=filename(item.get("title", item["id"])),
-                    content_type="text/markdown",
-                    metadata={
-                        "doctype": item["doctype"],
-                        "keywords": item["keywords"],
-                        "url": item["url"],
-                    },
+        # Limits the number of documents being uploaded at the same time
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def process(item, root):
+            try:
+                outcome = await sync_document_async(
+                    webui, item, knowledge_id, force_update, root
                 )
-                webui_doc_id = res["id"]
-                status = webui.add_file_to_knowledge(knowledge_id, webui_doc_id)
-                if not status:
-                    echo(
-                        click.style(
-                            f"Error adding to knowledge {knowledge_id} with doc id {webui_doc_id}",
-                            fg="red",
-                            bold=True,
-                        )
+            except WebUIError as e:
+                echo(
+                    click.style(
+                        f"Error syncing doc id {item['id']}: {e}", fg="red", bold=True
                     )
-                    failed_count += 1
-                else:
-                    new_count += 1
-
-                # Record sync in the database
-                sync_manager.record_sync(
-                    colibo_doc_id=item["id"],
-                    webui_doc_id=webui_doc_id,
-                    knowledge_id=knowledge_id,
                 )
+                if document_tree is not None:
+                    document_tree.invalidate(item["id"])
+                outcome = "failed"
+            finally:
+                semaphore.release()
+
+            if outcome is not None:
+                stats[outcome] += 1
+                stats["processed"] += 1
+
+        # A document reachable through links can show up more than once, and
+        # two tasks syncing it at the same time would both upload it
+        scheduled_ids = set()
+
+        async def schedule(item, root=False):
+            if item["id"] in scheduled_ids:
+                stats["skipped"] += 1
+                stats["processed"] += 1
+                return
+            scheduled_ids.add(item["id"])
+            await semaphore.acquire()
+            tasks.create_task(process(item, root))
+
+        echo(f"Syncing root document {root_doc_id} (Colibo)")
+
+        # Sync records are queued and written in bulk, instead of a commit per
+        # document blocking the event loop
+        with sync_manager.batch(size=DB_BATCH_SIZE, interval=DB_FLUSH_INTERVAL):
+            async with asyncio.TaskGroup() as tasks:
+                doc = await colibo.get_document(root_doc_id)
+                await schedule(doc, root=True)
+
+                async for item in colibo.get_children(
+                    doc["id"], visited_ids={root_doc_id}
+                ):
+                    await schedule(item)
 
-            processed_count += 1
+    # Only a complete crawl is stored, the next one prunes against it
+    if document_tree is not None:
+        document_tree.save()
+
+    return stats, colibo.limiter.stats()
+
+
+@cli.command(name="sync:async")
+@click.option(
+    "--root-doc-id",
+    help="Id of the root document.",
+    default=COLIBO_ROOT_DOC_ID,
+    type=int,
+)
+@click.option("--quiet", is_flag=True, help="Do not display progress.")
+@click.option(
+    "--knowledge-id",
+    help="ID of the knowledge resource to retrieve",
+    default=WEBUI_KNOWLEDGE_ID,
+)
+@click.option("--force-update", is_flag=True, help="Force update all documents.")
+@click.option(
+    "--concurrency",
+    help="Number of requests in flight against each API.",
+    default=20,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--prune-unchanged",
+    is_flag=True,
+    help="Do not list folders that have not changed since the last sync.",
+)
+def sync_async(
+    root_doc_id,
+    quiet: bool = False,
+    knowledge_id: str = WEBUI_KNOWLEDGE_ID,
+    force_update: bool = False,
+    concurrency: int = 20,
+    prune_unchanged: bool = False,
+):
+    """Synchronize documents from Colibo to Open-Webui using asyncio."""
+
+    # Custom echo function that respects the quiet flag
+    def echo(*args, **kwargs):
+        if not quiet:
+            click.echo(*args, **kwargs)
+
+    markdown_cache = get_markdown_cache()
+    http_cache = get_http_cache()
+    document_tree = DocumentTreeManager(prune_unchanged=prune_unchanged)
+    stats, rate_limit_stats = asyncio.run(
+        run_sync_async(
+            root_doc_id,
+            knowledge_id,
+            force_update,
+            concurrency,
+            echo,
+            markdown_cache,
+            http_cache,
+            document_tree,
+        )
+    )
 
     # Add a summary at the end
     echo("")
     echo(click.style(f"Sync Summary:", fg="blue", bold=True))
     echo(f"Root document: {root_doc_id} (Colibo)")
-    echo(f"Total documents processed: {processed_count}")
-    echo(f"New documents created: {new_count}")
-    echo(f"Existing documents updated: {updated_count}")
-    echo(f"Failed to sync documents: {failed_count}")
-    echo(f"Documents skipped: {skipped_count}")
+    echo(f"Total documents processed: {stats['processed']}")
+    echo(f"New documents created: {stats['new']}")
+    echo(f"Existing documents updated: {stats['updated']}")
+    echo(f"Failed to sync documents: {stats['failed']}")
+    echo(f"Documents skipped: {stats['skipped']}")
+    echo_document_tree_stats(echo, document_tree)
+    echo_markdown_cache_stats(echo, markdown_cache)
+    echo_http_cache_stats(echo, http_cache)
+    echo_rate_limit_stats(echo, rate_limit_stats)
     echo("")
     echo(click.style("✓ Sync completed successfully!", fg="green", bold=True))
 
@@ -256,7 +1009,9 @@ def sync(
 )
 def delete_doc(colibo_id, knowledge_id: str = WEBUI_KNOWLEDGE_ID):
     """Delete a document from WebUI and mark it as deleted in the database."""
-    webui = WebUIClient(WEBUI_TOKEN, WEBUI_BASE_URL, verify_ssl=VERIFY_SSL)
+    webui = WebUIClient(
+        WEBUI_TOKEN, WEBUI_BASE_URL, verify_ssl=VERIFY_SSL, pool_size=HTTP_POOL_SIZE
+    )
 
     # Test knowledge exists before processing documents
     try:
@@ -305,9 +1060,30 @@ def delete_doc(colibo_id, knowledge_id: str = WEBUI_KNOWLEDGE_ID):
     help="ID of the knowledge resource to retrieve",
     default=WEBUI_KNOWLEDGE_ID,
 )
-def delete_all_docs(confirm, knowledge_id: str = WEBUI_KNOWLEDGE_ID):
+@click.option(
+    "--workers",
+    help="Number of documents removed from Open-Webui at the same time.",
+    default=WEBUI_DELETE_WORKERS,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--reset",
+    is_flag=True,
+    help="Remove all files from the knowledge resource in one request, also those not synced from Colibo.",
+)
+def delete_all_docs(
+    confirm,
+    knowledge_id: str = WEBUI_KNOWLEDGE_ID,
+    workers: int = WEBUI_DELETE_WORKERS,
+    reset: bool = False,
+):
     """Delete all documents from WebUI and remove them from the database."""
-    webui = WebUIClient(WEBUI_TOKEN, WEBUI_BASE_URL, verify_ssl=VERIFY_SSL)
+    webui = WebUIClient(
+        WEBUI_TOKEN,
+        WEBUI_BASE_URL,
+        verify_ssl=VERIFY_SSL,
+        pool_size=max(HTTP_POOL_SIZE, workers),
+    )
 
     # Test knowledge exists before processing documents
     try:
@@ -319,17 +1095,23 @@ def delete_all_docs(confirm, knowledge_id: str = WEBUI_KNOWLEDGE_ID):
         click.echo(f"Error: {e}")
         exit(-1)
 
-    # Get all documents
-    docs = sync_manager.get_all_documents()
-    if not docs:
+    # Get all documents of the knowledge base
+    docs = sync_manager.get_all_documents(knowledge_id)
+    if not docs and not reset:
         click.echo(click.style("No documents found to delete", fg="yellow", bold=True))
         return
 
     # Confirm deletion
     if not confirm:
-        click.echo(
-            f"This will delete {len(docs)} documents from WebUI and the database."
-        )
+        if reset:
+            click.echo(
+                f"This will remove all files from knowledge {knowledge_id} in WebUI, "
+                f"and {len(docs)} documents from the database."
+            )
+        else:
+            click.echo(
+                f"This will delete {len(docs)} documents from WebUI and the database."
+            )
         click.echo(
             click.style("WARNING: This action cannot be undone!", fg="red", bold=True)
         )
@@ -337,26 +1119,47 @@ def delete_all_docs(confirm, knowledge_id: str = WEBUI_KNOWLEDGE_ID):
             click.echo("Operation cancelled.")
             return
 
-    # Track statistics
-    success_count = 0
-    error_count = 0
-    errors = []
+    if reset:
+        try:
+            webui.reset_knowledge(knowledge_id)
+            knowledge = webui.get_knowledge(knowledge_id)
+        except WebUIError as e:
+            click.echo(click.style("✗ Failed to reset knowledge!", fg="red", bold=True))
+            click.echo(f"Error: {e}")
+            exit(-1)
 
-    # Process each document
-    with click.progressbar(docs, label="Deleting documents") as bar:
-        for doc in bar:
-            try:
-                # Files are autumatically deleted when the knowledge mapping is deleted.
-                webui.remove_file_from_knowledge(knowledge_id, doc.webui_doc_id)
-            except WebUIError as e:
-                error_count += 1
-                errors.append((doc.colibo_doc_id, doc.webui_doc_id, str(e)))
-                continue
+        # Only keep the records of files that are still in the knowledge base
+        remaining = {file["id"] for file in knowledge.get("files") or []}
+        success_count = sync_manager.delete_documents(
+            [doc.colibo_doc_id for doc in docs if doc.webui_doc_id not in remaining],
+            knowledge_id,
+        )
+        errors = [
+            (doc, "Still in the knowledge resource after the reset")
+            for doc in docs
+            if doc.webui_doc_id in remaining
+        ]
+    else:
 
-            # Delete from database
-            sync_manager.delete_document(doc.colibo_doc_id, knowledge_id)
+        def progress(results):
+            with click.progressbar(
+                results, length=len(docs), label="Deleting documents"
+            ) as bar:
+                yield from bar
+
+        success_count, errors = remove_documents(
+            webui,
+            sync_manager,
+            knowledge_id,
+            docs,
+            workers=workers,
+            batch_size=DB_BATCH_SIZE,
+            progress=progress,
+        )
 
-            success_count += 1
+    # The stored tree would let the next sync prune folders whose documents
+    # are gone, so the next sync crawls everything again
+    DocumentTreeManager().clear()
 
     # Print summary
     click.echo("")
@@ -369,19 +1172,72 @@ def delete_all_docs(confirm, knowledge_id: str = WEBUI_KNOWLEDGE_ID):
             )
         )
 
-    if error_count > 0:
+    if errors:
         click.echo(
             click.style(
-                f"✗ Failed to delete {error_count} documents", fg="red", bold=True
+                f"✗ Failed to delete {len(errors)} documents", fg="red", bold=True
             )
         )
 
         # Show errors if there are any
-        if errors:
-            click.echo("\nErrors:")
-            for colibo_id, webui_id, error in errors:
-                click.echo(f"  - Colibo ID: {colibo_id}, WebUI ID: {webui_id}")
-                click.echo(f"    Error: {error}")
+        click.echo("\nErrors:")
+        for doc, error in errors:
+            click.echo(
+                f"  - Colibo ID: {doc.colibo_doc_id}, WebUI ID: {doc.webui_doc_id}"
+            )
+            click.echo(f"    Error: {error}")
+
+
+@cli.command(name="trace:summarize")
+@click.argument("trace_file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--top",
+    help="Number of slowest documents to show.",
+    default=10,
+    type=click.IntRange(min=1),
+)
+def trace_summarize(trace_file, top):
+    """Show the time breakdown and the slowest documents of a sync trace."""
+    summary = summarize_trace(read_trace(trace_file), top=top)
+    if not summary["documents"]:
+        click.echo("No documents found in the trace")
+        return
+
+    outcomes = ", ".join(
+        f"{count} {outcome}" for outcome, count in summary["outcomes"].most_common()
+    )
+    click.echo(f"{summary['documents']} documents: {outcomes}")
+
+    click.echo(click.style("\nTime per step:", fg="green", bold=True))
+    header = (
+        f"{'Step':<12} {'Docs':>7} {'Total':>10} {'Share':>7} "
+        f"{'p50':>9} {'p99':>9} {'Max':>9}"
+    )
+    click.echo(click.style(header, bold=True))
+    click.echo("-" * len(header))
+    for name, stats in summary["spans"].items():
+        click.echo(
+            f"{name:<12} {stats['count']:>7} {stats['total']:>9.2f}s "
+            f"{stats['share']:>7.1%} {stats['p50'] * 1000:>7.1f}ms "
+            f"{stats['p99'] * 1000:>7.1f}ms {stats['max'] * 1000:>7.1f}ms"
+        )
+
+    click.echo(click.style("\nSlowest documents:", fg="green", bold=True))
+    header = (
+        f"{'Colibo ID':<12} {'Doctype':<10} {'Depth':>5} {'Body':>9} "
+        f"{'Outcome':<9} {'Steps':>9} {'Total':>9}  Slowest step"
+    )
+    click.echo(click.style(header, bold=True))
+    click.echo("-" * len(header))
+    for record in summary["slowest"]:
+        spans = record["spans"]
+        slowest = max(spans, key=spans.get) if spans else "-"
+        depth = record["depth"] if record["depth"] is not None else "-"
+        click.echo(
+            f"{str(record['id']):<12} {str(record['doctype']):<10} {depth:>5} "
+            f"{record['body_size']:>9} {str(record['outcome']):<9} "
+            f"{sum(spans.values()):>8.3f}s {record['total']:>8.3f}s  {slowest}"
+        )
 
 
 @cli.command(name="db:list")
@@ -432,6 +1288,117 @@ def list_docs():
     click.echo(f"\nTotal: {len(rows)} documents")
 
 
+@cli.command(name="db:runs")
+@click.option("--root-doc-id", help="Only show runs of this root document.")
+@click.option("--knowledge-id", help="Only show runs to this knowledge resource.")
+@click.option(
+    "--limit",
+    help="Number of most recent runs to show.",
+    default=20,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--window",
+    help="Number of completed runs the rolling median is taken from.",
+    default=5,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--slow-factor",
+    help="Flag runs taking this many times the rolling median or more.",
+    default=1.5,
+    type=click.FloatRange(min=1),
+)
+def list_runs(root_doc_id, knowledge_id, limit, window, slow_factor):
+    """Show the history of sync runs, flagging runs slower than usual."""
+    runs = SyncRunManager().get_runs(root_doc_id=root_doc_id, knowledge_id=knowledge_id)
+    if not runs:
+        click.echo("No sync runs found")
+        return
+
+    medians = compare_runs(runs, window=window)
+
+    headers = [
+        "ID",
+        "Started",
+        "Root",
+        "Knowledge",
+        "Status",
+        "Duration",
+        "Median",
+        "New",
+        "Updated",
+        "Skipped",
+        "Failed",
+        "Uploaded",
+        "Docs/s",
+        "Note",
+    ]
+    rows = []
+    slow = 0
+    for run in runs[-limit:]:
+        duration = run.duration
+        median = medians[run.id]
+        note = ""
+        if median and duration is not None and duration >= slow_factor * median[0]:
+            # Point at the stage that slowed down the most
+            ratios = {
+                name: seconds / median[1][name]
+                for name, seconds in stage_seconds(run).items()
+                if median[1].get(name)
+            }
+            note = f"slow ({duration / median[0]:.1f}x"
+            if ratios:
+                stage = max(ratios, key=ratios.get)
+                note += f", {stage} {ratios[stage]:.1f}x"
+            note += ")"
+            if run.status == "completed":
+                slow += 1
+
+        rows.append(
+            [
+                str(run.id),
+                run.started_at.strftime("%Y-%m-%d %H:%M:%S"),
+                run.root_doc_id,
+                run.knowledge_id,
+                run.status,
+                f"{duration:.1f}s" if duration is not None else "-",
+                f"{median[0]:.1f}s" if median else "-",
+                str(run.new),
+                str(run.updated),
+                str(run.skipped),
+                str(run.failed),
+                f"{run.uploaded_bytes / 1024 / 1024:.1f} MiB",
+                f"{run.processed / duration:.1f}" if duration else "-",
+                note,
+            ]
+        )
+
+    click.echo(click.style("\nSync Runs:", fg="green", bold=True))
+
+    col_widths = [
+        max(len(str(row[i])) for row in [headers] + rows) for i in range(len(headers))
+    ]
+
+    header_row = " | ".join(h.ljust(col_widths[i]) for i, h in enumerate(headers))
+    click.echo(click.style(header_row, bold=True))
+    click.echo("-" * len(header_row))
+
+    for row in rows:
+        formatted_row = " | ".join(
+            str(cell).ljust(col_widths[i]) for i, cell in enumerate(row)
+        )
+        click.echo(
+            click.style(formatted_row, fg="yellow") if row[-1] else formatted_row
+        )
+
+    click.echo("-" * len(header_row))
+    click.echo(
+        f"\nMedian of the {window} completed runs before each run, "
+        f"{slow} completed runs {slow_factor:g}x slower or more"
+    )
+
+
 @cli.command(name="knowledge:get")
 @click.option(
     "--knowledge-id",
@@ -440,7 +1407,9 @@ def list_docs():
 )
 def get_knowledge(knowledge_id: str = WEBUI_KNOWLEDGE_ID):
     """Retrieve information about a specific knowledge resource."""
-    webui = WebUIClient(WEBUI_TOKEN, WEBUI_BASE_URL, verify_ssl=VERIFY_SSL)
+    webui = WebUIClient(
+        WEBUI_TOKEN, WEBUI_BASE_URL, verify_ssl=VERIFY_SSL, pool_size=HTTP_POOL_SIZE
+    )
 
     try:
         knowledge = webui.get_knowledge(knowledge_id)
@@ -459,10 +1428,25 @@ def get_knowledge(knowledge_id: str = WEBUI_KNOWLEDGE_ID):
 @click.option(
     "--root-doc-id", help="Id of the root document.", default=COLIBO_ROOT_DOC_ID
 )
-def colibo_sync_debug(root_doc_id):
+@click.option(
+    "--crawl-workers",
+    help="Number of concurrent requests used to crawl Colibo.",
+    default=COLIBO_CRAWL_WORKERS,
+    type=click.IntRange(min=1),
+)
+def colibo_sync_debug(root_doc_id, crawl_workers: int = COLIBO_CRAWL_WORKERS):
     """Debug Colibo synchronization. See the basic data from colibo without sending it to Open-webui"""
+    markdown_cache = get_markdown_cache()
+    http_cache = get_http_cache()
     colibo = ColiboClient(
-        COLIBO_BASE_URL, COLIBO_CLIENT_ID, COLIBO_CLIENT_SECRET, COLIBO_SCOPE
+        COLIBO_BASE_URL,
+        COLIBO_CLIENT_ID,
+        COLIBO_CLIENT_SECRET,
+        COLIBO_SCOPE,
+        pool_size=max(HTTP_POOL_SIZE, crawl_workers),
+        max_retries=COLIBO_MAX_RETRIES,
+        markdown_cache=markdown_cache,
+        http_cache=http_cache,
     )
     doc = colibo.get_document(root_doc_id)
     click.echo(click.style("Root document information:", fg="green", bold=True))
@@ -477,7 +1461,9 @@ def colibo_sync_debug(root_doc_id):
     click.echo(f"\n")
 
     counter = 0
-    docs = colibo.get_children(doc["id"], visited_ids={root_doc_id})
+    docs = colibo.get_children(
+        doc["id"], visited_ids={root_doc_id}, workers=crawl_workers
+    )
     click.echo(click.style("Child docs:", fg="green", bold=True))
     for item in docs:
         counter += 1
@@ -500,14 +1486,22 @@ def colibo_sync_debug(root_doc_id):
         click.echo(f"Keywords: {doc['keywords']}")
         click.echo(f"\n")
     click.echo(f"Total child docs: {click.style(counter, fg='blue')}")
+    echo_markdown_cache_stats(click.echo, markdown_cache)
+    echo_http_cache_stats(click.echo, http_cache)
+    echo_rate_limit_stats(click.echo, colibo.limiter.stats())
 
 
 @cli.command(name="debug:colibo:get-doc")
 @click.argument("doc_id", type=int)
 def colibo_get_doc(doc_id):
     """Debug Colibo document retrieval. See the basic data from colibo without sending it to Open-webui"""
+    markdown_cache = get_markdown_cache()
     colibo = ColiboClient(
-        COLIBO_BASE_URL, COLIBO_CLIENT_ID, COLIBO_CLIENT_SECRET, COLIBO_SCOPE
+        COLIBO_BASE_URL,
+        COLIBO_CLIENT_ID,
+        COLIBO_CLIENT_SECRET,
+        COLIBO_SCOPE,
+        markdown_cache=markdown_cache,
     )
     doc = colibo.get_document(doc_id)
     click.echo(click.style("Document information:", fg="green", bold=True))
@@ -518,6 +1512,7 @@ def colibo_get_doc(doc_id):
     click.echo(f"Child count: {doc['childCount']}")
     click.echo(f"Created at: {doc['created']}")
     click.echo(f"Updated at: {doc['updated']}")
+    echo_markdown_cache_stats(click.echo, markdown_cache)
 
 
 if __name__ == "__main__":
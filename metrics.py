@@ -0,0 +1,315 @@
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds of the histogram buckets, in seconds
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONVERSION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+# Name -> (type, unit, help, buckets) of every metric of a sync run
+METRICS = {
+    "colibo_sync_http_requests": (
+        "counter",
+        None,
+        "HTTP requests sent, by response status.",
+        None,
+    ),
+    "colibo_sync_http_request_duration_seconds": (
+        "histogram",
+        "seconds",
+        "Time until the HTTP response body has been received.",
+        HTTP_BUCKETS,
+    ),
+    "colibo_sync_http_request_bytes": (
+        "counter",
+        "bytes",
+        "Bytes sent in HTTP request bodies.",
+        None,
+    ),
+    "colibo_sync_http_response_bytes": (
+        "counter",
+        "bytes",
+        "Bytes received in HTTP response bodies.",
+        None,
+    ),
+    "colibo_sync_conversion_duration_seconds": (
+        "histogram",
+        "seconds",
+        "Time converting a document body from HTML to Markdown (cache misses only).",
+        CONVERSION_BUCKETS,
+    ),
+    "colibo_sync_db_query_duration_seconds": (
+        "histogram",
+        "seconds",
+        "Time executing database statements.",
+        DB_BUCKETS,
+    ),
+    "colibo_sync_documents": (
+        "counter",
+        None,
+        "Documents handled by the sync, by outcome.",
+        None,
+    ),
+    "colibo_sync_stage_busy_seconds": (
+        "gauge",
+        "seconds",
+        "Time the workers of a pipeline stage spent working.",
+        None,
+    ),
+    "colibo_sync_stage_documents": (
+        "gauge",
+        None,
+        "Documents received by a pipeline stage.",
+        None,
+    ),
+    "colibo_sync_run_duration_seconds": (
+        "gauge",
+        "seconds",
+        "Duration of the sync run.",
+        None,
+    ),
+    "colibo_sync_run_success": (
+        "gauge",
+        None,
+        "1 if the sync run completed, 0 if it failed.",
+        None,
+    ),
+    "colibo_sync_last_run_timestamp_seconds": (
+        "gauge",
+        "seconds",
+        "Unix time the sync run finished.",
+        None,
+    ),
+}
+
+# Path segments that are IDs (numbers or UUIDs) are replaced in endpoint labels
+ID_SEGMENT = re.compile(r"^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F-]{27})$")
+
+
+def endpoint(url):
+    """Get the path of a URL with the IDs replaced, to keep the number of label values small."""
+    path = url.split("?", 1)[0].split("://", 1)[-1]
+    path = "/" + path.split("/", 1)[1] if "/" in path else "/"
+    return "/".join(
+        "{id}" if ID_SEGMENT.match(segment) else segment for segment in path.split("/")
+    )
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms of a sync run.
+
+    All methods are thread safe. The metrics describe a single run: they
+    start at zero, and are written once at the end of the run, see
+    write_prometheus() and write_json().
+    """
+
+    def __init__(self):
+        self.created = time.time()
+        self._lock = threading.Lock()
+        # Name -> label tuple -> value, or [bucket counts, sum, count] for histograms
+        self._values = {name: {} for name in METRICS}
+
+    def inc(self, name, value=1, **labels):
+        """Increase a counter."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values[name]
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[name][key] = value
+
+    def observe(self, name, value, **labels):
+        """Add a value to a histogram."""
+        buckets = METRICS[name][3]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values[name]
+            histogram = values.get(key)
+            if histogram is None:
+                histogram = values[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def instrument_session(self, session, client):
+        """
+        Record every response of a requests session.
+
+        Args:
+            session: The requests.Session of an API client
+            client (str): The name of the client, used as label
+        """
+
+        def record(response, *args, **kwargs):
+            started = time.perf_counter()
+            # Read the body here, so the download is part of the duration
+            body = response.content
+            duration = response.elapsed.total_seconds() + (
+                time.perf_counter() - started
+            )
+
+            request = response.request
+            labels = {
+                "client": client,
+                "method": request.method,
+                "endpoint": endpoint(request.url),
+            }
+            self.inc(
+                "colibo_sync_http_requests", status=str(response.status_code), **labels
+            )
+            self.observe(
+                "colibo_sync_http_request_duration_seconds", duration, **labels
+            )
+            request_body = request.body or b""
+            self.inc(
+                "colibo_sync_http_request_bytes",
+                len(request_body),
+                client=client,
+                endpoint=labels["endpoint"],
+            )
+            self.inc(
+                "colibo_sync_http_response_bytes",
+                len(body or b""),
+                client=client,
+                endpoint=labels["endpoint"],
+            )
+
+        session.hooks["response"].append(record)
+
+    @contextlib.contextmanager
+    def instrument_db(self):
+        """Record the time of every database statement executed in the context."""
+
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+        def after(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info["metrics_started"].pop()
+            self.observe(
+                "colibo_sync_db_query_duration_seconds",
+                time.perf_counter() - started,
+                statement=statement.lstrip().split(None, 1)[0].upper(),
+            )
+
+        # Every manager creates its own engine, so listen on all of them
+        event.listen(Engine, "before_cursor_execute", before)
+        event.listen(Engine, "after_cursor_execute", after)
+        try:
+            yield self
+        finally:
+            event.remove(Engine, "before_cursor_execute", before)
+            event.remove(Engine, "after_cursor_execute", after)
+
+    def _samples(self, name):
+        """Yield the (suffix, labels, value) samples of a metric."""
+        metric_type, _, _, buckets = METRICS[name]
+        for key, value in sorted(self._values[name].items()):
+            if metric_type == "counter":
+                yield "", key, value
+            elif metric_type == "gauge":
+                yield "", key, value
+            else:
+                counts, total, count = value
+                for bound, bucket_count in zip(buckets, counts):
+                    yield "_bucket", key + (
+                        ("le", _format_value(float(bound))),
+                    ), bucket_count
+                yield "_bucket", key + (("le", "+Inf"),), count
+                yield "_sum", key, total
+                yield "_count", key, count
+
+    def prometheus(self):
+        """
+        Format the metrics in the Prometheus text format (0.0.4), the format
+        read by the textfile collector of the node exporter.
+        """
+        lines = []
+        with self._lock:
+            for name, (metric_type, _, help_text, _) in METRICS.items():
+                if not self._values[name]:
+                    continue
+                # Counters are named after their samples
+                family = f"{name}_total" if metric_type == "counter" else name
+                help_text = help_text.replace("\\", r"\\").replace("\n", r"\n")
+                lines.append(f"# HELP {family} {help_text}")
+                lines.append(f"# TYPE {family} {metric_type}")
+                for suffix, labels, value in self._samples(name):
+                    sample = f"{family}{suffix}{_format_labels(labels)}"
+                    lines.append(f"{sample} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def as_dict(self):
+        """Get the metrics as a JSON serializable dict."""
+        result = {}
+        with self._lock:
+            for name, (metric_type, unit, help_text, buckets) in METRICS.items():
+                samples = []
+                for key, value in sorted(self._values[name].items()):
+                    sample = {"labels": dict(key)}
+                    if metric_type == "histogram":
+                        counts, total, count = value
+                        sample["buckets"] = {
+                            _format_value(float(bound)): bucket_count
+                            for bound, bucket_count in zip(buckets, counts)
+                        }
+                        sample["sum"] = total
+                        sample["count"] = count
+                    else:
+                        sample["value"] = value
+                    samples.append(sample)
+                if samples:
+                    result[name] = {
+                        "type": metric_type,
+                        "unit": unit,
+                        "help": help_text,
+                        "samples": samples,
+                    }
+        return {"created": self.created, "metrics": result}
+
+    @staticmethod
+    def _write(path, content):
+        """Replace a file at once, so a scraper never reads half of it."""
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temporary, path)
+
+    def write_prometheus(self, path):
+        """Write the metrics to a Prometheus text file."""
+        self._write(path, self.prometheus())
+
+    def write_json(self, path):
+        """Write the metrics to a JSON file."""
+        self._write(path, json.dumps(self.as_dict(), indent=2) + "\n")
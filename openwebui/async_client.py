@@ -0,0 +1,225 @@
+import httpx
+
+from openwebui.exceptions import WebUINotFoundError, WebUIError
+
+
+class AsyncClient:
+    """Asyncio version of the Open-WebUI client built on httpx."""
+
+    def __init__(self, token, base_url, verify_ssl, pool_size=20):
+        """
+        Initialize the client.
+
+        Args:
+            token (str): API token for Open-WebUI
+            base_url (str): Base URL of the Open-WebUI installation
+            verify_ssl (bool): Verify the TLS certificate of the server
+            pool_size (int): Size of the shared connection pool
+        """
+        self.token = token
+        self.base_url = base_url
+        self.verify_ssl = verify_ssl
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            verify=verify_ssl,
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+            ),
+            # Uploads block until the file has been processed, which can be slow.
+            timeout=httpx.Timeout(300.0),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """Close the connection pool."""
+        await self.http.aclose()
+
+    async def upload_from_string(self, content, filename, content_type, metadata):
+        """
+        Upload file content from an in-memory string or byte object.
+
+        Args:
+            content (str or bytes): The content to upload
+            filename (str): The filename to use for the uploaded content
+            content_type (str): The MIME type of the content
+            metadata (dict): Metadata for the file
+
+        Returns:
+            The decoded JSON response from the API
+        """
+        headers = {"Authorization": f"Bearer {self.token}"}
+
+        # Convert string to bytes if needed
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+
+        files = {"file": (filename, content, content_type)}
+
+        # For multipart/form-data, we need to send metadata as a form field
+        form_data = {
+            "metadata": str(metadata).replace("'", '"')
+        }  # Convert Python dict to JSON string
+
+        url = "/api/v1/files/?process=true&process_in_background=false"
+        response = await self.http.post(
+            url, headers=headers, data=form_data, files=files
+        )
+
+        # Check if the response status code is 200
+        if response.status_code != 200:
+            raise WebUIError(
+                f"Upload from string API request failed with status code {response.status_code}: {response.text}"
+            )
+
+        return response.json()
+
+    async def update_file_content(self, file_id, content):
+        """
+        Update the content of an existing file using an in-memory string.
+
+        Args:
+            file_id (str): The ID of the file to update
+            content (str): The new content to replace the file with
+
+        Returns:
+            True on success
+        """
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+            "accept": "application/json",
+        }
+
+        data = {"content": content}
+
+        url = f"/api/v1/files/{file_id}/data/content/update"
+        response = await self.http.post(url, headers=headers, json=data)
+
+        # Check if the response status code is not 200
+        if response.status_code != 200:
+            raise WebUIError(
+                f"Update file content API request failed with status code {response.status_code}: {response.text}"
+            )
+
+        return True
+
+    async def delete_file(self, file_id):
+        """
+        Delete an existing file by its ID.
+
+        Args:
+            file_id (str): The ID of the file to delete
+
+        Returns:
+            Response object from the API request
+        """
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "accept": "application/json",
+        }
+
+        url = f"/api/v1/files/{file_id}"
+        response = await self.http.delete(url, headers=headers)
+
+        # Check if the response status code is not successful (2xx range)
+        if not (200 <= response.status_code < 300):
+            raise WebUIError(
+                f"Delete file API request failed with status code {response.status_code}: {response.text}"
+            )
+
+        return response
+
+    async def add_file_to_knowledge(self, knowledge_id, file_id):
+        """
+        Add an existing file to a knowledge resource.
+
+        Args:
+            knowledge_id (str): The ID of the knowledge resource
+            file_id (str): The ID of the file to add
+
+        Returns:
+            True on success
+        """
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+            "accept": "application/json",
+        }
+
+        data = {"file_id": file_id}
+
+        url = f"/api/v1/knowledge/{knowledge_id}/file/add"
+        response = await self.http.post(url, headers=headers, json=data)
+
+        # Check if the response status code is not 200
+        if response.status_code != 200:
+            raise WebUIError(
+                f"Add knowledge API request failed with status code {response.status_code}: {response.text}"
+            )
+
+        return True
+
+    async def remove_file_from_knowledge(self, knowledge_id, file_id):
+        """
+        Remove a file from a knowledge resource.
+
+        Args:
+            knowledge_id (str): The ID of the knowledge resource
+            file_id (str): The ID of the file to remove
+
+        Returns:
+            Response object from the API request
+        """
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+            "accept": "application/json",
+        }
+
+        data = {"file_id": file_id}
+
+        url = f"/api/v1/knowledge/{knowledge_id}/file/remove"
+        response = await self.http.post(url, headers=headers, json=data)
+
+        # Check if the response status code is not successful (2xx range)
+        if not (200 <= response.status_code < 300):
+            if response.status_code == 404:
+                raise WebUINotFoundError(f"{response.text}")
+            else:
+                raise WebUIError(
+                    f"Remove from knowledge API request failed with status code {response.status_code}: {response.text}"
+                )
+
+        return response
+
+    async def get_knowledge(self, knowledge_id):
+        """
+        Retrieve information about a specific knowledge resource.
+
+        Args:
+            knowledge_id (str): The ID of the knowledge resource to retrieve
+
+        Returns:
+            The decoded JSON response from the API
+        """
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "accept": "application/json",
+        }
+
+        url = f"/api/v1/knowledge/{knowledge_id}"
+        response = await self.http.get(url, headers=headers)
+
+        # Check if the response status code is 200
+        if response.status_code != 200:
+            raise WebUIError(
+                f"Get knowledge API request failed with status code {response.status_code}: {response.text}"
+            )
+
+        return response.json()
@@ -1,15 +1,35 @@
 import requests
+from requests.adapters import HTTPAdapter
 from openwebui.exceptions import WebUINotFoundError, WebUIError
 
 
 class Client:
-    def __init__(self, token, base_url, verify_ssl):
+    def __init__(self, token, base_url, verify_ssl, pool_size=10, metrics=None):
         self.token = token
         self.base_url = base_url
         self.verify_ssl = verify_ssl
-        pass
 
-    def upload_from_string(self, content, filename, content_type, metadata):
+        # Reuse connections (keep-alive) for all requests made by this client
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if metrics is not None:
+            metrics.instrument_session(self.session, "openwebui")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+
+    def upload_from_string(
+        self, content, filename, content_type, metadata, background=False
+    ):
         """
         Upload file content from an in-memory string or byte object.
 
@@ -18,6 +38,8 @@ class Client:
             filename (str): The filename to use for the uploaded content
             content_type (str): The MIME type of the content
             metadata (dict): Metadata for the file
+            background (bool): Return before the file has been processed (extracted
+                and embedded), see get_processing_status()
 
         Returns:
             Response object from the API request
@@ -36,8 +58,9 @@ class Client:
             "metadata": str(metadata).replace("'", '"')
         }  # Convert Python dict to JSON string
 
-        url = f"{self.base_url}/api/v1/files/?process=true&process_in_background=false"
-        response = requests.post(
+        process_in_background = "true" if background else "false"
+        url = f"{self.base_url}/api/v1/files/?process=true&process_in_background={process_in_background}"
+        response = self.session.post(
             url, headers=headers, data=form_data, files=files, verify=self.verify_ssl
         )
 
@@ -49,6 +72,33 @@ class Client:
 
         return response.json()
 
+    def get_processing_status(self, file_id):
+        """
+        Get the processing status of a file uploaded in the background.
+
+        Args:
+            file_id (str): The ID of the file
+
+        Returns:
+            The status response, with "status" "pending", "completed" or "failed"
+        """
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "accept": "application/json",
+        }
+
+        url = f"{self.base_url}/api/v1/files/{file_id}/process/status"
+        response = self.session.get(url, headers=headers, verify=self.verify_ssl)
+
+        if response.status_code != 200:
+            if response.status_code == 404:
+                raise WebUINotFoundError(f"{response.text}")
+            raise WebUIError(
+                f"Processing status API request failed with status code {response.status_code}: {response.text}"
+            )
+
+        return response.json()
+
     def update_file_content(self, file_id, content):
         """
         Update the content of an existing file using an in-memory string.
@@ -69,7 +119,7 @@ class Client:
         data = {"content": content}
 
         url = f"{self.base_url}/api/v1/files/{file_id}/data/content/update"
-        response = requests.post(
+        response = self.session.post(
             url, headers=headers, json=data, verify=self.verify_ssl
         )
 
@@ -97,7 +147,7 @@ class Client:
         }
 
         url = f"{self.base_url}/api/v1/files/{file_id}"
-        response = requests.delete(url, headers=headers, verify=self.verify_ssl)
+        response = self.session.delete(url, headers=headers, verify=self.verify_ssl)
 
         # Check if the response status code is not successful (2xx range)
         if not (200 <= response.status_code < 300):
@@ -127,7 +177,7 @@ class Client:
         data = {"file_id": file_id}
 
         url = f"{self.base_url}/api/v1/knowledge/{knowledge_id}/file/add"
-        response = requests.post(
+        response = self.session.post(
             url, headers=headers, json=data, verify=self.verify_ssl
         )
 
@@ -159,7 +209,7 @@ class Client:
         data = {"file_id": file_id}
 
         url = f"{self.base_url}/api/v1/knowledge/{knowledge_id}/file/remove"
-        response = requests.post(
+        response = self.session.post(
             url, headers=headers, json=data, verify=self.verify_ssl
         )
 
@@ -174,6 +224,34 @@ class Client:
 
         return response
 
+    def reset_knowledge(self, knowledge_id):
+        """
+        Remove all files from a knowledge resource in one request.
+
+        Args:
+            knowledge_id (str): The ID of the knowledge resource to reset
+
+        Returns:
+            The knowledge resource after the reset
+        """
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "accept": "application/json",
+        }
+
+        url = f"{self.base_url}/api/v1/knowledge/{knowledge_id}/reset"
+        response = self.session.post(url, headers=headers, verify=self.verify_ssl)
+
+        # Check if the response status code is not successful (2xx range)
+        if not (200 <= response.status_code < 300):
+            if response.status_code == 404:
+                raise WebUINotFoundError(f"{response.text}")
+            raise WebUIError(
+                f"Reset knowledge API request failed with status code {response.status_code}: {response.text}"
+            )
+
+        return response.json()
+
     def get_knowledge(self, knowledge_id):
         """
         Retrieve information about a specific knowledge resource.
@@ -190,7 +268,7 @@ class Client:
         }
 
         url = f"{self.base_url}/api/v1/knowledge/{knowledge_id}"
-        response = requests.get(url, headers=headers, verify=self.verify_ssl)
+        response = self.session.get(url, headers=headers, verify=self.verify_ssl)
 
         # Check if the response status code is 200
         if response.status_code != 200:
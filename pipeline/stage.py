@@ -0,0 +1,273 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the input of a stage worker
+_DONE = object()
+
+
+class _Stopped(Exception):
+    """Raised in stage workers when the pipeline has been stopped."""
+
+
+class Stage:
+    """A step in a pipeline, run by one or more worker threads."""
+
+    def __init__(self, name, func=None, workers=1, queue_size=100, stream=None):
+        """
+        Initialize the stage.
+
+        Give either func or stream.
+
+        Args:
+            name (str): Name of the stage, used in statistics
+            func: Function called with each item. Returns the item to pass on
+                to the next stage, or None to drop it
+            workers (int): Number of threads calling func
+            queue_size (int): Maximum number of items waiting in front of the stage
+            stream: Function called with an iterator over all items, yielding the
+                items to pass on. It runs in a single thread, so the order of the
+                items is kept. The first stage of a pipeline gets no items.
+        """
+        if (func is None) == (stream is None):
+            raise ValueError("A stage needs either a func or a stream")
+
+        self.name = name
+        self.func = func
+        self.stream = stream
+        self.workers = 1 if stream else max(1, workers)
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.next = None
+        self.pipeline = None
+
+        # Statistics
+        self.received = 0
+        self.emitted = 0
+        self.busy = 0.0
+        self.max_depth = 0
+        self.started_at = None
+        self.finished_at = None
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def _get(self):
+        """Wait for the next item in the queue."""
+        while True:
+            if self.pipeline.stopped.is_set():
+                raise _Stopped()
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if item is not _DONE:
+                with self._lock:
+                    self.received += 1
+            return item
+
+    def _put(self, item):
+        """Put an item in the queue, waiting while the queue is full."""
+        while True:
+            if self.pipeline.stopped.is_set():
+                raise _Stopped()
+            try:
+                self.queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+
+            depth = self.queue.qsize()
+            with self._lock:
+                self.max_depth = max(self.max_depth, depth)
+                self._depth_total += depth
+                self._depth_samples += 1
+            return
+
+    def _emit(self, item):
+        """Pass an item on to the next stage."""
+        with self._lock:
+            self.emitted += 1
+        if self.next is not None:
+            self.next._put(item)
+
+    def _inputs(self):
+        """Iterate over the items in the queue, not counting time spent waiting."""
+        while True:
+            started = time.perf_counter()
+            item = self._get()
+            with self._lock:
+                self.busy -= time.perf_counter() - started
+            if item is _DONE:
+                return
+            yield item
+
+    def _work(self):
+        """Worker thread for func stages."""
+        while True:
+            item = self._get()
+            if item is _DONE:
+                return
+
+            started = time.perf_counter()
+            result = self.func(item)
+            with self._lock:
+                self.busy += time.perf_counter() - started
+
+            if result is not None:
+                self._emit(result)
+
+    def _work_stream(self):
+        """Worker thread for stream stages."""
+        # The first stage produces items without any input
+        inputs = iter(()) if self is self.pipeline.stages[0] else self._inputs()
+
+        started = time.perf_counter()
+        results = iter(self.stream(inputs))
+        while True:
+            try:
+                result = next(results)
+            except StopIteration:
+                break
+            with self._lock:
+                self.busy += time.perf_counter() - started
+            self._emit(result)
+            started = time.perf_counter()
+
+        with self._lock:
+            self.busy += time.perf_counter() - started
+
+    def _run(self):
+        """Entry point of a worker thread."""
+        try:
+            if self.stream:
+                self._work_stream()
+            else:
+                self._work()
+        except _Stopped:
+            return
+        except BaseException as e:
+            self.pipeline._fail(self, e)
+            return
+
+        # The last worker to finish tells the workers of the next stage.
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+            if last:
+                self.finished_at = time.monotonic()
+        if last and self.next is not None:
+            try:
+                for _ in range(self.next.workers):
+                    self.next._put(_DONE)
+            except _Stopped:
+                pass
+
+    def stats(self):
+        """Get the statistics of the stage."""
+        with self._lock:
+            end = self.finished_at or time.monotonic()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            return {
+                "name": self.name,
+                "workers": self.workers,
+                "received": self.received,
+                "emitted": self.emitted,
+                "queued": self.queue.qsize(),
+                "max_queued": self.max_depth,
+                "avg_queued": (
+                    self._depth_total / self._depth_samples
+                    if self._depth_samples
+                    else 0.0
+                ),
+                "busy": self.busy,
+                "elapsed": elapsed,
+                # Share of the worker time spent working instead of waiting,
+                # the bottleneck is the stage closest to 100%.
+                "utilization": (
+                    self.busy / (elapsed * self.workers) if elapsed else 0.0
+                ),
+                "throughput": self.emitted / elapsed if elapsed else 0.0,
+            }
+
+
+class Pipeline:
+    """Stages connected by bounded queues, each stage running in its own threads."""
+
+    def __init__(self, stages, monitor_interval=None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            stages (list): The stages, in order. The first stage must be a stream stage
+            monitor_interval (float): Log the queue depths and throughput of every
+                stage this often (in seconds), or never if None
+        """
+        self.stages = stages
+        self.monitor_interval = monitor_interval
+        self.stopped = threading.Event()
+        self.error = None
+
+        for stage, next_stage in zip(stages, stages[1:] + [None]):
+            stage.next = next_stage
+            stage.pipeline = self
+
+    def _fail(self, stage, error):
+        """Stop all stages after an error in a stage."""
+        if self.error is None:
+            logger.error(f"Pipeline stage {stage.name} failed: {error}")
+            self.error = error
+        self.stopped.set()
+
+    def _monitor(self, done):
+        while not done.wait(self.monitor_interval):
+            logger.info(
+                "Pipeline: "
+                + ", ".join(
+                    f"{stats['name']} {stats['received']} in/{stats['emitted']} out "
+                    f"({stats['throughput']:.1f}/s, {stats['queued']} queued)"
+                    for stats in self.stats()
+                )
+            )
+
+    def run(self):
+        """Run all stages until the first stage is exhausted and every item has passed through."""
+        threads = []
+        for stage in self.stages:
+            stage.started_at = time.monotonic()
+            stage._running = stage.workers
+            for i in range(stage.workers):
+                threads.append(
+                    threading.Thread(
+                        target=stage._run, name=f"{stage.name}-{i}", daemon=True
+                    )
+                )
+
+        done = threading.Event()
+        if self.monitor_interval:
+            threading.Thread(
+                target=self._monitor, args=(done,), name="pipeline-monitor", daemon=True
+            ).start()
+
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                # Join with a timeout, so KeyboardInterrupt is not blocked
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except BaseException:
+            self.stopped.set()
+            raise
+        finally:
+            done.set()
+
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        """Get the statistics of all stages."""
+        return [stage.stats() for stage in self.stages]
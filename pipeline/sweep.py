@@ -0,0 +1,133 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from openwebui.exceptions import WebUIError, WebUINotFoundError
+
+
+def sweep_documents(
+    webui,
+    sync_manager,
+    knowledge_id,
+    generation,
+    root_doc_ids,
+    max_percent=10.0,
+    workers=1,
+    echo=print,
+):
+    """
+    Remove documents the sync of a generation did not see from the knowledge base.
+
+    Only the documents owned by the crawled roots are removed, so the
+    documents other roots synced to the same knowledge base are kept. The
+    documents are removed from Open-WebUI in parallel, and their records
+    deleted from the database in bulk. Nothing is removed if more than
+    max_percent of the documents of the roots would be, as that is
+    more likely a broken crawl (or the wrong root) than deleted documents.
+
+    Args:
+        webui: Open-WebUI client
+        sync_manager: SyncManager holding the synced documents
+        knowledge_id (str): The knowledge base to sweep
+        generation (int): Generation the seen documents were tagged with,
+            see SyncManager.mark_seen()
+        root_doc_ids (list): The roots crawled into the knowledge base
+        max_percent (float): Maximum share of the documents to remove at once
+        workers (int): Number of documents removed at the same time
+        echo: Function used to report errors
+
+    Returns:
+        Counter with the number of "unseen", "swept" and "failed" documents,
+        and "refused" set to 1 if the threshold stopped the sweep
+    """
+    counts = Counter()
+    unseen = sync_manager.get_unseen_documents(knowledge_id, generation, root_doc_ids)
+    counts["unseen"] = len(unseen)
+    if not unseen:
+        return counts
+
+    total = sync_manager.count_documents(knowledge_id, root_doc_ids)
+    if len(unseen) > total * max_percent / 100:
+        counts["refused"] = 1
+        return counts
+
+    swept, errors = remove_documents(
+        webui, sync_manager, knowledge_id, unseen, workers=workers
+    )
+    for doc, error in errors:
+        echo(
+            f"Error removing doc id {doc.colibo_doc_id} from knowledge {knowledge_id}: {error}"
+        )
+    counts["swept"] = swept
+    counts["failed"] = len(errors)
+    return counts
+
+
+def remove_documents(
+    webui,
+    sync_manager,
+    knowledge_id,
+    docs,
+    workers=1,
+    batch_size=500,
+    progress=None,
+):
+    """
+    Remove synced documents from a knowledge base and delete their records.
+
+    Documents are removed from Open-WebUI by a pool of threads, and their
+    records are deleted from the database in batches as they are removed.
+
+    Args:
+        webui: Open-WebUI client
+        sync_manager: SyncManager holding the synced documents
+        knowledge_id (str): The knowledge base to remove the documents from
+        docs (list): The SyncedDocument records to remove
+        workers (int): Number of documents removed at the same time
+        batch_size (int): Number of records deleted from the database at once
+        progress: Optional function wrapping the iterator over the results,
+            used to display progress
+
+    Returns:
+        Tuple of the number of documents removed, and a list of
+        (document, error) tuples of the documents that could not be removed
+    """
+
+    def remove(webui_doc_id):
+        try:
+            # Open-WebUI deletes the file together with its knowledge mapping
+            webui.remove_file_from_knowledge(knowledge_id, webui_doc_id)
+            return None
+        except WebUINotFoundError:
+            # Already removed in Open-WebUI, only the record is left
+            return None
+        except WebUIError as e:
+            return e
+
+    # Read the IDs up front, the records expire when a batch is deleted and
+    # must not be reloaded from the worker threads
+    ids = [(doc.colibo_doc_id, doc.webui_doc_id) for doc in docs]
+
+    removed = 0
+    errors = []
+    batch = []
+    with ThreadPoolExecutor(
+        max_workers=max(1, workers), thread_name_prefix="webui-remove"
+    ) as executor:
+        results = zip(
+            docs, ids, executor.map(remove, [webui_id for _, webui_id in ids])
+        )
+        if progress is not None:
+            results = progress(results)
+
+        for doc, (colibo_doc_id, _), error in results:
+            if error is not None:
+                errors.append((doc, error))
+                continue
+            batch.append(colibo_doc_id)
+            if len(batch) >= batch_size:
+                removed += sync_manager.delete_documents(batch, knowledge_id)
+                batch = []
+
+    if batch:
+        removed += sync_manager.delete_documents(batch, knowledge_id)
+    return removed, errors
@@ -0,0 +1,600 @@
+import statistics
+import threading
+import time
+from collections import Counter, deque
+
+from colibo.rate_limit import AdaptiveLimiter
+from helpers import build_content, content_digest, filename
+from openwebui.exceptions import WebUIError
+from pipeline.stage import Pipeline, Stage
+
+# Number of recent processing times the backlog is adapted to, see
+# SyncPipeline._release_backlog()
+PROCESSING_WINDOW = 20
+
+
+def upload_document(
+    webui, knowledge_id, item, content, webui_doc_id=None, background=False, spans=None
+):
+    """
+    Upload a document to Open-WebUI, or update it if it has been uploaded before.
+
+    This only talks to Open-WebUI, so it is safe to run in a worker thread.
+
+    With background, a new document is processed by Open-WebUI after the
+    upload returns, and it is not added to the knowledge base, as that is only
+    possible once it has been processed. Updates are always processed before
+    they return.
+
+    The "upload" and "attach" times are stored in spans, if given.
+
+    Returns:
+        The Open-WebUI file id of the document
+    """
+    started = time.perf_counter()
+    if webui_doc_id:
+        webui.update_file_content(webui_doc_id, content)
+        if spans is not None:
+            spans["upload"] = time.perf_counter() - started
+        return webui_doc_id
+
+    res = webui.upload_from_string(
+        content=content,
+        filename=filename(item.get("title", item["id"])),
+        content_type="text/markdown",
+        metadata={
+            "doctype": item["doctype"],
+            "keywords": item["keywords"],
+            "url": item["url"],
+        },
+        background=background,
+    )
+    uploaded = time.perf_counter()
+    if spans is not None:
+        spans["upload"] = uploaded - started
+    if not background:
+        webui.add_file_to_knowledge(knowledge_id, res["id"])
+        if spans is not None:
+            spans["attach"] = time.perf_counter() - uploaded
+    return res["id"]
+
+
+class Job:
+    """A document on its way through the sync pipeline."""
+
+    def __init__(self, item, knowledge_id, root=False, root_doc_id=None):
+        self.item = item
+        self.knowledge_id = knowledge_id
+        # The root document is compared by content only, not by timestamp
+        self.root = root
+        # The root whose crawl found the document
+        self.root_doc_id = root_doc_id
+        self.existing = None
+        self.content = None
+        self.content_hash = None
+        self.webui_doc_id = None
+        # "new", "updated", "unchanged", "skipped", "ignored" or "failed"
+        self.outcome = None
+        self.error = None
+        # Set while Open-WebUI processes the uploaded file in the background
+        self.processing = False
+        # The backlog slot held while the file is processed, see SyncPipeline.process
+        self.backlog_ticket = None
+        # Seconds spent per step in the pipeline, see pipeline.trace
+        self.spans = {}
+        self.created_at = time.monotonic()
+
+
+class SyncPipeline:
+    """
+    Synchronize documents from Colibo roots to Open-WebUI knowledge bases.
+
+    The work is split into stages connected by bounded queues:
+
+    crawl -> diff -> transform -> upload -> [process] -> record
+
+    The diff stage drops documents that have not been updated since the last
+    sync before the transform stage converts anything to Markdown. The diff and
+    record stages are the only ones using the database.
+
+    With background processing, new documents are uploaded without waiting for
+    Open-WebUI to extract and embed them. The process stage polls each file,
+    soon at first and less often the longer it takes, until it has been
+    processed and then adds it to the knowledge base. The upload stage waits
+    while the backlog is full, so uploads go no faster than Open-WebUI can
+    embed them. The backlog starts at max_backlog files and is halved when
+    processing becomes much slower than the median of the recent files, a
+    sign that files are queuing in Open-WebUI, and grows back while it is not.
+
+    Each root is crawled once for all the knowledge bases it is synced to, and
+    the same document object is used for all of them, so its body is only
+    converted once.
+
+    With a checkpoint, every document leaving the pipeline is marked as done,
+    and the checkpoint is saved periodically while the pipeline runs. With a
+    trace, a line with the time spent in each step is written for every
+    document leaving the pipeline.
+    """
+
+    def __init__(
+        self,
+        colibo,
+        webui,
+        sync_manager,
+        targets,
+        force_update=False,
+        crawl_workers=1,
+        transform_workers=1,
+        upload_workers=1,
+        queue_size=100,
+        conversion_pool=None,
+        progress=None,
+        echo=print,
+        checkpoint=None,
+        resume=False,
+        deadline=None,
+        checkpoint_interval=30.0,
+        background=False,
+        max_backlog=20,
+        poll_interval=1.0,
+        processing_timeout=600.0,
+        trace=None,
+    ):
+        """
+        Initialize the pipeline.
+
+        Args:
+            colibo: Colibo client
+            webui: Open-WebUI client
+            sync_manager: SyncManager used to look up and record synced documents
+            targets (list): (root document ID, knowledge base ID) tuples to sync
+            force_update (bool): Upload all documents, changed or not
+            crawl_workers (int): Number of concurrent requests used to crawl Colibo
+            transform_workers (int): Number of threads building document content
+            upload_workers (int): Number of documents uploaded at the same time
+            queue_size (int): Maximum number of documents waiting in front of each stage
+            conversion_pool: Optional colibo.converter.ConversionPool, converting
+                bodies in other processes (replaces the transform threads)
+            progress: Optional function wrapping the iterator over the crawled
+                children, used to display progress
+            echo: Function used to report errors
+            checkpoint: Optional db.checkpoint.CheckpointManager, started or
+                resumed, only used with a single target
+            resume (bool): Continue the sync saved in the checkpoint
+            deadline (float): Optional time.monotonic() time to stop at. Documents
+                not transformed or uploaded by then stay pending in the checkpoint
+            checkpoint_interval (float): Save the checkpoint this often (in seconds)
+            background (bool): Let Open-WebUI process new documents in the
+                background, see the process stage
+            max_backlog (int): Maximum number of files being processed in the
+                background at the same time
+            poll_interval (float): Longest wait between two checks of the
+                processing status of a file (in seconds)
+            processing_timeout (float): Give up on a file that has not been
+                processed after this many seconds
+            trace: Optional pipeline.trace.TraceWriter
+        """
+        self.colibo = colibo
+        self.webui = webui
+        self.sync_manager = sync_manager
+        self.targets = targets
+        self.force_update = force_update
+        self.crawl_workers = crawl_workers
+        self.transform_workers = transform_workers
+        self.upload_workers = upload_workers
+        self.queue_size = queue_size
+        self.conversion_pool = conversion_pool
+        self.progress = progress
+        self.echo = echo
+        self.checkpoint = checkpoint
+        self.resume = resume
+        self.deadline = deadline
+        self.checkpoint_interval = checkpoint_interval
+        self.background = background
+        self.max_backlog = max_backlog
+        self.poll_interval = poll_interval
+        self.processing_timeout = processing_timeout
+        self.trace = trace
+
+        # Set when the sync stopped at the deadline
+        self.timed_out = False
+        self.counts = Counter()
+        # Size of the content uploaded to Open-WebUI
+        self.uploaded_bytes = 0
+        self.pipeline = None
+        self._lock = threading.Lock()
+        # Knowledge base -> ID of every document crawled -> the root that found
+        # it first, see pipeline.sweep
+        self.seen_ids = {knowledge_id: {} for _, knowledge_id in targets}
+        # Document ID -> document, shared by the roots
+        self._documents = {} if len({root for root, _ in targets}) > 1 else None
+        # One slot per file being processed in the background
+        self._backlog = AdaptiveLimiter(max_backlog)
+        # Processing times of the recent files, see _release_backlog()
+        self._processing_times = deque(maxlen=PROCESSING_WINDOW)
+
+    def _count(self, *outcomes):
+        with self._lock:
+            self.counts.update(outcomes)
+
+    def _done(self, job):
+        if self.checkpoint is not None:
+            self.checkpoint.done(job.item["id"])
+        if self.trace is not None:
+            self.trace.write(job)
+
+    def _past_deadline(self):
+        """Check whether the deadline has passed, and stop the sync if it has."""
+        if self.deadline is None or time.monotonic() < self.deadline:
+            return False
+        self.timed_out = True
+        return True
+
+    def save_checkpoint(self, status="running"):
+        """Write the sync records and save the checkpoint."""
+        self.checkpoint.save(status, flush=self.sync_manager.flush)
+
+    def run(self, monitor_interval=None):
+        """
+        Synchronize the root documents and all their descendants.
+
+        Args:
+            monitor_interval (float): Log stage statistics this often (in seconds)
+
+        Returns:
+            Counter with the number of "processed", "new", "updated", "failed"
+            and "skipped" documents
+        """
+        if self.conversion_pool is not None:
+            transform = Stage(
+                "transform", stream=self.transform_stream, queue_size=self.queue_size
+            )
+        else:
+            transform = Stage(
+                "transform",
+                self.transform,
+                workers=self.transform_workers,
+                queue_size=self.queue_size,
+            )
+
+        stages = [
+            Stage("crawl", stream=lambda _: self.crawl()),
+            Stage("diff", self.diff, queue_size=self.queue_size),
+            transform,
+            Stage(
+                "upload",
+                self.upload,
+                workers=self.upload_workers,
+                queue_size=self.queue_size,
+            ),
+        ]
+        if self.background:
+            # A worker per file in the backlog, they mostly sleep between polls
+            stages.append(
+                Stage(
+                    "process",
+                    self.process,
+                    workers=max(1, self.max_backlog),
+                    queue_size=self.queue_size,
+                )
+            )
+        stages.append(Stage("record", self.record, queue_size=self.queue_size))
+
+        self.pipeline = Pipeline(stages, monitor_interval=monitor_interval)
+
+        stop = threading.Event()
+        saver = None
+        if self.checkpoint is not None:
+
+            def save_periodically():
+                while not stop.wait(self.checkpoint_interval):
+                    self.save_checkpoint()
+
+            saver = threading.Thread(
+                target=save_periodically, name="sync-checkpoint", daemon=True
+            )
+            saver.start()
+
+        try:
+            self.pipeline.run()
+        finally:
+            stop.set()
+            if saver is not None:
+                saver.join()
+
+        return self.counts
+
+    def stats(self):
+        """Get the statistics of each stage of the last run."""
+        return self.pipeline.stats() if self.pipeline else []
+
+    def crawl(self):
+        """Crawl stage: yield the roots and all their descendants, once per knowledge base."""
+        roots = {}
+        for root_doc_id, knowledge_id in self.targets:
+            roots.setdefault(root_doc_id, []).append(knowledge_id)
+
+        for root_doc_id, knowledge_ids in roots.items():
+            if self.timed_out:
+                break
+            yield from self.crawl_root(root_doc_id, knowledge_ids)
+
+    def crawl_root(self, root_doc_id, knowledge_ids):
+        """Yield a root document and all its descendants."""
+        if self.resume:
+            crawler = self.colibo.get_children(
+                root_doc_id,
+                workers=self.crawl_workers,
+                checkpoint=self.checkpoint,
+                resume=True,
+            )
+        else:
+            doc = self._share(self.colibo.get_document(root_doc_id))
+            doc.depth = 0
+            if self.checkpoint is not None:
+                self.checkpoint.found(doc["id"], 0)
+            for knowledge_id in knowledge_ids:
+                yield Job(doc, knowledge_id, root=True, root_doc_id=root_doc_id)
+
+            # The crawl marks the root as visited itself, marking it here
+            # would stop the sequential crawl before listing its children
+            crawler = self.colibo.get_children(
+                doc["id"],
+                workers=self.crawl_workers,
+                checkpoint=self.checkpoint,
+            )
+
+        children = crawler
+        if self.progress is not None:
+            children = self.progress(children)
+
+        try:
+            for item in children:
+                if self._past_deadline():
+                    # The rest stays in the checkpoint for the next run
+                    break
+                item = self._share(item)
+                root = str(item["id"]) == str(root_doc_id)
+                for knowledge_id in knowledge_ids:
+                    yield Job(item, knowledge_id, root=root, root_doc_id=root_doc_id)
+        finally:
+            # Stop outstanding requests
+            crawler.close()
+
+    def _share(self, item):
+        """Use the same document for all roots reaching it."""
+        if self._documents is None:
+            return item
+        with self._lock:
+            return self._documents.setdefault(item["id"], item)
+
+    def diff(self, job):
+        """Diff stage: drop documents that have not been updated since the last sync."""
+        item = job.item
+
+        # A document reachable through links can show up more than once
+        seen_ids = self.seen_ids[job.knowledge_id]
+        if item["id"] in seen_ids:
+            # Not done yet, the first copy is still on its way
+            self._count("skipped", "processed")
+            return None
+        seen_ids[item["id"]] = job.root_doc_id
+
+        started = time.perf_counter()
+        job.existing = self.sync_manager.get_document(item["id"], job.knowledge_id)
+        job.spans["db_lookup"] = time.perf_counter() - started
+        if (
+            job.existing
+            and not self.force_update
+            and not job.root
+            and (item["updated"] is None or job.existing.last_synced >= item["updated"])
+        ):
+            job.outcome = "skipped"
+            self._count("skipped", "processed")
+            self._done(job)
+            return None
+
+        return job
+
+    def transform(self, job):
+        """Transform stage: build the content and drop documents that did not change."""
+        if self._past_deadline():
+            # Not done, the document stays pending for the next run
+            return None
+
+        job.content = build_content(job.item)
+        if job.content is None:
+            job.outcome = "skipped"
+            self._count("skipped")
+            self._done(job)
+            return None
+
+        job.content_hash = content_digest(job.content)
+        if job.existing:
+            # Colibo bumps the updated timestamp for edits that do not change
+            # the content, so only re-upload (and re-embed) on real changes.
+            if not self.force_update and job.existing.content_hash == job.content_hash:
+                job.outcome = "unchanged"
+        elif job.item["doctype"] == "file":
+            # Ignore files for now.
+            # TODO: Figure out what to do with files.
+            job.outcome = "ignored"
+            self._done(job)
+            return None
+
+        return job
+
+    def transform_stream(self, jobs):
+        """Transform stage with the bodies converted in the conversion pool."""
+        # Documents reaching the stage after the deadline are not converted
+        jobs = (job for job in jobs if not self._past_deadline())
+        for job in self.conversion_pool.convert(jobs, key=lambda job: job.item):
+            job = self.transform(job)
+            if job is not None:
+                yield job
+
+    def upload(self, job):
+        """Upload stage: upload new and changed documents to Open-WebUI."""
+        if job.outcome == "unchanged":
+            return job
+        if self._past_deadline():
+            # Not done, the document stays pending for the next run
+            return None
+
+        background = self.background and not job.existing
+        try:
+            if background:
+                # Released by the process stage once the file has been processed
+                job.backlog_ticket = self._acquire_backlog()
+
+            job.webui_doc_id = upload_document(
+                self.webui,
+                job.knowledge_id,
+                job.item,
+                job.content,
+                job.existing.webui_doc_id if job.existing else None,
+                background=background,
+                spans=job.spans,
+            )
+            job.outcome = "updated" if job.existing else "new"
+            job.processing = background
+            with self._lock:
+                self.uploaded_bytes += len(job.content.encode("utf-8"))
+        except WebUIError as e:
+            job.outcome = "failed"
+            job.error = e
+        finally:
+            if job.backlog_ticket is not None and not job.processing:
+                self._backlog.release(job.backlog_ticket)
+
+        return job
+
+    def _acquire_backlog(self):
+        """Wait for a backlog slot, unless the pipeline has been stopped."""
+        while True:
+            ticket = self._backlog.acquire(timeout=0.1)
+            if ticket is not None:
+                return ticket
+            if self.pipeline.stopped.is_set():
+                raise WebUIError("Sync stopped before the upload")
+
+    def _release_backlog(self, job, seconds, failed=False):
+        """
+        Free the backlog slot of a processed file, adapting the backlog.
+
+        Files taking twice the median time of the recent files or more are
+        queuing in Open-WebUI, so the backlog shrinks, as it does when
+        processing fails. The median follows the documents being synced, so a
+        large file now and then only shrinks the backlog for a moment.
+        """
+        if self.pipeline.stopped.is_set():
+            # Says nothing about Open-WebUI
+            self._backlog.release(job.backlog_ticket)
+            return
+
+        with self._lock:
+            times = self._processing_times
+            # Too few files yet to tell what is slow
+            slow = failed or (
+                len(times) >= 5 and seconds >= 2 * statistics.median(times)
+            )
+            if not failed:
+                times.append(seconds)
+        self._backlog.release(job.backlog_ticket, throttled=slow)
+
+    def process(self, job):
+        """Process stage: wait for a file to be processed and add it to the knowledge base."""
+        if not job.processing:
+            return job
+
+        started = time.perf_counter()
+        failed = False
+        try:
+            self._wait_processed(job.webui_doc_id)
+        except WebUIError as e:
+            failed = True
+            job.outcome = "failed"
+            job.error = e
+            try:
+                # The file is uploaded again on the next sync
+                self.webui.delete_file(job.webui_doc_id)
+            except WebUIError:
+                pass
+            return job
+        finally:
+            job.processing = False
+            job.spans["processing"] = time.perf_counter() - started
+            self._release_backlog(job, job.spans["processing"], failed=failed)
+
+        started = time.perf_counter()
+        try:
+            self.webui.add_file_to_knowledge(job.knowledge_id, job.webui_doc_id)
+        except WebUIError as e:
+            job.outcome = "failed"
+            job.error = e
+        job.spans["attach"] = time.perf_counter() - started
+
+        return job
+
+    def _wait_processed(self, file_id):
+        """
+        Poll the processing status of a file until it has been processed.
+
+        Small files are processed quickly, so the first checks are soon, and
+        the wait doubles after each check up to poll_interval.
+        """
+        deadline = time.monotonic() + self.processing_timeout
+        delay = self.poll_interval / 16
+        while True:
+            res = self.webui.get_processing_status(file_id)
+            status = res.get("status")
+            if status == "completed":
+                return
+            if status == "failed":
+                raise WebUIError(
+                    f"Processing file {file_id} failed: {res.get('error', 'unknown error')}"
+                )
+            if time.monotonic() >= deadline:
+                raise WebUIError(
+                    f"Processing file {file_id} did not finish within {self.processing_timeout} seconds"
+                )
+            if self.pipeline.stopped.wait(delay):
+                raise WebUIError(f"Sync stopped while file {file_id} was processed")
+            delay = min(self.poll_interval, delay * 2)
+
+    def record(self, job):
+        """Record stage: store the result of the sync in the database."""
+        item = job.item
+
+        if job.outcome == "failed":
+            self.echo(
+                f"Error syncing doc id {item['id']} to knowledge {job.knowledge_id}: {job.error}"
+            )
+            # Do not prune the branch of the document on the next run
+            if self.colibo.document_tree is not None:
+                self.colibo.document_tree.invalidate(item["id"])
+            self._count("failed")
+            self._done(job)
+            return None
+
+        started = time.perf_counter()
+        if job.outcome == "unchanged":
+            # Only bump the timestamp, so the document is skipped next time
+            self.sync_manager.record_sync(
+                colibo_doc_id=item["id"], knowledge_id=job.knowledge_id
+            )
+            job.spans["record"] = time.perf_counter() - started
+            self._count("skipped", "processed")
+            self._done(job)
+            return None
+
+        self.sync_manager.record_sync(
+            colibo_doc_id=item["id"],
+            webui_doc_id=job.webui_doc_id,
+            knowledge_id=job.knowledge_id,
+            content_hash=job.content_hash,
+        )
+        job.spans["record"] = time.perf_counter() - started
+        self._count(job.outcome, "processed")
+        self._done(job)
+        return None
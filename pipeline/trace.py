@@ -0,0 +1,131 @@
+import json
+import math
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+# The steps of a document in the order they happen
+SPANS = (
+    "fetch",
+    "clean_up",
+    "convert",
+    "db_lookup",
+    "upload",
+    "processing",
+    "attach",
+    "record",
+)
+
+
+class TraceWriter:
+    """
+    Write a JSON line for every document leaving the sync pipeline.
+
+    Each line holds the document ID, doctype, depth and body size, the
+    outcome, the seconds spent in each step (see SPANS) and the seconds from
+    the crawl handing the document on to finishing it, waiting in queues
+    included.
+    """
+
+    def __init__(self, path):
+        """
+        Open the trace file, replacing an existing one.
+
+        Args:
+            path (str): Path of the JSON lines file
+        """
+        self.file = open(path, "w", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Close the trace file."""
+        self.file.close()
+
+    def write(self, job):
+        """Write the trace of a job leaving the pipeline."""
+        item = job.item
+        raw_body = item.get("raw_body")
+        spans = {**getattr(item, "spans", {}), **job.spans}
+        record = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "id": item["id"],
+            "knowledge_id": job.knowledge_id,
+            "doctype": item.get("doctype"),
+            "depth": getattr(item, "depth", None),
+            "body_size": len(raw_body.encode("utf-8")) if raw_body else 0,
+            "outcome": job.outcome,
+            "total": time.monotonic() - job.created_at,
+            "spans": {name: spans[name] for name in SPANS if name in spans},
+        }
+        if job.error is not None:
+            record["error"] = str(job.error)
+
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self.file.write(line)
+
+
+def read_trace(path):
+    """Read the records of a trace file."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values, percent):
+    """Get a percentile of sorted values (nearest rank)."""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def summarize_trace(records, top=10):
+    """
+    Summarize a trace.
+
+    Args:
+        records (list): The records of a trace, see read_trace()
+        top (int): Number of slowest documents to return
+
+    Returns:
+        Dict with the "documents" count, the "outcomes" Counter, the "spans"
+        statistics (total, share, p50, p99 and max seconds per step) and the
+        "slowest" records, by the time spent in their steps
+    """
+    durations = {name: [] for name in SPANS}
+    for record in records:
+        for name, seconds in record["spans"].items():
+            durations.setdefault(name, []).append(seconds)
+
+    grand_total = sum(sum(values) for values in durations.values()) or 1
+    spans = {}
+    for name, values in durations.items():
+        if not values:
+            continue
+        values.sort()
+        spans[name] = {
+            "count": len(values),
+            "total": sum(values),
+            "share": sum(values) / grand_total,
+            "p50": percentile(values, 50),
+            "p99": percentile(values, 99),
+            "max": values[-1],
+        }
+
+    slowest = sorted(
+        records, key=lambda record: sum(record["spans"].values()), reverse=True
+    )[:top]
+
+    return {
+        "documents": len(records),
+        "outcomes": Counter(record["outcome"] for record in records),
+        "spans": spans,
+        "slowest": slowest,
+    }
@@ -0,0 +1,219 @@
+import os
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.abspath(__file__)) + os.sep
+STDLIB = os.path.abspath(sysconfig.get_paths()["stdlib"]) + os.sep
+
+# Top level path of a module in this project -> subsystem
+SUBSYSTEMS = {
+    "colibo": "colibo client",
+    "openwebui": "openwebui client",
+    "db": "db",
+    "helpers.py": "helpers",
+    "pipeline": "pipeline",
+    "main.py": "cli",
+}
+
+# Libraries grouped by what the time is spent on
+LIBRARIES = {
+    "socket": "http",
+    "ssl": "http",
+    "http": "http",
+    "selectors": "http",
+    "urllib3": "http",
+    "requests": "http",
+    "httpx": "http",
+    "httpcore": "http",
+    "anyio": "http",
+    "threading": "idle",
+    "queue": "idle",
+    "concurrent": "idle",
+    "markdownify": "markdownify",
+    "bs4": "markdownify",
+    "sqlalchemy": "sqlalchemy",
+    "sqlite3": "sqlalchemy",
+}
+
+
+class SamplingProfiler:
+    """
+    Find out where the threads of the process spend their time.
+
+    A background thread takes the stack of every other thread every interval
+    seconds. Each sample is attributed to a subsystem (the innermost module of
+    this project on the stack) and to a library (the innermost module), so
+    time waiting on HTTP, converting Markdown or querying the database shows
+    up, whichever thread it happens in. Threads waiting on locks, queues and
+    events are idle. Nothing is sampled unless the profiler is started.
+    """
+
+    def __init__(self, interval=0.01):
+        """
+        Initialize the profiler.
+
+        Args:
+            interval (float): Seconds between samples
+        """
+        self.interval = interval
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        # (subsystem, library) -> samples
+        self.subsystems = Counter()
+        # "module:function" of the innermost frame of this project -> active samples
+        self.functions = Counter()
+        # Stacks as "outer;...;inner" -> samples, see write_collapsed()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._locations = {}
+
+    def start(self):
+        """Start sampling."""
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling."""
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.monotonic() - self.started_at
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self._sample(frame)
+
+    def _locate(self, code):
+        """Get the (subsystem, library, name) of a code object, None for non project modules."""
+        location = self._locations.get(code)
+        if location is not None:
+            return location
+
+        path = code.co_filename
+        subsystem = None
+        if path.startswith("<"):
+            # Frozen standard library modules, e.g. "<frozen genericpath>"
+            relative = path.strip("<>").split()[-1]
+        elif "site-packages" in path:
+            relative = path.split("site-packages" + os.sep, 1)[1]
+        elif os.path.abspath(path).startswith(ROOT):
+            relative = os.path.abspath(path)[len(ROOT) :]
+            subsystem = SUBSYSTEMS.get(relative.split(os.sep, 1)[0], "other")
+        elif os.path.abspath(path).startswith(STDLIB):
+            relative = os.path.abspath(path)[len(STDLIB) :]
+        else:
+            relative = os.path.basename(path)
+        module = relative.removesuffix(".py").replace(os.sep, ".")
+        top = module.split(".", 1)[0]
+        library = LIBRARIES.get(top, top)
+
+        location = self._locations[code] = (
+            subsystem,
+            library,
+            f"{module}:{code.co_name}",
+        )
+        return location
+
+    def _sample(self, frame):
+        library = None
+        subsystem = None
+        function = None
+        names = []
+        while frame is not None:
+            frame_subsystem, frame_library, name = self._locate(frame.f_code)
+            names.append(name)
+            if library is None:
+                library = frame_library if frame_subsystem is None else "own code"
+            if subsystem is None and frame_subsystem is not None:
+                subsystem = frame_subsystem
+                function = name
+            frame = frame.f_back
+
+        self.samples += 1
+        self.subsystems[(subsystem or "other", library)] += 1
+        if function is not None and library != "idle":
+            self.functions[function] += 1
+        self.stacks[";".join(reversed(names))] += 1
+
+    def report(self, top=15):
+        """
+        Build a report of the time per subsystem, library and function.
+
+        Times are thread seconds (samples times the interval), so they add up
+        to more than the wall clock time when several threads run.
+
+        Returns:
+            The report as a list of lines
+        """
+        if not self.samples:
+            return ["Profile: no samples taken"]
+
+        def seconds(samples):
+            return samples * self.interval
+
+        active = {
+            key: samples for key, samples in self.subsystems.items() if key[1] != "idle"
+        }
+        active_total = sum(active.values()) or 1
+
+        lines = [
+            f"Profile: {self.samples} samples every {self.interval * 1000:g}ms "
+            f"over {self.duration:.1f}s",
+            "",
+            f"{'Subsystem':<18} {'Active':>9} {'Active %':>9} {'Idle':>9}",
+        ]
+        by_subsystem = Counter()
+        idle = Counter()
+        for (subsystem, library), samples in self.subsystems.items():
+            if library == "idle":
+                idle[subsystem] += samples
+            else:
+                by_subsystem[subsystem] += samples
+        for subsystem in sorted(
+            set(by_subsystem) | set(idle), key=lambda s: -by_subsystem[s]
+        ):
+            lines.append(
+                f"{subsystem:<18} {seconds(by_subsystem[subsystem]):>8.2f}s "
+                f"{by_subsystem[subsystem] / active_total:>9.1%} "
+                f"{seconds(idle[subsystem]):>8.2f}s"
+            )
+
+        lines += [
+            "",
+            f"{'Subsystem':<18} {'Library':<18} {'Active':>9} {'Active %':>9}",
+        ]
+        for (subsystem, library), samples in sorted(
+            active.items(), key=lambda item: -item[1]
+        )[:top]:
+            lines.append(
+                f"{subsystem:<18} {library:<18} {seconds(samples):>8.2f}s "
+                f"{samples / active_total:>9.1%}"
+            )
+
+        lines += ["", f"{'Function (innermost in this project)':<50} {'Samples':>8}"]
+        for function, samples in self.functions.most_common(top):
+            lines.append(f"{function:<50} {samples:>8}")
+
+        return lines
+
+    def write_collapsed(self, path):
+        """
+        Write the sampled stacks in the collapsed format.
+
+        Each line holds the frames of a stack, outermost first, separated by
+        semicolons, and the number of samples, as read by flamegraph.pl and
+        speedscope.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(f"{stack} {samples}\n")
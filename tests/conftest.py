@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.fake_colibo import DocumentTree, start_colibo
+from benchmarks.fake_webui import start_webui
+
+MAIN = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py"
+)
+
+
+class FakeServers:
+    """Fake Colibo and Open-WebUI servers, and a database, to run main.py against."""
+
+    def __init__(self, tree, colibo, webui, env):
+        self.tree = tree
+        self.colibo = colibo
+        self.webui = webui
+        self.env = env
+
+    def invoke(self, *args):
+        """Run a main.py command."""
+        return subprocess.run(
+            [sys.executable, MAIN, *map(str, args)],
+            env=self.env,
+            capture_output=True,
+            text=True,
+        )
+
+    def run(self, *args):
+        """Run a main.py command, failing the test if it fails."""
+        result = self.invoke(*args)
+        assert result.returncode == 0, result.stdout + result.stderr
+        return result.stdout
+
+    def synced(self, knowledge_id):
+        """Get the Colibo IDs of the documents in a knowledge base."""
+        with self.webui._lock:
+            file_ids = self.webui.knowledge.get(knowledge_id, set())
+            return {self.webui.files[file_id] for file_id in file_ids}
+
+
+@pytest.fixture
+def servers(tmp_path):
+    """Start fake servers with a small tree and a fresh database."""
+    tree = DocumentTree(size=150, depth=4, link_density=0, body_size=200, seed=1)
+    colibo_server, colibo_url = start_colibo(tree)
+    webui_server, webui_url = start_webui()
+    env = {
+        **os.environ,
+        "COLIBO_BASE_URL": colibo_url,
+        "COLIBO_CLIENT_ID": "test",
+        "COLIBO_CLIENT_SECRET": "test",
+        "COLIBO_SCOPE": "test",
+        "WEBUI_BASE_URL": webui_url,
+        "WEBUI_TOKEN": "test",
+        "DATABASE_URL": f"sqlite:///{tmp_path / 'sync.db'}",
+    }
+    yield FakeServers(tree, colibo_server.state, webui_server.state, env)
+    colibo_server.shutdown()
+    webui_server.shutdown()
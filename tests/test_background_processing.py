@@ -0,0 +1,20 @@
+from test_sync_config import descendants
+
+
+def test_background_processing_syncs_every_document(servers):
+    tree = servers.tree
+    servers.webui.processing_time = 0.05
+
+    output = servers.run(
+        "sync",
+        "--root-doc-id",
+        tree.root_id,
+        "--knowledge-id",
+        "kb",
+        "--background-processing",
+        "--max-backlog",
+        4,
+    )
+
+    assert "Failed to sync documents: 0" in output
+    assert servers.synced("kb") == descendants(tree, tree.root_id)
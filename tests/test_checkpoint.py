@@ -0,0 +1,31 @@
+import pytest
+from sqlalchemy import create_engine
+
+from db.checkpoint import CheckpointManager
+from db.models import Base, get_session
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return get_session(engine)
+
+
+def test_listed_ids_survive_a_failed_flush(session):
+    checkpoint = CheckpointManager(1000, "kb", session=session)
+    checkpoint.start()
+    checkpoint.queued(1000, 0)
+    checkpoint.listed(1000, {1001: 1})
+
+    def flush():
+        raise RuntimeError("database is locked")
+
+    with pytest.raises(RuntimeError):
+        checkpoint.save(flush=flush)
+    checkpoint.save()
+
+    resumed = CheckpointManager(1000, "kb", session=session)
+    assert resumed.resume()
+    assert resumed.listed_ids == {1000}
+    assert resumed.pending == {1001: 1}
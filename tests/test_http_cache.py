@@ -0,0 +1,47 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine
+
+from db import http_cache
+from db.http_cache import HttpCacheManager
+from db.models import Base, get_session
+
+URL = "https://colibo.example.com/api/documents/1000"
+HEADERS = {"ETag": '"v1"'}
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return get_session(engine)
+
+
+def no_parsing(body):
+    raise AssertionError("the cached body was parsed again")
+
+
+def test_not_modified_returns_the_stored_object(session, monkeypatch):
+    cache = HttpCacheManager(session=session)
+    data = {"id": 1000}
+    cache.store(URL, HEADERS, json.dumps(data), data)
+    cache.flush()
+
+    monkeypatch.setattr(http_cache.json, "loads", no_parsing)
+    assert cache.not_modified(URL) is data
+    assert cache.stats()["hits"] == 1
+
+
+def test_not_modified_parses_a_body_from_the_database_once(session, monkeypatch):
+    # Stored by an earlier run
+    writer = HttpCacheManager(session=session)
+    writer.store(URL, HEADERS, '{"id": 1000}')
+    writer.flush()
+    cache = HttpCacheManager(session=session)
+
+    first = cache.not_modified(URL)
+    monkeypatch.setattr(http_cache.json, "loads", no_parsing)
+
+    assert first == {"id": 1000}
+    assert cache.not_modified(URL) is first
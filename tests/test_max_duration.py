@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+from test_sync_config import descendants
+
+
+@pytest.mark.parametrize("convert_workers", [0, 2])
+def test_uploads_stop_at_the_deadline(servers, convert_workers):
+    tree = servers.tree
+    args = ("sync", "--root-doc-id", tree.root_id, "--knowledge-id", "kb")
+    # The crawl is done long before the uploads
+    servers.webui.latency = 0.05
+
+    output = servers.run(
+        *args,
+        "--max-duration",
+        1,
+        "--upload-workers",
+        1,
+        "--convert-workers",
+        convert_workers,
+    )
+
+    assert "Sync stopped after 1 seconds" in output
+    assert "Sync completed successfully" not in output
+    synced = servers.synced("kb")
+    assert 0 < len(synced) < len(tree.documents)
+
+    servers.webui.latency = 0.0
+    output = servers.run(*args, "--resume")
+
+    assert "Sync completed successfully" in output
+    assert servers.synced("kb") == descendants(tree, tree.root_id)
+
+
+def checkpoint_count(servers):
+    database = servers.env["DATABASE_URL"].removeprefix("sqlite:///")
+    with sqlite3.connect(database) as connection:
+        return connection.execute("SELECT COUNT(*) FROM sync_checkpoints").fetchone()[0]
+
+
+def test_plain_sync_does_not_save_progress(servers):
+    tree = servers.tree
+    # The crawl fails on a link to a missing document
+    link_id = max(tree.documents) + 1
+    tree._add(link_id, "Link", tree.root_id)
+    tree.documents[link_id]["target_id"] = link_id + 1
+
+    result = servers.invoke(
+        "sync", "--root-doc-id", tree.root_id, "--knowledge-id", "kb"
+    )
+
+    assert result.returncode != 0
+    assert checkpoint_count(servers) == 0
+
+
+def test_complete_sync_drops_stopped_sync(servers):
+    args = ("sync", "--root-doc-id", servers.tree.root_id, "--knowledge-id", "kb")
+    servers.webui.latency = 0.05
+    servers.run(*args, "--max-duration", 1, "--upload-workers", 1)
+    assert checkpoint_count(servers) == 1
+
+    servers.webui.latency = 0.0
+    servers.run(*args)
+
+    assert checkpoint_count(servers) == 0
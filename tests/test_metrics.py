@@ -0,0 +1,52 @@
+import pytest
+
+from metrics import Metrics
+
+
+def run_metrics():
+    metrics = Metrics()
+    metrics.inc("colibo_sync_documents", outcome="new")
+    metrics.inc(
+        "colibo_sync_http_requests",
+        client="colibo",
+        method="GET",
+        endpoint="/api/documents/{id}",
+        status="200",
+    )
+    metrics.observe(
+        "colibo_sync_http_request_duration_seconds",
+        0.02,
+        client="colibo",
+        method="GET",
+        endpoint="/api/documents/{id}",
+    )
+    metrics.set("colibo_sync_run_success", 1)
+    return metrics
+
+
+def test_prometheus_text_format():
+    text = run_metrics().prometheus()
+
+    # No OpenMetrics only syntax, which the textfile collector rejects
+    assert "# EOF" not in text
+    assert "# UNIT" not in text
+    assert "_created" not in text
+    assert "# TYPE colibo_sync_documents_total counter" in text
+    assert 'colibo_sync_documents_total{outcome="new"} 1' in text
+    assert "# TYPE colibo_sync_http_request_duration_seconds histogram" in text
+    assert "colibo_sync_run_success 1" in text
+
+
+def test_prometheus_client_parses_the_file(tmp_path):
+    parser = pytest.importorskip("prometheus_client.parser")
+    path = tmp_path / "colibo_sync.prom"
+    run_metrics().write_prometheus(path)
+
+    families = {
+        family.name: family
+        for family in parser.text_string_to_metric_families(path.read_text())
+    }
+
+    assert families["colibo_sync_documents"].type == "counter"
+    assert families["colibo_sync_http_request_duration_seconds"].type == "histogram"
+    assert families["colibo_sync_run_success"].samples[0].value == 1
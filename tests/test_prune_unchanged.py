@@ -0,0 +1,101 @@
+import pytest
+
+COMMANDS = pytest.mark.parametrize(
+    "command, workers",
+    [
+        ("sync", ("--crawl-workers", 1)),
+        ("sync", ("--crawl-workers", 4)),
+        ("sync:async", ()),
+    ],
+    ids=["sync", "sync-parallel", "sync-async"],
+)
+
+
+def edit(tree, doc_id, updated="2030-01-01T00:00:00Z"):
+    """Edit a page, bumping the updated timestamp of its parent folder only."""
+    parent_id = next(
+        parent_id
+        for parent_id, child_ids in tree.children.items()
+        if doc_id in child_ids
+    )
+    with tree._lock:
+        tree.documents[doc_id]["updated"] = updated
+        tree.documents[doc_id]["fields"]["body"] += "<p>Edited</p>"
+        tree.documents[parent_id]["updated"] = updated
+    return parent_id
+
+
+@COMMANDS
+def test_edit_below_unchanged_folder_is_synced(servers, command, workers):
+    tree = servers.tree
+    # A page three folders below the root: root > a > b > c > page
+    page_id = next(
+        doc_id
+        for doc_id in tree.page_ids()
+        if tree.depths[doc_id] == 4 and tree.documents[doc_id].get("target_id") is None
+    )
+    args = (
+        command,
+        "--root-doc-id",
+        tree.root_id,
+        "--knowledge-id",
+        "kb",
+        "--prune-unchanged",
+        *workers,
+    )
+    servers.run(*args)
+
+    # Only the folder of the page changes, its ancestors do not
+    folder_id = edit(tree, page_id)
+    assert tree.depths[folder_id] == 3
+    output = servers.run(*args)
+
+    # The folder is compared by content, which did not change
+    assert "Existing documents updated: 1" in output
+    assert servers.webui.updates == 1
+
+
+@COMMANDS
+def test_edit_of_page_linked_from_unchanged_folder_is_synced(servers, command, workers):
+    tree = servers.tree
+    folders = [
+        doc_id
+        for doc_id, document in tree.documents.items()
+        if document["type"]["name"] == "Folder"
+    ]
+    # Sync a folder of the root that has a folder of its own: root > a > b
+    root, folder_id = next(
+        (doc_id, child_id)
+        for doc_id in tree.children[tree.root_id]
+        for child_id in tree.children[doc_id]
+        if child_id in folders
+    )
+    # Link b to a page outside of a, whose edits never bump b
+    page_id = next(
+        doc_id
+        for doc_id in tree.page_ids()
+        if tree.documents[doc_id].get("target_id") is None
+        and doc_id not in tree.children[root]
+        and tree.depths[doc_id] == 1
+    )
+    link_id = max(tree.documents) + 1
+    tree._add(link_id, "Link", folder_id)
+    tree.documents[link_id]["target_id"] = page_id
+
+    args = (
+        command,
+        "--root-doc-id",
+        root,
+        "--knowledge-id",
+        "kb",
+        "--prune-unchanged",
+        *workers,
+    )
+    servers.run(*args)
+    assert page_id in servers.synced("kb")
+
+    edit(tree, page_id)
+    output = servers.run(*args)
+
+    assert "Existing documents updated: 1" in output
+    assert servers.webui.updates == 1
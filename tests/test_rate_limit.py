@@ -0,0 +1,45 @@
+import pytest
+import requests
+
+from colibo.client import Client
+from colibo.rate_limit import AdaptiveLimiter
+
+
+def test_acquire_times_out_while_the_limit_is_reached():
+    limiter = AdaptiveLimiter(1)
+    ticket = limiter.acquire()
+
+    assert limiter.acquire(timeout=0.05) is None
+
+    limiter.release(ticket)
+    assert limiter.acquire(timeout=0.05) is not None
+
+
+def test_throttled_release_halves_the_limit():
+    limiter = AdaptiveLimiter(8)
+
+    limiter.release(limiter.acquire(), throttled=True)
+
+    assert limiter.stats()["limit"] == 4
+
+
+def test_failed_release_keeps_the_limit():
+    limiter = AdaptiveLimiter(8)
+    limiter.release(limiter.acquire(), throttled=True)
+
+    limiter.release(limiter.acquire(), failed=True)
+
+    assert limiter.limit == 4
+
+
+def test_connection_errors_lower_the_limit(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'sync.db'}")
+    # Nothing listens on the port
+    client = Client(
+        "http://127.0.0.1:9", "id", "secret", "scope", pool_size=8, max_retries=0
+    )
+
+    with pytest.raises(requests.ConnectionError):
+        client._send("GET", "http://127.0.0.1:9/api/documents/1000")
+
+    assert client.limiter.stats()["limit"] == 4
@@ -0,0 +1,31 @@
+from benchmarks.fake_colibo import DocumentTree, start_colibo
+
+
+def test_linked_documents_are_uploaded_once(servers):
+    # Links to pages that are also crawled as children of their folder
+    tree = DocumentTree(size=150, depth=4, link_density=0.3, body_size=200, seed=1)
+    colibo_server, colibo_url = start_colibo(tree)
+    servers.env["COLIBO_BASE_URL"] = colibo_url
+    try:
+        servers.run("sync:async", "--root-doc-id", tree.root_id, "--knowledge-id", "kb")
+    finally:
+        colibo_server.shutdown()
+
+    with servers.webui._lock:
+        colibo_ids = list(servers.webui.files.values())
+    assert len(colibo_ids) == len(set(colibo_ids))
+    assert servers.webui.uploads == len(servers.synced("kb"))
+
+
+def test_root_is_compared_by_content(servers):
+    tree = servers.tree
+    page_id = tree.page_ids()[0]
+    args = ("sync:async", "--root-doc-id", page_id, "--knowledge-id", "kb")
+    servers.run(*args)
+
+    # Edited without a new timestamp
+    with tree._lock:
+        tree.documents[page_id]["fields"]["body"] += "<p>Edited</p>"
+    output = servers.run(*args)
+
+    assert "Existing documents updated: 1" in output
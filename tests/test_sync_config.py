@@ -0,0 +1,57 @@
+def descendants(tree, doc_id):
+    """Get the IDs a crawl of a document syncs, links replaced by their targets."""
+    found = {doc_id}
+    for child_id in tree.children[doc_id]:
+        target_id = tree.documents[child_id].get("target_id")
+        found |= descendants(tree, target_id or child_id)
+    return found
+
+
+def test_config_with_int_roots_crawls_sequentially(servers, tmp_path):
+    tree = servers.tree
+    first, second = [
+        doc_id
+        for doc_id in tree.children[tree.root_id]
+        if tree.documents[doc_id]["type"]["name"] == "Folder"
+    ][:2]
+    config = tmp_path / "sync.toml"
+    config.write_text(
+        f'[[targets]]\nroot_doc_id = {first}\nknowledge_id = "first"\n\n'
+        f'[[targets]]\nroot_doc_id = {second}\nknowledge_id = "second"\n'
+    )
+
+    servers.run("sync:config", "--config", config, "--crawl-workers", 1, "--quiet")
+
+    assert servers.synced("first") == descendants(tree, first)
+    assert servers.synced("second") == descendants(tree, second)
+
+
+def test_config_root_ids_are_normalized(servers, tmp_path):
+    tree = servers.tree
+    root = next(
+        doc_id
+        for doc_id in tree.children[tree.root_id]
+        if tree.documents[doc_id]["type"]["name"] == "Folder"
+    )
+    config = tmp_path / "sync.toml"
+    config.write_text(
+        f'[[targets]]\nroot_doc_id = {root}\nknowledge_id = "first"\n\n'
+        f'[[targets]]\nroot_doc_id = "{root}"\nknowledge_id = "second"\n'
+    )
+
+    output = servers.run("sync:config", "--config", config)
+
+    # The root is crawled once for both knowledge bases
+    assert output.count(f"Root document: {root} (Colibo)") == 1
+    assert servers.synced("first") == descendants(tree, root)
+    assert servers.synced("second") == descendants(tree, root)
+
+
+def test_config_rejects_invalid_root_ids(servers, tmp_path):
+    config = tmp_path / "sync.toml"
+    config.write_text('[[targets]]\nroot_doc_id = "abc"\nknowledge_id = "first"\n')
+
+    result = servers.invoke("sync:config", "--config", config)
+
+    assert result.returncode != 0
+    assert "invalid root_doc_id 'abc'" in result.stderr
@@ -0,0 +1,49 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from conftest import MAIN
+
+# Run main.py with a sweep that fails after the pipeline is done
+FAILING_SWEEP = """
+import sys
+
+sys.path.insert(0, sys.argv.pop(1))
+import main
+
+
+def sweep_documents(*args, **kwargs):
+    raise RuntimeError("sweep failed")
+
+
+main.sweep_documents = sweep_documents
+main.cli()
+"""
+
+
+def run_statuses(servers):
+    database = servers.env["DATABASE_URL"].removeprefix("sqlite:///")
+    with sqlite3.connect(database) as connection:
+        return [
+            status
+            for (status,) in connection.execute(
+                "SELECT status FROM sync_runs ORDER BY id"
+            )
+        ]
+
+
+def test_run_is_finished_when_the_sweep_fails(servers):
+    args = ["sync", "--root-doc-id", servers.tree.root_id, "--knowledge-id", "kb"]
+    servers.run(*args)
+
+    result = subprocess.run(
+        [sys.executable, "-c", FAILING_SWEEP, os.path.dirname(MAIN), *map(str, args)],
+        env=servers.env,
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode != 0
+    assert "sweep failed" in result.stderr
+    assert run_statuses(servers) == ["completed", "failed"]
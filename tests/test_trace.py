@@ -0,0 +1,30 @@
+import pytest
+
+from pipeline.trace import percentile
+
+
+@pytest.mark.parametrize(
+    "values, percent, expected",
+    [
+        # The rank falls exactly on a value
+        ([1, 2, 3, 4], 50, 2),
+        ([1, 2, 3, 4], 25, 1),
+        ([1, 2, 3, 4], 75, 3),
+        ([1, 2, 3, 4, 5, 6], 50, 3),
+        ([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 90, 9),
+        # The rank is rounded up
+        ([1, 2, 3, 4, 5], 50, 3),
+        ([1, 2, 3, 4], 51, 3),
+        ([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 91, 10),
+        # The bounds
+        ([1, 2, 3, 4], 0, 1),
+        ([1, 2, 3, 4], 100, 4),
+        ([7], 99, 7),
+    ],
+)
+def test_percentile_is_nearest_rank(values, percent, expected):
+    assert percentile(values, percent) == expected
+
+
+def test_percentile_of_no_values():
+    assert percentile([], 50) == 0.0